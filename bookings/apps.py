@@ -8,8 +8,10 @@ class BookingsConfig(AppConfig):
     def ready(self):
         """Initializes application-specific logic when the app is ready.
 
-        Starts the background updater for handling expired bookings.
+        Starts the background updater for handling expired bookings in the
+        processes that should run it. See updater.should_autostart.
         """
 
         from . import updater
-        updater.start()
\ No newline at end of file
+        if updater.should_autostart():
+            updater.start()
@@ -0,0 +1,159 @@
+"""E-ticket PDFs, rendered once and served from disk.
+
+The PDF of a booking is stored in ETICKET_DIR under the booking id and a hash
+of the HTML it is rendered from, so it is rendered again only when the
+booking, its tickets or its flight change what the ticket shows. A new
+rendering replaces the older files of the booking.
+
+Tickets are rendered ahead of time by bookings.pdf_render when a payment
+confirms a booking; a download waits for a rendering that is still running
+instead of starting another one.
+"""
+import glob
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import get_template
+
+from . import pdf_render
+from .models import Booking
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE = 'bookings/ticket_pdf.html'
+RENDER_TIMEOUT = 60
+OPEN_ATTEMPTS = 3
+
+
+def ticket_html(booking):
+    """Returns the HTML of the e-ticket of a booking.
+
+    Args:
+        booking (Booking): The booking.
+
+    Returns:
+        str: The rendered ticket template.
+    """
+    return get_template(TEMPLATE).render({'booking': booking})
+
+
+def ticket_path(booking, html):
+    """Returns where the PDF of a booking rendered from some HTML is stored.
+
+    Args:
+        booking (Booking): The booking.
+        html (str): The HTML of the ticket.
+
+    Returns:
+        str: The path of the PDF.
+    """
+    digest = hashlib.sha256(html.encode()).hexdigest()[:32]
+    return os.path.join(settings.ETICKET_DIR, f"{booking.booking_id}-{digest}.pdf")
+
+
+def _render(booking):
+    """Starts rendering the PDF of a booking unless it is on disk already.
+
+    Returns:
+        tuple: The path of the PDF and the Future of its rendering, or None
+            if the file exists.
+    """
+    html = ticket_html(booking)
+    path = ticket_path(booking, html)
+    if os.path.exists(path):
+        return path, None
+    older = glob.glob(os.path.join(glob.escape(settings.ETICKET_DIR), f"{booking.booking_id}-*.pdf"))
+    return path, pdf_render.submit(html, path, older)
+
+
+def ticket_pdf(booking):
+    """Returns the path of the current e-ticket PDF of a booking, rendering it if needed.
+
+    Args:
+        booking (Booking): The booking.
+
+    Returns:
+        str: The path of the PDF.
+
+    Raises:
+        PdfRenderError: If the ticket cannot be rendered.
+        BrokenExecutor: If the worker rendering the ticket died.
+        TimeoutError: If the rendering takes longer than RENDER_TIMEOUT.
+    """
+    path, future = _render(booking)
+    if future is not None:
+        future.result(timeout=RENDER_TIMEOUT)
+    return path
+
+
+def open_ticket_pdf(booking):
+    """Opens the current e-ticket PDF of a booking, rendering it if needed.
+
+    A rendering for a booking that changed meanwhile deletes the older PDF,
+    possibly between ticket_pdf returning its path and the file being
+    opened. The booking is then read again and its current PDF opened.
+
+    Args:
+        booking (Booking): The booking.
+
+    Returns:
+        file: The PDF, open for reading in binary mode.
+
+    Raises:
+        PdfRenderError: If the ticket cannot be rendered.
+        BrokenExecutor: If the worker rendering the ticket died.
+        TimeoutError: If the rendering takes longer than RENDER_TIMEOUT.
+        FileNotFoundError: If the PDF is deleted OPEN_ATTEMPTS times in a row.
+    """
+    for attempt in range(OPEN_ATTEMPTS):
+        if attempt:
+            booking = Booking.objects.select_related(
+                'flight__departure_airport', 'flight__arrival_airport', 'flight__aircraft'
+            ).get(pk=booking.pk)
+        try:
+            return open(ticket_pdf(booking), 'rb')
+        except FileNotFoundError:
+            if attempt == OPEN_ATTEMPTS - 1:
+                raise
+
+
+def prerender(booking_id):
+    """Starts rendering the e-ticket of a booking without waiting for it.
+
+    Failures are logged; the ticket is rendered again when it is downloaded.
+
+    Args:
+        booking_id (int): The booking.
+    """
+    booking = Booking.objects.select_related(
+        'flight__departure_airport', 'flight__arrival_airport', 'flight__aircraft'
+    ).filter(pk=booking_id).first()
+    if booking is None:
+        return
+    try:
+        _, future = _render(booking)
+    except Exception:
+        logger.exception("Could not start rendering the e-ticket of booking %s", booking_id)
+        return
+    if future is not None:
+        future.add_done_callback(lambda done: _log_failure(booking_id, done))
+
+
+def _log_failure(booking_id, future):
+    """Logs a rendering started by prerender that failed."""
+    if future.exception() is not None:
+        logger.error("Could not render the e-ticket of booking %s: %s", booking_id, future.exception())
+
+
+def booking_confirmed(booking):
+    """Renders the e-ticket of a confirmed booking once the transaction commits.
+
+    Args:
+        booking (Booking): The booking that was just confirmed.
+    """
+    booking_id = booking.booking_id
+    transaction.on_commit(lambda: prerender(booking_id))
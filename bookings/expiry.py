@@ -0,0 +1,168 @@
+"""Deadline-driven expiry of pending bookings.
+
+Every pending booking carries a hold_expires_at deadline. HoldDeadlines keeps
+the upcoming deadlines in a heap and schedules a single job that wakes at the
+earliest one, expires whatever is due in bounded batches and sleeps again.
+
+The heap only decides when to wake. What is due is always read from the
+(status, hold_expires_at) index, so deadlines set or cleared by another process
+are picked up at the latest after RESYNC_INTERVAL.
+"""
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import ledger
+from .models import Booking
+
+
+logger = logging.getLogger(__name__)
+
+JOB_ID = 'expire-holds'
+BATCH_SIZE = 500
+RESYNC_INTERVAL = timedelta(minutes=1)
+RESYNC_LIMIT = 1000
+
+
+def expire_due_holds(now=None, batch_size=BATCH_SIZE):
+    """Cancels one batch of pending bookings whose hold has run out.
+
+    The batch is cancelled in one transaction and its seats are released
+    through bookings.ledger before the status changes.
+
+    Args:
+        now (datetime, optional): The time to expire holds at. Defaults to now.
+        batch_size (int, optional): The most bookings to cancel in this batch.
+
+    Returns:
+        int: The number of bookings cancelled.
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        due_ids = list(Booking.objects.select_for_update().filter(
+            status='Pending',
+            hold_expires_at__lte=now
+        ).order_by('hold_expires_at').values_list('booking_id', flat=True)[:batch_size])
+
+        if due_ids:
+            ledger.bookings_cancelled(due_ids)
+            Booking.objects.filter(booking_id__in=due_ids).update(status='Cancelled', hold_expires_at=None)
+
+    return len(due_ids)
+
+
+class HoldDeadlines:
+    """A heap of upcoming hold deadlines that drives the expiry job of a scheduler."""
+
+    def __init__(self):
+        """Initializes an empty heap that is not attached to a scheduler."""
+        self._heap = []
+        self._lock = threading.Lock()
+        self._scheduler = None
+        self._wake_at = None
+
+    def attach(self, scheduler, expire):
+        """Starts driving the expiry job of a scheduler.
+
+        Args:
+            scheduler: The APScheduler scheduler to add the job to.
+            expire (callable): The function that expires the due holds.
+        """
+        self._scheduler = scheduler
+        self._expire = expire
+        self._schedule(timezone.now())
+
+    def push(self, deadline):
+        """Adds a deadline, waking the job earlier if it is the next one due.
+
+        Deadlines pushed before a scheduler is attached are dropped; attaching
+        loads them from the database anyway.
+
+        Args:
+            deadline (datetime): The hold deadline of a pending booking.
+        """
+        if self._scheduler is None:
+            return
+        with self._lock:
+            heapq.heappush(self._heap, deadline)
+            wake_earlier = self._wake_at is not None and deadline < self._wake_at
+        if wake_earlier:
+            self._schedule(deadline)
+
+    def next_deadline(self):
+        """Returns the earliest known deadline, or None if there is none."""
+        with self._lock:
+            return self._heap[0] if self._heap else None
+
+    def resync(self):
+        """Reloads the upcoming deadlines of pending bookings from the database."""
+        deadlines = list(Booking.objects.filter(
+            status='Pending',
+            hold_expires_at__isnull=False
+        ).order_by('hold_expires_at').values_list('hold_expires_at', flat=True)[:RESYNC_LIMIT])
+
+        with self._lock:
+            self._heap = deadlines
+
+    def next_wake(self, now):
+        """Returns when the job should next run.
+
+        Args:
+            now (datetime): The current time.
+
+        Returns:
+            datetime: The next deadline, but no later than RESYNC_INTERVAL from now.
+        """
+        wake_at = now + RESYNC_INTERVAL
+        deadline = self.next_deadline()
+        if deadline is not None:
+            wake_at = max(min(deadline, wake_at), now)
+        return wake_at
+
+    def run(self):
+        """Expires the due holds, then schedules the next wake-up.
+
+        A full batch means more holds may be due, so the job runs again at once.
+        """
+        now = timezone.now()
+        wake_at = now + RESYNC_INTERVAL
+        try:
+            if self._expire() >= BATCH_SIZE:
+                wake_at = now
+            else:
+                self.resync()
+                wake_at = self.next_wake(now)
+        except Exception:
+            logger.exception("Expiring pending bookings failed.")
+        finally:
+            self._schedule(wake_at)
+
+    def _schedule(self, wake_at):
+        """Moves the expiry job of the attached scheduler to a new time."""
+        if self._scheduler is None:
+            return
+        with self._lock:
+            self._wake_at = wake_at
+        self._scheduler.add_job(
+            self.run, 'date', run_date=wake_at, id=JOB_ID,
+            replace_existing=True, misfire_grace_time=None, coalesce=True,
+        )
+
+
+deadlines = HoldDeadlines()
+
+
+def hold_created(booking):
+    """Registers the deadline of a new hold once its transaction commits.
+
+    Args:
+        booking (Booking): The new pending booking.
+    """
+    deadline = booking.hold_expires_at
+    if deadline is not None:
+        transaction.on_commit(lambda: deadlines.push(deadline))
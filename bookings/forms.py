@@ -3,6 +3,17 @@ from .models import Ticket
 from datetime import date
 import re
 
+
+NATIONAL_ID_PATTERN = re.compile(r'^\d{10}$')
+PASSPORT_PATTERN = re.compile(r'^[A-Za-z]{1}[A-Za-z0-9]{8}$')
+PASSENGER_NAME_PATTERN = re.compile(r"^[a-zA-Z\s\-']+$")
+
+NATIONAL_ID_ERROR = "National ID must be exactly 10 numbers."
+PASSPORT_ERROR = "Passport must be exactly 9 alphanumeric characters and starts with a letter!"
+DOB_ERROR = "Date of birth cannot be in the future."
+PASSENGER_NAME_ERROR = "Name must contain only letters (no numbers or symbols)."
+
+
 class TicketForm(forms.ModelForm):
     """Form for creating and validating ticket details."""
 
@@ -42,8 +53,8 @@ class TicketForm(forms.ModelForm):
         """
         nid = self.cleaned_data.get('nationality')
 
-        if not re.match(r'^\d{10}$', nid):
-            raise forms.ValidationError("National ID must be exactly 10 numbers.")
+        if not NATIONAL_ID_PATTERN.match(nid):
+            raise forms.ValidationError(NATIONAL_ID_ERROR)
         return nid
 
     def clean_passport(self):
@@ -57,8 +68,8 @@ class TicketForm(forms.ModelForm):
         """
         passport = self.cleaned_data.get('passport')
 
-        if not re.match(r'^[A-Za-z]{1}[A-Za-z0-9]{8}$', passport):
-            raise forms.ValidationError("Passport must be exactly 9 alphanumeric characters and starts with a letter!")
+        if not PASSPORT_PATTERN.match(passport):
+            raise forms.ValidationError(PASSPORT_ERROR)
         return passport
 
     def clean_passenger_dob(self):
@@ -73,7 +84,7 @@ class TicketForm(forms.ModelForm):
         dob = self.cleaned_data.get('passenger_dob')
         if dob:
             if dob > date.today():
-                raise forms.ValidationError("Date of birth cannot be in the future.")
+                raise forms.ValidationError(DOB_ERROR)
 
         return dob
 
@@ -87,6 +98,6 @@ class TicketForm(forms.ModelForm):
             ValidationError: If the name contains invalid characters.
         """
         name = self.cleaned_data.get('passenger_name')
-        if not re.match(r"^[a-zA-Z\s\-']+$", name):
-            raise forms.ValidationError("Name must contain only letters (no numbers or symbols).")
+        if not PASSENGER_NAME_PATTERN.match(name):
+            raise forms.ValidationError(PASSENGER_NAME_ERROR)
         return name
\ No newline at end of file
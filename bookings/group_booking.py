@@ -0,0 +1,225 @@
+"""Group bookings: one pending booking for a whole passenger list.
+
+Tour operators send the passengers of a group as a JSON list or a CSV file
+with a header row, one passenger per row. Every row is checked against the
+rules of TicketForm, using its precompiled patterns, before anything is
+written. If any row fails, the errors of every row are reported and nothing is
+booked.
+
+A valid list is held with hold_seats: the seats and the inventory are claimed
+once for the whole group and the tickets are written with one bulk_create, in
+one transaction. Rows may name their seat; the rows that do not are seated
+together with bookings.seat_assign.find_seats.
+"""
+import csv
+import io
+import json
+from datetime import date
+
+from django.core.exceptions import ValidationError
+
+from flights.seat_grid import seat_grid
+from . import ledger
+from .forms import (
+    DOB_ERROR, NATIONAL_ID_ERROR, NATIONAL_ID_PATTERN, PASSENGER_NAME_ERROR, PASSENGER_NAME_PATTERN, PASSPORT_ERROR,
+    PASSPORT_PATTERN,
+)
+from .holds import hold_seats
+from .models import Ticket
+from .seat_assign import ASSIGN_ATTEMPTS, find_seats
+from .seat_map import seat_map
+
+
+MAX_GROUP_SIZE = 500
+FIELDS = ('passenger_name', 'passport', 'nationality', 'passenger_dob', 'seat_number')
+REQUIRED_FIELDS = FIELDS[:4]
+NAME_MAX_LENGTH = Ticket._meta.get_field('passenger_name').max_length
+
+
+class InvalidPassengers(Exception):
+    """Raised when rows of a passenger list do not pass validation.
+
+    Attributes:
+        errors: One {'row': number, 'errors': {field: message}} entry per
+            failing row, rows numbered from 1.
+    """
+
+    def __init__(self, errors):
+        """Initializes the exception with the errors of the failing rows.
+
+        Args:
+            errors (list): The errors of each failing row.
+        """
+        self.errors = errors
+        super().__init__(f"{len(errors)} passenger row(s) are invalid")
+
+
+def parse_passengers(body, content_type):
+    """Reads the rows of a passenger list.
+
+    Args:
+        body (bytes): The request body.
+        content_type (str): 'application/json' for a JSON list of objects, or
+            {'passengers': [...]}; 'text/csv' for CSV with a header row.
+
+    Returns:
+        list: One dict of field values per passenger.
+
+    Raises:
+        ValidationError: If the body cannot be read, is empty or has more
+            than MAX_GROUP_SIZE passengers.
+    """
+    try:
+        text = body.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValidationError("The passenger list must be UTF-8 text.")
+
+    if content_type == 'text/csv':
+        rows = list(csv.DictReader(io.StringIO(text)))
+    elif content_type == 'application/json':
+        try:
+            rows = json.loads(text)
+        except ValueError:
+            raise ValidationError("The passenger list is not valid JSON.")
+        if isinstance(rows, dict):
+            rows = rows.get('passengers')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValidationError("The passenger list must be a list of objects.")
+    else:
+        raise ValidationError("Send the passenger list as application/json or text/csv.")
+
+    if not rows:
+        raise ValidationError("The passenger list is empty.")
+    if len(rows) > MAX_GROUP_SIZE:
+        raise ValidationError(f"A group booking takes at most {MAX_GROUP_SIZE} passengers.")
+    return rows
+
+
+def validate_passengers(rows):
+    """Checks every row of a passenger list and builds its tickets.
+
+    Applies the rules of TicketForm to all rows in one pass, and rejects seats
+    listed more than once.
+
+    Args:
+        rows (list): The rows returned by parse_passengers.
+
+    Returns:
+        list: One unsaved Ticket per row. Rows without a seat get an empty
+            seat number.
+
+    Raises:
+        InvalidPassengers: If any row is invalid.
+    """
+    today = date.today()
+    tickets, errors, seen_seats = [], [], set()
+
+    for number, row in enumerate(rows, start=1):
+        values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+        row_errors = {field: "This field is required." for field in REQUIRED_FIELDS if not values[field]}
+
+        name = values['passenger_name']
+        if name and len(name) > NAME_MAX_LENGTH:
+            row_errors['passenger_name'] = f"Name must be at most {NAME_MAX_LENGTH} characters."
+        elif name and not PASSENGER_NAME_PATTERN.match(name):
+            row_errors['passenger_name'] = PASSENGER_NAME_ERROR
+        if values['passport'] and not PASSPORT_PATTERN.match(values['passport']):
+            row_errors['passport'] = PASSPORT_ERROR
+        if values['nationality'] and not NATIONAL_ID_PATTERN.match(values['nationality']):
+            row_errors['nationality'] = NATIONAL_ID_ERROR
+
+        dob = None
+        if values['passenger_dob']:
+            try:
+                dob = date.fromisoformat(values['passenger_dob'])
+            except ValueError:
+                row_errors['passenger_dob'] = "Enter a valid date (YYYY-MM-DD)."
+            else:
+                if dob > today:
+                    row_errors['passenger_dob'] = DOB_ERROR
+
+        seat = values['seat_number'].upper()
+        if seat:
+            if seat in seen_seats:
+                row_errors['seat_number'] = f"Seat {seat} is listed more than once."
+            seen_seats.add(seat)
+
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        elif not errors:
+            tickets.append(Ticket(seat_number=seat, passenger_name=name, passport=values['passport'],
+                                  nationality=values['nationality'], passenger_dob=dob))
+
+    if errors:
+        raise InvalidPassengers(errors)
+    return tickets
+
+
+def seat_errors(tickets, seats, message):
+    """Returns the row errors of the tickets whose seats could not be booked.
+
+    Args:
+        tickets (list): The tickets of the group, in row order.
+        seats (list): The seat numbers that could not be booked.
+        message (str): The error, formatted with the seat number.
+
+    Returns:
+        list: One {'row': number, 'errors': {'seat_number': message}} entry per ticket.
+    """
+    seats = set(seats)
+    return [
+        {'row': number, 'errors': {'seat_number': message.format(seat=ticket.seat_number)}}
+        for number, ticket in enumerate(tickets, start=1)
+        if ticket.seat_number in seats
+    ]
+
+
+def book_group(flight, seat_class, passenger, tickets, holder=''):
+    """Holds seats for a group and creates its pending booking and tickets.
+
+    Tickets without a seat number are seated together in the free seats of the
+    cabin. If another booking wins one of those seats in the meantime they are
+    seated again, at most ASSIGN_ATTEMPTS times; seats named in the list are
+    never changed.
+
+    Args:
+        flight (Flight): The flight to book.
+        seat_class (str): The seat class of the booking (e.g., 'Economy').
+        passenger (PassengerProfile): The passenger profile making the booking.
+        tickets (list): The unsaved tickets returned by validate_passengers.
+        holder (str, optional): The session key making the booking.
+
+    Returns:
+        Booking: The new pending booking.
+
+    Raises:
+        ValidationError: If the seat class is invalid.
+        InvalidSeats: If a named seat is not in the cabin of the booking.
+        SeatTaken: If a seat is already held by another booking.
+        SeatsUnavailable: If the cabin has too few free seats left.
+    """
+    grid = seat_grid(flight.aircraft)
+    named = [ticket.seat_number for ticket in tickets if ticket.seat_number]
+    outside = sorted(seat for seat in named if getattr(grid.seat(seat), 'seat_class', None) != seat_class)
+    if outside:
+        raise ledger.InvalidSeats(outside)
+
+    unseated = [ticket for ticket in tickets if not ticket.seat_number]
+    own = ledger.reserved_seats(flight, holder) if unseated and holder else []
+    for attempt in range(ASSIGN_ATTEMPTS):
+        if unseated:
+            seats = seat_map(flight, seat_class, fresh=attempt > 0)
+            seats.mark(own, taken=False)
+            seats.mark(named)
+            chosen = find_seats(seats, len(unseated))
+            if chosen is None:
+                raise ledger.SeatsUnavailable(f"Not enough {seat_class} seats left on flight {flight.flight_number}.")
+            for ticket, seat in zip(unseated, chosen):
+                ticket.seat_number = seat
+        try:
+            return hold_seats(flight, seat_class, passenger, tickets, holder)
+        except ledger.SeatTaken as e:
+            if not unseated or set(e.seats) & set(named):
+                raise
+            taken = e
+    raise taken
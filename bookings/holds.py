@@ -0,0 +1,50 @@
+"""Seat holds for new bookings.
+
+A hold is a pending booking together with its tickets. It is created in one
+transaction that claims the seats through bookings.ledger before any ticket is
+written, so a seat can only ever be held by one active booking.
+"""
+from django.db import transaction
+
+from . import expiry, ledger
+from .models import Booking, Ticket
+
+
+def hold_seats(flight, seat_class, passenger, tickets, holder=''):
+    """Creates a pending booking holding the seats of unsaved tickets.
+
+    Either the booking, its seat claims and all of its tickets are written,
+    or nothing is. The hold expires BOOKING_HOLD_MINUTES after it is made.
+
+    Args:
+        flight (Flight): The flight to book.
+        seat_class: The seat class of the booking (e.g., 'Economy').
+        passenger (PassengerProfile): The passenger making the booking.
+        tickets (list): Unsaved Ticket objects with their seat numbers set.
+        holder (str, optional): The session key making the booking; seats it
+            reserved are taken over by the booking.
+
+    Returns:
+        Booking: The new pending booking.
+
+    Raises:
+        InvalidSeats: If any of the seats is not on the aircraft.
+        SeatTaken: If any of the seats is already held by another booking.
+        SeatsUnavailable: If the seat class has too few free seats left.
+    """
+    with transaction.atomic():
+        booking = Booking.objects.create(
+            flight=flight,
+            status='Pending',
+            number_of_passengers=len(tickets),
+            seat_class=seat_class,
+            passenger=passenger
+        )
+        ledger.tickets_added(booking, [ticket.seat_number for ticket in tickets], holder)
+
+        for ticket in tickets:
+            ticket.booking = booking
+        Ticket.objects.bulk_create(tickets)
+        expiry.hold_created(booking)
+
+    return booking
@@ -0,0 +1,162 @@
+"""Idempotent form and API submissions.
+
+Forms that create bookings or payments carry a key issued with the page
+(new_key), and API clients may send their own in the Idempotency-Key header.
+The first request with a key inserts an IdempotencyKey row; the unique
+constraint on the row makes that insert the atomic check, so of several
+concurrent retries exactly one runs the view. Its response is stored on the
+row and every retry gets the stored response back without running the view.
+
+A retry that arrives while the first request is still running waits up to
+WAIT_SECONDS for its response, then gets 409. A request that fails with an
+exception or a server error leaves no row behind, so it can be retried, and
+a row left running by a process that died is taken over after STALE_AFTER.
+Requests without a key run as before. Keys are deleted after KEY_TTL.
+"""
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 64
+KEY_TTL = timedelta(hours=24)
+WAIT_SECONDS = 5
+WAIT_STEP = 0.1
+STALE_AFTER = timedelta(minutes=2)
+
+
+def new_key():
+    """Returns a fresh key to embed in a form.
+
+    Returns:
+        str: A random key.
+    """
+    return uuid.uuid4().hex
+
+
+def request_key(request):
+    """Returns the idempotency key of a request, or None if it has none.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        str: The key from the Idempotency-Key header or the form.
+    """
+    key = (request.META.get(HEADER) or request.POST.get(FIELD) or '').strip()
+    return key[:MAX_KEY_LENGTH] or None
+
+
+def _replay(record):
+    """Rebuilds the stored response of a key."""
+    response = HttpResponse(bytes(record.content), status=record.status_code, content_type=record.content_type)
+    if record.location:
+        response['Location'] = record.location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _finished(record):
+    """Waits for the request that owns a key to store its response.
+
+    Returns:
+        IdempotencyKey: The finished record, or None if it is still running
+            after WAIT_SECONDS or its request failed.
+    """
+    deadline = time.monotonic() + WAIT_SECONDS
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    if record is None or record.status_code is None:
+        return None
+    return record
+
+
+def _claim(user, scope, key):
+    """Takes ownership of a key.
+
+    Returns:
+        tuple: The record of the key and whether this request owns it.
+    """
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, scope=scope, key=key), True
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+    if record is not None and record.status_code is None:
+        now = timezone.now()
+        abandoned = IdempotencyKey.objects.filter(
+            pk=record.pk, status_code=None, created_at__lt=now - STALE_AFTER
+        ).update(created_at=now)
+        if abandoned:
+            return record, True
+    return record, False
+
+
+def idempotent(scope):
+    """Makes a POST view run at most once per idempotency key and user.
+
+    Must be applied below login_required.
+
+    Args:
+        scope (str): The name the keys of the view are stored under.
+
+    Returns:
+        function: The view decorator.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _view(request, *args, **kwargs):
+            key = request_key(request) if request.method == 'POST' else None
+            if key is None:
+                return view_func(request, *args, **kwargs)
+
+            record, owner = _claim(request.user, scope, key)
+            if not owner:
+                record = _finished(record)
+                if record is None:
+                    return HttpResponse("This request is still being processed. Please try again shortly.",
+                                        status=409, content_type='text/plain')
+                return _replay(record)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except BaseException:
+                record.delete()
+                raise
+            if response.status_code >= 500 or response.streaming:
+                record.delete()
+                return response
+
+            record.status_code = response.status_code
+            record.content_type = response.get('Content-Type', '')
+            record.location = response.get('Location', '')
+            record.content = response.content
+            record.save(update_fields=['status_code', 'content_type', 'location', 'content'])
+            return response
+        return _view
+    return decorator
+
+
+def delete_expired_keys(now=None):
+    """Deletes the keys older than KEY_TTL.
+
+    Args:
+        now (datetime, optional): The current time. Defaults to now.
+
+    Returns:
+        int: The number of keys deleted.
+    """
+    now = now or timezone.now()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=now - KEY_TTL).delete()
+    return deleted
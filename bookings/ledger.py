@@ -0,0 +1,557 @@
+"""Keeps the denormalised per-flight counters in step with bookings.
+
+Two sets of counters are maintained per flight and seat class: the sales
+rollups read by reports (FlightSalesRollup) and the seat inventory read by
+availability checks (SeatInventory). The seats held by active bookings are
+also claimed individually (SeatClaim), so the database rejects double sales.
+
+Every change to the state of a booking or its tickets goes through one of the
+functions below, inside the same transaction as the change itself and *before*
+the change is written. Rows that do not exist yet are created from the tickets
+currently on record, so the counters stay correct even for flights whose
+tickets were created before the counters existed.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from flights.models import Flight
+from flights.seat_grid import seat_grid
+from . import seat_map
+from .models import Booking, FlightSalesRollup, SeatClaim, SeatInventory, Ticket
+
+
+SEAT_CLASSES = [seat_class for seat_class, _ in Booking.SEAT_CLASS_CHOICES]
+
+INVENTORY_FIELDS = {
+    'Pending': 'held',
+    'Confirmed': 'sold',
+}
+
+DRIFT_FIELDS = {
+    FlightSalesRollup: ('sold', 'revenue'),
+    SeatInventory: ('capacity', 'held', 'sold'),
+}
+
+
+class SeatsUnavailable(Exception):
+    """Raised when a flight has too few free seats left in a seat class."""
+
+
+class SeatTaken(Exception):
+    """Raised when seats are already claimed by another active booking.
+
+    Attributes:
+        seats: The seat numbers that could not be claimed.
+    """
+
+    def __init__(self, seats):
+        """Initializes the exception with the seats that are taken.
+
+        Args:
+            seats (list): The seat numbers that could not be claimed.
+        """
+        self.seats = seats
+        super().__init__(f"Seat(s) already taken: {', '.join(seats)}")
+
+
+class InvalidSeats(Exception):
+    """Raised when seat numbers do not exist on the aircraft of the flight.
+
+    Attributes:
+        seats: The seat numbers that are not on the aircraft.
+    """
+
+    def __init__(self, seats):
+        """Initializes the exception with the seats that do not exist.
+
+        Args:
+            seats (list): The seat numbers that are not on the aircraft.
+        """
+        self.seats = seats
+        super().__init__(f"No such seat(s) on this aircraft: {', '.join(seats)}")
+
+
+def _ticket_totals(tickets):
+    """Counts tickets per flight, seat class and booking status.
+
+    Args:
+        tickets (QuerySet): The tickets to count.
+
+    Returns:
+        dict: Maps (flight_id, seat_class) to a dict of ticket counts keyed
+            by booking status.
+    """
+    rows = tickets.values('booking__flight_id', 'booking__seat_class').annotate(
+        pending=Count('ticket_id', filter=Q(booking__status='Pending')),
+        confirmed=Count('ticket_id', filter=Q(booking__status='Confirmed')),
+        cancelled=Count('ticket_id', filter=Q(booking__status='Cancelled')),
+    )
+    return {
+        (row['booking__flight_id'], row['booking__seat_class']): {
+            'Pending': row['pending'],
+            'Confirmed': row['confirmed'],
+            'Cancelled': row['cancelled'],
+        }
+        for row in rows
+    }
+
+
+def _counts(totals, flight, seat_class):
+    """Returns the ticket counts of a flight and seat class, zero when absent."""
+    return totals.get((flight.flight_number, seat_class), {'Pending': 0, 'Confirmed': 0, 'Cancelled': 0})
+
+
+def _rollup_rows(flights, totals):
+    """Builds unsaved rollup rows for flights from ticket totals.
+
+    Args:
+        flights: The flights to build rows for.
+        totals (dict): The ticket totals returned by _ticket_totals.
+
+    Returns:
+        list: One FlightSalesRollup per flight and seat class.
+    """
+    rows = []
+    for flight in flights:
+        for seat_class in SEAT_CLASSES:
+            counts = _counts(totals, flight, seat_class)
+            sold = counts['Pending'] + counts['Confirmed']
+            rows.append(FlightSalesRollup(
+                flight=flight,
+                seat_class=seat_class,
+                sold=sold,
+                cancelled=counts['Cancelled'],
+                revenue=sold * flight.price_for(seat_class),
+            ))
+    return rows
+
+
+def _inventory_rows(flights, totals):
+    """Builds unsaved inventory rows for flights from ticket totals.
+
+    Args:
+        flights: The flights to build rows for, with their aircraft.
+        totals (dict): The ticket totals returned by _ticket_totals.
+
+    Returns:
+        list: One SeatInventory per flight and seat class.
+    """
+    rows = []
+    for flight in flights:
+        for seat_class in SEAT_CLASSES:
+            counts = _counts(totals, flight, seat_class)
+            rows.append(SeatInventory(
+                flight=flight,
+                seat_class=seat_class,
+                capacity=flight.aircraft.capacity_for(seat_class),
+                held=counts['Pending'],
+                sold=counts['Confirmed'],
+            ))
+    return rows
+
+
+def _ensure(flight):
+    """Creates the missing counter rows of a flight from its current tickets.
+
+    Args:
+        flight (Flight): The flight whose counters are about to change.
+    """
+    expected = len(SEAT_CLASSES)
+    if (FlightSalesRollup.objects.filter(flight=flight).count() == expected
+            and SeatInventory.objects.filter(flight=flight).count() == expected):
+        return
+
+    totals = _ticket_totals(Ticket.objects.filter(booking__flight=flight))
+    FlightSalesRollup.objects.bulk_create(_rollup_rows([flight], totals), ignore_conflicts=True)
+    SeatInventory.objects.bulk_create(_inventory_rows([flight], totals), ignore_conflicts=True)
+
+
+def _apply_sales(flight, seat_class, sold=0, cancelled=0):
+    """Adjusts the rollup of a flight and seat class by ticket deltas.
+
+    Counters never drop below zero, so tickets created outside the ledger
+    cannot push a rollup into an invalid state; rebuild_rollups repairs them.
+
+    Args:
+        flight (Flight): The flight to adjust.
+        seat_class: The seat class to adjust.
+        sold (int): The change in sold tickets.
+        cancelled (int): The change in cancelled tickets.
+    """
+    if not sold and not cancelled:
+        return
+
+    price = flight.price_for(seat_class)
+    FlightSalesRollup.objects.filter(flight=flight, seat_class=seat_class).update(
+        sold=Greatest(F('sold') + sold, Value(0)),
+        cancelled=Greatest(F('cancelled') + cancelled, Value(0)),
+        revenue=Greatest(F('revenue') + sold * price, Value(0)),
+    )
+
+
+def _take_seats(flight, seat_class, status, count):
+    """Takes seats from the inventory for tickets of a booking status.
+
+    The capacity check and the increment are a single conditional UPDATE, so
+    concurrent bookings can never take more seats than the cabin has.
+
+    Args:
+        flight (Flight): The flight to take seats on.
+        seat_class: The seat class to take seats in.
+        status: The active booking status the seats are taken for.
+        count (int): The number of seats to take.
+
+    Raises:
+        SeatsUnavailable: If fewer than count seats are free.
+    """
+    field = INVENTORY_FIELDS[status]
+    updated = SeatInventory.objects.filter(
+        flight=flight,
+        seat_class=seat_class,
+        capacity__gte=F('held') + F('sold') + count,
+    ).update(**{field: F(field) + count})
+
+    if not updated:
+        raise SeatsUnavailable(f"Not enough {seat_class} seats left on flight {flight.flight_number}.")
+
+
+def _release_seats(flight, seat_class, status, count):
+    """Returns seats taken for tickets of a booking status to the inventory.
+
+    Args:
+        flight (Flight): The flight to release seats on.
+        seat_class: The seat class to release seats in.
+        status: The active booking status the seats were taken for.
+        count (int): The number of seats to release.
+    """
+    field = INVENTORY_FIELDS[status]
+    SeatInventory.objects.filter(flight=flight, seat_class=seat_class).update(
+        **{field: Greatest(F(field) - count, Value(0))}
+    )
+
+
+def _clear_reservations(flight, holder=''):
+    """Deletes the lapsed seat reservations on a flight, and those of a holder.
+
+    Args:
+        flight (Flight): The flight.
+        holder (str, optional): The session key whose reservations go as well.
+
+    Returns:
+        list: The seat numbers of the deleted reservations.
+    """
+    cleared = Q(expires_at__lte=timezone.now())
+    if holder:
+        cleared |= Q(holder=holder)
+    claims = SeatClaim.objects.filter(cleared, flight=flight, booking=None)
+    seat_numbers = list(claims.values_list('seat_number', flat=True))
+    if seat_numbers:
+        claims.delete()
+    return seat_numbers
+
+
+def _insert_claims(flight, seat_numbers, **fields):
+    """Claims seats on a flight.
+
+    Seats already claimed are reported up front; a claim that races with
+    another booking is rejected by the unique constraint on SeatClaim.
+
+    Args:
+        flight (Flight): The flight.
+        seat_numbers (list): The seat numbers to claim.
+        **fields: The booking, or the holder and expiry, of the claims.
+
+    Raises:
+        InvalidSeats: If any of the seats is not on the aircraft of the flight.
+        SeatTaken: If any of the seats is already claimed, or listed twice.
+    """
+    grid = seat_grid(flight.aircraft)
+    invalid = sorted({seat for seat in seat_numbers if grid.seat(seat) is None})
+    if invalid:
+        raise InvalidSeats(invalid)
+
+    duplicates = sorted(seat for seat, count in Counter(seat_numbers).items() if count > 1)
+    if duplicates:
+        raise SeatTaken(duplicates)
+
+    taken = SeatClaim.objects.filter(flight=flight, seat_number__in=seat_numbers)
+    taken = sorted(taken.values_list('seat_number', flat=True))
+    if taken:
+        raise SeatTaken(taken)
+
+    try:
+        with transaction.atomic():
+            SeatClaim.objects.bulk_create([
+                SeatClaim(flight=flight, seat_number=seat, **fields)
+                for seat in seat_numbers
+            ])
+    except IntegrityError:
+        raise SeatTaken(list(seat_numbers))
+    seat_map.seats_claimed(flight.pk, seat_numbers)
+
+
+def _claim_seats(booking, seat_numbers, holder=''):
+    """Claims seats on the flight of a booking.
+
+    Lapsed reservations give way, and the reservations of the holder making
+    the booking are replaced by the claims of the booking.
+
+    Args:
+        booking (Booking): The booking claiming the seats.
+        seat_numbers (list): The seat numbers to claim.
+        holder (str, optional): The session key making the booking.
+
+    Raises:
+        InvalidSeats: If any of the seats is not on the aircraft of the flight.
+        SeatTaken: If any of the seats is already claimed, or listed twice.
+    """
+    released = _clear_reservations(booking.flight, holder)
+    _insert_claims(booking.flight, seat_numbers, booking=booking)
+    seat_map.seats_released(booking.flight_id, [seat for seat in released if seat not in seat_numbers])
+
+
+def reserve_seats(flight, holder, seat_numbers, expires_at):
+    """Reserves seats for a session that has not booked them yet.
+
+    The reservation replaces any earlier one of the same holder on the flight.
+    It does not count towards the seat inventory; the booking that takes it
+    over does.
+
+    Args:
+        flight (Flight): The flight.
+        holder (str): The session key holding the reservation.
+        seat_numbers (list): The seat numbers to reserve.
+        expires_at (datetime): When the reservation lapses.
+
+    Raises:
+        InvalidSeats: If any of the seats is not on the aircraft of the flight.
+        SeatTaken: If any of the seats is already claimed, or listed twice.
+    """
+    with transaction.atomic():
+        released = _clear_reservations(flight, holder)
+        _insert_claims(flight, seat_numbers, holder=holder, expires_at=expires_at)
+        seat_map.seats_released(flight.pk, [seat for seat in released if seat not in seat_numbers])
+
+
+def reserved_seats(flight, holder):
+    """Returns the seats a holder has reserved on a flight and not booked yet.
+
+    Args:
+        flight (Flight): The flight.
+        holder (str): The session key of the holder.
+
+    Returns:
+        set: The reserved seat numbers.
+    """
+    if not holder:
+        return set()
+    return set(SeatClaim.objects.filter(
+        flight=flight, booking=None, holder=holder, expires_at__gt=timezone.now()
+    ).values_list('seat_number', flat=True))
+
+
+def tickets_added(booking, seat_numbers, holder=''):
+    """Records new tickets on a booking.
+
+    Args:
+        booking (Booking): The booking receiving the tickets.
+        seat_numbers (list): The seat numbers of the tickets about to be created.
+        holder (str, optional): The session key making the booking, whose
+            seat reservations the booking takes over.
+
+    Raises:
+        InvalidSeats: If any of the seats is not on the aircraft.
+        SeatTaken: If any of the seats is already claimed.
+        SeatsUnavailable: If the flight has too few free seats in the class.
+    """
+    _ensure(booking.flight)
+    if booking.status in Booking.ACTIVE_STATUSES:
+        _claim_seats(booking, seat_numbers, holder)
+        _take_seats(booking.flight, booking.seat_class, booking.status, len(seat_numbers))
+        _apply_sales(booking.flight, booking.seat_class, sold=len(seat_numbers))
+
+
+def tickets_removed(booking, seat_numbers):
+    """Records tickets being removed from a booking.
+
+    Args:
+        booking (Booking): The booking losing the tickets.
+        seat_numbers (list): The seat numbers of the tickets about to be deleted.
+    """
+    _ensure(booking.flight)
+    if booking.status in Booking.ACTIVE_STATUSES:
+        count = len(seat_numbers)
+        SeatClaim.objects.filter(booking=booking, seat_number__in=seat_numbers).delete()
+        seat_map.seats_released(booking.flight_id, seat_numbers)
+        _release_seats(booking.flight, booking.seat_class, booking.status, count)
+        _apply_sales(booking.flight, booking.seat_class, sold=-count, cancelled=count)
+
+
+def status_changed(booking, new_status):
+    """Records a booking moving to a new status.
+
+    Args:
+        booking (Booking): The booking, still carrying its current status.
+        new_status: The status the booking is about to be saved with.
+
+    Raises:
+        InvalidSeats: If a cancelled booking is reactivated but its seats are
+            no longer on the aircraft.
+        SeatTaken: If a cancelled booking is reactivated but its seats were
+            claimed by another booking.
+        SeatsUnavailable: If a cancelled booking is reactivated but its seat
+            class has no room left.
+    """
+    old_status = booking.status
+    if old_status == new_status:
+        return
+
+    _ensure(booking.flight)
+    seat_numbers = list(booking.tickets.values_list('seat_number', flat=True))
+    count = len(seat_numbers)
+    was_active = old_status in Booking.ACTIVE_STATUSES
+    is_active = new_status in Booking.ACTIVE_STATUSES
+
+    if was_active:
+        _release_seats(booking.flight, booking.seat_class, old_status, count)
+    if is_active:
+        _take_seats(booking.flight, booking.seat_class, new_status, count)
+
+    if was_active and not is_active:
+        SeatClaim.objects.filter(booking=booking).delete()
+        seat_map.seats_released(booking.flight_id, seat_numbers)
+        _apply_sales(booking.flight, booking.seat_class, sold=-count, cancelled=count)
+    elif is_active and not was_active:
+        _claim_seats(booking, seat_numbers)
+        _apply_sales(booking.flight, booking.seat_class, sold=count, cancelled=-count)
+
+
+def bookings_cancelled(booking_ids):
+    """Records a batch of active bookings being cancelled.
+
+    Args:
+        booking_ids (list): The ids of the active bookings about to be cancelled.
+    """
+    tickets = Ticket.objects.filter(booking_id__in=booking_ids, booking__status__in=Booking.ACTIVE_STATUSES)
+    totals = _ticket_totals(tickets)
+    flights = Flight.objects.in_bulk({flight_id for flight_id, _ in totals})
+
+    for flight in flights.values():
+        _ensure(flight)
+    for (flight_id, seat_class), counts in totals.items():
+        flight = flights[flight_id]
+        for status in Booking.ACTIVE_STATUSES:
+            if counts[status]:
+                _release_seats(flight, seat_class, status, counts[status])
+        sold = counts['Pending'] + counts['Confirmed']
+        _apply_sales(flight, seat_class, sold=-sold, cancelled=sold)
+    claims = SeatClaim.objects.filter(booking_id__in=booking_ids)
+    released = {}
+    for flight_id, seat_number in claims.values_list('flight_id', 'seat_number'):
+        released.setdefault(flight_id, []).append(seat_number)
+    claims.delete()
+    for flight_id, seat_numbers in released.items():
+        seat_map.seats_released(flight_id, seat_numbers)
+
+
+def flight_updated(flight):
+    """Refreshes the counters of a flight after its prices or aircraft changed.
+
+    Args:
+        flight (Flight): The flight with its new details.
+    """
+    for seat_class in SEAT_CLASSES:
+        FlightSalesRollup.objects.filter(flight=flight, seat_class=seat_class).update(
+            revenue=F('sold') * flight.price_for(seat_class),
+        )
+        SeatInventory.objects.filter(flight=flight, seat_class=seat_class).update(
+            capacity=flight.aircraft.capacity_for(seat_class),
+        )
+
+
+def expected_rollups(flights=None):
+    """Recomputes the counters of flights from scratch from their tickets.
+
+    Tickets that were deleted are no longer on record, so the recomputed
+    'cancelled' sales counters only cover tickets of cancelled bookings.
+
+    Args:
+        flights (QuerySet, optional): The flights to recompute. Defaults to all flights.
+
+    Returns:
+        list: Unsaved FlightSalesRollup and SeatInventory rows, one of each
+            per flight and seat class.
+    """
+    if flights is None:
+        flights = Flight.objects.all()
+    flights = flights.select_related('aircraft')
+
+    totals = _ticket_totals(Ticket.objects.filter(booking__flight__in=flights))
+    return _rollup_rows(flights, totals) + _inventory_rows(flights, totals)
+
+
+def find_drift(flights=None):
+    """Compares the stored counters with freshly recomputed ones.
+
+    Args:
+        flights (QuerySet, optional): The flights to check. Defaults to all flights.
+
+    Returns:
+        list: (expected, stored) pairs whose DRIFT_FIELDS differ.
+            stored is None when the row is missing.
+    """
+    if flights is None:
+        flights = Flight.objects.all()
+
+    stored = {}
+    for model in DRIFT_FIELDS:
+        for row in model.objects.filter(flight__in=flights):
+            stored[(model, row.flight_id, row.seat_class)] = row
+
+    drift = []
+    for expected in expected_rollups(flights):
+        fields = DRIFT_FIELDS[type(expected)]
+        current = stored.get((type(expected), expected.flight_id, expected.seat_class))
+        if current is None:
+            if any(getattr(expected, field) for field in fields if field != 'capacity'):
+                drift.append((expected, None))
+        elif any(getattr(current, field) != getattr(expected, field) for field in fields):
+            drift.append((expected, current))
+    return drift
+
+
+def rebuild_rollups(flights=None):
+    """Replaces the counters of flights with ones recomputed from their tickets.
+
+    Must run inside a transaction so readers never see a partial rebuild.
+
+    Args:
+        flights (QuerySet, optional): The flights to rebuild. Defaults to all flights.
+
+    Returns:
+        int: The number of rows written.
+    """
+    if flights is None:
+        flights = Flight.objects.all()
+
+    rows = expected_rollups(flights)
+    for model in DRIFT_FIELDS:
+        model.objects.filter(flight__in=flights).delete()
+        model.objects.bulk_create([row for row in rows if type(row) is model], batch_size=1000)
+    return len(rows)
+
+
+def aircraft_updated(aircraft):
+    """Refreshes the seat capacities of every flight of an aircraft after its seat counts changed.
+
+    Args:
+        aircraft (Aircraft): The aircraft with its new seat counts.
+    """
+    for seat_class in SEAT_CLASSES:
+        SeatInventory.objects.filter(flight__aircraft=aircraft, seat_class=seat_class).update(
+            capacity=aircraft.capacity_for(seat_class),
+        )
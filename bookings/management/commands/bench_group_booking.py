@@ -0,0 +1,132 @@
+import json
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings import ledger
+from bookings.forms import TicketForm
+from bookings.group_booking import parse_passengers, validate_passengers
+from bookings.models import Booking, Ticket
+from flights.models import Aircraft, Airport, Flight
+from users.models import PassengerProfile
+
+
+BENCH_FLIGHT = 'BENCH03'
+
+
+class Command(BaseCommand):
+    """Benchmark booking a large group through the group booking API."""
+    help = 'Book a large group through the group booking API and report how long it takes'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--passengers', type=int, default=500, help='Passengers in the group.')
+        parser.add_argument('--runs', type=int, default=5, help='Group bookings to time.')
+        parser.add_argument('--budget', type=float, default=1.0, help='Seconds a median booking may take.')
+
+    def handle(self, *args, **options):
+        """Sets up a flight, books the group repeatedly and reports the timings.
+
+        Raises:
+            CommandError: If a booking fails or the median booking exceeds the budget.
+        """
+        passengers = options['passengers']
+        flight, user = self.set_up(passengers)
+        body = json.dumps([
+            {'passenger_name': f'Group Passenger {chr(65 + i % 26)}', 'passport': f'G{i:08d}',
+             'nationality': f'{i:010d}', 'passenger_dob': date(1980 + i % 30, 1 + i % 12, 1 + i % 28).isoformat()}
+            for i in range(passengers)
+        ]).encode()
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        url = reverse('group_booking', args=[flight.flight_number, 'Economy'])
+
+        try:
+            timings = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                response = client.post(url, body, content_type='application/json')
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 201:
+                    raise CommandError(f"Booking failed with {response.status_code}: {response.content[:200]!r}")
+                self.cancel(response.json()['booking_id'])
+
+            rows = parse_passengers(body, 'application/json')
+            started = time.perf_counter()
+            validate_passengers(rows)
+            validation = time.perf_counter() - started
+            started = time.perf_counter()
+            for row in rows:
+                TicketForm(row).is_valid()
+            form_validation = time.perf_counter() - started
+        finally:
+            self.tear_down(flight, user)
+
+        median = statistics.median(timings)
+        self.stdout.write(f"Booked {passengers} passengers {options['runs']} times: median {median * 1000:.1f}ms, "
+                          f"max {max(timings) * 1000:.1f}ms per booking")
+        self.stdout.write(f"Validating {passengers} rows: {validation * 1000:.1f}ms "
+                          f"(one TicketForm per row: {form_validation * 1000:.1f}ms)")
+        if median > options['budget']:
+            raise CommandError(f"The median booking took longer than {options['budget']}s.")
+        self.stdout.write(self.style.SUCCESS("Group bookings stayed within budget."))
+
+    def cancel(self, booking_id):
+        """Cancels a benchmark booking so its seats can be booked again.
+
+        Args:
+            booking_id (int): The booking to cancel.
+        """
+        with transaction.atomic():
+            ledger.bookings_cancelled([booking_id])
+            Booking.objects.filter(pk=booking_id).update(status='Cancelled', hold_expires_at=None)
+        Ticket.objects.filter(booking_id=booking_id).delete()
+
+    def set_up(self, passengers):
+        """Creates the benchmark flight and the user booking the group.
+
+        Args:
+            passengers (int): The size of the group.
+
+        Returns:
+            tuple: The flight and the user making the bookings.
+        """
+        origin, _ = Airport.objects.get_or_create(
+            airport_code='ZZA', defaults={'airport_name': 'Bench Origin', 'city': 'Bench', 'country': 'Bench'})
+        destination, _ = Airport.objects.get_or_create(
+            airport_code='ZZB', defaults={'airport_name': 'Bench Destination', 'city': 'Bench', 'country': 'Bench'})
+        aircraft = Aircraft.objects.create(model='Bench Jumbo', economy_class=-(-passengers // 6) * 6,
+                                           business_class=0, first_class=0)
+        departure = timezone.now() + timedelta(days=30)
+        flight = Flight.objects.create(
+            flight_number=BENCH_FLIGHT, departure_datetime=departure, arrival_datetime=departure + timedelta(hours=2),
+            departure_airport=origin, arrival_airport=destination, aircraft=aircraft,
+        )
+        user = User.objects.create_user('bench_operator', password=None)
+        PassengerProfile.objects.create(user=user)
+        return flight, user
+
+    def tear_down(self, flight, user):
+        """Deletes everything the benchmark created.
+
+        Args:
+            flight (Flight): The benchmark flight.
+            user (User): The benchmark user.
+        """
+        Booking.objects.filter(flight=flight).delete()
+        aircraft = flight.aircraft
+        flight.delete()
+        aircraft.delete()
+        user.delete()
+        Airport.objects.filter(airport_code__in=['ZZA', 'ZZB'], departing_flights=None, arriving_flights=None).delete()
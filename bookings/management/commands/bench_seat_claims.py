@@ -0,0 +1,168 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+
+from bookings import ledger
+from bookings.holds import hold_seats
+from bookings.models import Booking, SeatInventory, Ticket
+from flights.models import Aircraft, Airport, Flight
+from users.models import PassengerProfile
+
+
+logger = logging.getLogger(__name__)
+
+BENCH_FLIGHT = 'BENCH01'
+SEAT_LETTERS = 'ABCDEF'
+
+
+class Command(BaseCommand):
+    """Benchmark concurrent seat holds and check that no seat is ever sold twice."""
+    help = 'Run concurrent bookers against one flight and report throughput and double bookings'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--bookers', type=int, default=50, help='Number of concurrent booking threads.')
+        parser.add_argument('--attempts', type=int, default=20, help='Booking attempts per thread.')
+        parser.add_argument('--party-size', type=int, default=2, help='Seats requested per booking.')
+        parser.add_argument('--seats', type=int, default=120, help='Economy seats on the benchmark flight.')
+
+    def handle(self, *args, **options):
+        """Sets up a benchmark flight, runs the bookers and checks the results.
+
+        Raises:
+            CommandError: If a booker failed with anything but a taken or sold
+                out seat, or any seat ended up held by more than one active booking.
+        """
+        flight, profiles = self.set_up(options['bookers'], options['seats'])
+        seat_pool = [
+            f"{row}{letter}"
+            for row in range(1, options['seats'] // len(SEAT_LETTERS) + 1)
+            for letter in SEAT_LETTERS
+        ]
+
+        results = Counter()
+        failures = []
+        results_lock = threading.Lock()
+        barrier = threading.Barrier(options['bookers'])
+
+        def booker(profile):
+            outcome = Counter()
+            barrier.wait()
+            try:
+                for _ in range(options['attempts']):
+                    seats = random.sample(seat_pool, options['party_size'])
+                    tickets = [
+                        Ticket(seat_number=seat, passenger_name='Bench Passenger', passport='B12345678',
+                               nationality='1010101010', passenger_dob=date(1990, 1, 1))
+                        for seat in seats
+                    ]
+                    try:
+                        hold_seats(flight, 'Economy', profile, tickets)
+                        outcome['held'] += 1
+                    except ledger.SeatTaken:
+                        outcome['seat taken'] += 1
+                    except ledger.SeatsUnavailable:
+                        outcome['sold out'] += 1
+            except Exception as e:
+                logger.exception("Booker %s failed", profile.user.username)
+                with results_lock:
+                    failures.append(e)
+            finally:
+                connections.close_all()
+                with results_lock:
+                    results.update(outcome)
+
+        threads = [threading.Thread(target=booker, args=(profile,)) for profile in profiles]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            if failures:
+                raise CommandError(f"{len(failures)} booker(s) failed; the first with {failures[0]!r}.")
+            self.report(flight, results, elapsed)
+        finally:
+            self.tear_down(flight, profiles)
+
+    def set_up(self, bookers, seats):
+        """Creates the benchmark flight and one passenger per booker.
+
+        Args:
+            bookers (int): The number of passengers to create.
+            seats (int): The number of economy seats on the flight.
+
+        Returns:
+            tuple: The flight and the list of passenger profiles.
+        """
+        origin, _ = Airport.objects.get_or_create(
+            airport_code='ZZA', defaults={'airport_name': 'Bench Origin', 'city': 'Bench', 'country': 'Bench'})
+        destination, _ = Airport.objects.get_or_create(
+            airport_code='ZZB', defaults={'airport_name': 'Bench Destination', 'city': 'Bench', 'country': 'Bench'})
+        aircraft = Aircraft.objects.create(model='Bench Jet', economy_class=seats, business_class=0, first_class=0)
+
+        departure = timezone.now() + timedelta(days=30)
+        flight = Flight.objects.create(
+            flight_number=BENCH_FLIGHT, departure_datetime=departure, arrival_datetime=departure + timedelta(hours=2),
+            departure_airport=origin, arrival_airport=destination, aircraft=aircraft,
+        )
+
+        profiles = []
+        for i in range(bookers):
+            user = User.objects.create_user(f'bench_booker_{i}', password=None)
+            profiles.append(PassengerProfile.objects.create(user=user))
+        return flight, profiles
+
+    def report(self, flight, results, elapsed):
+        """Prints the throughput and checks the flight for double bookings.
+
+        Args:
+            flight (Flight): The benchmark flight.
+            results (Counter): The outcome counts of all booking attempts.
+            elapsed (float): The wall time of the run in seconds.
+
+        Raises:
+            CommandError: If any seat is held by more than one active booking.
+        """
+        attempts = sum(results.values())
+        self.stdout.write(f"Attempts: {attempts} in {elapsed:.2f}s ({attempts / elapsed:.1f} attempts/s)")
+        for outcome, count in sorted(results.items()):
+            self.stdout.write(f" - {outcome}: {count}")
+
+        active_tickets = Ticket.objects.filter(booking__flight=flight, booking__status__in=Booking.ACTIVE_STATUSES)
+        doubles = active_tickets.values('seat_number').annotate(holders=Count('ticket_id')).filter(holders__gt=1)
+        inventory = SeatInventory.objects.get(flight=flight, seat_class='Economy')
+
+        self.stdout.write(f"Seats held: {active_tickets.count()} (inventory held={inventory.held})")
+        if doubles.exists():
+            raise CommandError(f"{doubles.count()} seat(s) were booked more than once.")
+        self.stdout.write(self.style.SUCCESS("No seat was booked more than once."))
+
+    def tear_down(self, flight, profiles):
+        """Deletes everything the benchmark created.
+
+        Args:
+            flight (Flight): The benchmark flight.
+            profiles (list): The benchmark passenger profiles.
+        """
+        Booking.objects.filter(flight=flight).delete()
+        aircraft = flight.aircraft
+        flight.delete()
+        aircraft.delete()
+        User.objects.filter(pk__in=[profile.user_id for profile in profiles]).delete()
+        Airport.objects.filter(airport_code__in=['ZZA', 'ZZB'], departing_flights=None, arriving_flights=None).delete()
@@ -0,0 +1,198 @@
+import asyncio
+import resource
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings import seat_events
+from flights.models import Aircraft, Airport, Flight
+
+
+BENCH_FLIGHT = 'BENCH02'
+
+
+class Command(BaseCommand):
+    """Load test the live seat event stream with many concurrent subscribers in one process."""
+    help = 'Open many seat event streams through the ASGI application and measure event fan-out'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--subscribers', type=int, default=5000, help='Number of concurrent event streams.')
+        parser.add_argument('--events', type=int, default=20, help='Seat events to publish.')
+        parser.add_argument('--interval', type=float, default=0.1, help='Seconds between published events.')
+
+    def handle(self, *args, **options):
+        """Sets up a flight and a logged in user, runs the streams and reports the results.
+
+        Raises:
+            CommandError: If a subscriber missed an event.
+        """
+        flight, user, session_key = self.set_up()
+        try:
+            with override_settings(SEAT_EVENTS_ENABLED=True):
+                results = asyncio.run(self.run(flight, session_key, options))
+        finally:
+            connections.close_all()
+            self.tear_down(flight, user)
+        self.report(results, options)
+
+    async def run(self, flight, session_key, options):
+        """Opens the streams, publishes the events from another thread and closes the streams.
+
+        Args:
+            flight (Flight): The benchmark flight.
+            session_key (str): The session of the logged in benchmark user.
+            options (dict): The command line options.
+
+        Returns:
+            dict: The timings and counts of the run.
+        """
+        application = get_asgi_application()
+        path = reverse('seat_events', args=[flight.flight_number])
+        subscribers = options['subscribers']
+        connected = asyncio.Semaphore(0)
+        disconnect = asyncio.Event()
+        published = {}
+        arrivals = [[] for _ in range(options['events'])]
+        statuses = []
+
+        async def subscriber(number):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'cookie', f'sessionid={session_key}'.encode())],
+                'client': ('127.0.0.1', 10000 + number), 'server': ('localhost', 80),
+            }
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                    return
+                body = message.get('body', b'')
+                if body.startswith(b'retry:'):
+                    connected.release()
+                elif body.startswith(b'event: seats'):
+                    seq = int(body.split(b'"seats": ["', 1)[1].split(b'A"', 1)[0])
+                    arrivals[seq].append(time.perf_counter())
+
+            await application(scope, receive, send)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(subscriber(i)) for i in range(subscribers)]
+        for _ in range(subscribers):
+            await connected.acquire()
+        connect_time = time.perf_counter() - started
+        rss_connected = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        def publisher():
+            for seq in range(options['events']):
+                published[seq] = time.perf_counter()
+                seat_events.publish(flight.flight_number, [f'{seq}A'], True)
+                time.sleep(options['interval'])
+
+        thread = threading.Thread(target=publisher)
+        thread.start()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+        while any(len(times) < subscribers for times in arrivals) and time.perf_counter() - published[
+                options['events'] - 1] < 10:
+            await asyncio.sleep(0.05)
+
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        return {
+            'connect_time': connect_time,
+            'fan_out': [max(times) - published[seq] for seq, times in enumerate(arrivals) if times],
+            'first_delivery': [min(times) - published[seq] for seq, times in enumerate(arrivals) if times],
+            'delivered': sum(len(times) for times in arrivals),
+            'statuses': statuses,
+            'rss_kib': rss_connected - rss_before,
+            'left_subscribed': seat_events.get_broker().subscriber_count(flight.flight_number),
+        }
+
+    def report(self, results, options):
+        """Prints the timings of the run.
+
+        Args:
+            results (dict): The timings and counts returned by run.
+            options (dict): The command line options.
+
+        Raises:
+            CommandError: If a subscriber missed an event or a stream was not answered with 200.
+        """
+        subscribers, events = options['subscribers'], options['events']
+        fan_out = sorted(results['fan_out'])
+        self.stdout.write(f"Connected {subscribers} streams in {results['connect_time']:.2f}s "
+                          f"(+{results['rss_kib'] / 1024:.0f} MiB peak RSS)")
+        self.stdout.write(f"Delivered {results['delivered']} of {subscribers * events} events")
+        if fan_out:
+            self.stdout.write(
+                f"Fan-out to all subscribers: median {statistics.median(fan_out) * 1000:.1f}ms, "
+                f"max {fan_out[-1] * 1000:.1f}ms; first delivery median "
+                f"{statistics.median(results['first_delivery']) * 1000:.2f}ms"
+            )
+        self.stdout.write(f"Subscriptions left after disconnect: {results['left_subscribed']}")
+
+        if any(status != 200 for status in results['statuses']):
+            raise CommandError(f"Streams answered with {sorted(set(results['statuses']))}.")
+        if results['delivered'] != subscribers * events:
+            raise CommandError("Some subscribers missed events.")
+        self.stdout.write(self.style.SUCCESS("Every subscriber received every event."))
+
+    def set_up(self):
+        """Creates the benchmark flight and a logged in user.
+
+        Returns:
+            tuple: The flight, the user and the session key of the user.
+        """
+        origin, _ = Airport.objects.get_or_create(
+            airport_code='ZZA', defaults={'airport_name': 'Bench Origin', 'city': 'Bench', 'country': 'Bench'})
+        destination, _ = Airport.objects.get_or_create(
+            airport_code='ZZB', defaults={'airport_name': 'Bench Destination', 'city': 'Bench', 'country': 'Bench'})
+        aircraft = Aircraft.objects.create(model='Bench Jet', economy_class=60, business_class=0, first_class=0)
+        departure = timezone.now() + timedelta(days=30)
+        flight = Flight.objects.create(
+            flight_number=BENCH_FLIGHT, departure_datetime=departure, arrival_datetime=departure + timedelta(hours=2),
+            departure_airport=origin, arrival_airport=destination, aircraft=aircraft,
+        )
+
+        user = User.objects.create_user('bench_watcher', password=None)
+        client = Client()
+        client.force_login(user)
+        return flight, user, client.cookies['sessionid'].value
+
+    def tear_down(self, flight, user):
+        """Deletes everything the benchmark created.
+
+        Args:
+            flight (Flight): The benchmark flight.
+            user (User): The benchmark user.
+        """
+        aircraft = flight.aircraft
+        flight.delete()
+        aircraft.delete()
+        user.delete()
+        Airport.objects.filter(airport_code__in=['ZZA', 'ZZB'], departing_flights=None, arriving_flights=None).delete()
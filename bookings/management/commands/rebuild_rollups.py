@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bookings.ledger import DRIFT_FIELDS, find_drift, rebuild_rollups
+
+
+class Command(BaseCommand):
+    """Rebuild the per-flight sales rollups and seat inventory from tickets, or check them for drift."""
+    help = 'Rebuild FlightSalesRollup and SeatInventory rows from tickets, or check them for drift with --check'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report rows that differ from the tickets, without changing them.',
+        )
+
+    def handle(self, *args, **options):
+        """Executes the rebuild or the drift check.
+
+        Raises:
+            CommandError: If --check finds rollups that drifted from the tickets.
+        """
+        if options['check']:
+            drift = find_drift()
+            for expected, stored in drift:
+                fields = DRIFT_FIELDS[type(expected)]
+                if stored is None:
+                    current = 'missing'
+                else:
+                    current = ' '.join(f"{field}={getattr(stored, field)}" for field in fields)
+                wanted = ' '.join(f"{field}={getattr(expected, field)}" for field in fields)
+                self.stdout.write(f" - {expected}: {current}, expected {wanted}")
+            if drift:
+                raise CommandError(f"{len(drift)} row(s) drifted. Run rebuild_rollups to repair them.")
+            self.stdout.write(self.style.SUCCESS("Rollups and seat inventory match the tickets."))
+            return
+
+        with transaction.atomic():
+            count = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollup and inventory rows."))
@@ -0,0 +1,49 @@
+import time
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.updater import LEADER_RETRY_SECONDS, LeaderLock, attach_jobs
+
+
+class Command(BaseCommand):
+    """Run the periodic jobs of the bookings app in a dedicated process."""
+    help = 'Run the booking scheduler in the foreground once this process holds the leader lock'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument(
+            '--no-wait',
+            action='store_true',
+            help='Exit instead of waiting when another process already runs the scheduler.',
+        )
+
+    def handle(self, *args, **options):
+        """Takes the leader lock and runs the scheduler until interrupted.
+
+        Raises:
+            CommandError: If --no-wait is given and another process holds the lock.
+        """
+        lock = LeaderLock(settings.SCHEDULER_LOCK_FILE)
+        while not lock.acquire():
+            if options['no_wait']:
+                raise CommandError(f"Another process holds {settings.SCHEDULER_LOCK_FILE}.")
+            self.stdout.write(f"Another process runs the scheduler. Retrying in {LEADER_RETRY_SECONDS}s.")
+            time.sleep(LEADER_RETRY_SECONDS)
+
+        scheduler = BlockingScheduler()
+        attach_jobs(scheduler)
+        self.stdout.write(self.style.SUCCESS("Scheduler started. Press Ctrl+C to stop."))
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            self.stdout.write("Stopping the scheduler.")
+        finally:
+            if scheduler.running:
+                scheduler.shutdown()
+            lock.release()
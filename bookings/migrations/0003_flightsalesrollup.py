@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+PRICE_FIELDS = {
+    'Economy': 'economy_price',
+    'Business': 'business_price',
+    'First': 'first_class_price',
+}
+
+
+def backfill_rollups(apps, schema_editor):
+    """Builds the rollups of existing flights from their tickets."""
+    Flight = apps.get_model('flights', 'Flight')
+    Ticket = apps.get_model('bookings', 'Ticket')
+    FlightSalesRollup = apps.get_model('bookings', 'FlightSalesRollup')
+
+    totals = {
+        (row['booking__flight_id'], row['booking__seat_class']): row
+        for row in Ticket.objects.values('booking__flight_id', 'booking__seat_class').annotate(
+            sold=Count('ticket_id', filter=Q(booking__status__in=['Confirmed', 'Pending'])),
+            cancelled=Count('ticket_id', filter=Q(booking__status='Cancelled')),
+        )
+    }
+
+    rows = []
+    for flight in Flight.objects.all():
+        for seat_class, price_field in PRICE_FIELDS.items():
+            row = totals.get((flight.flight_number, seat_class), {'sold': 0, 'cancelled': 0})
+            rows.append(FlightSalesRollup(
+                flight=flight,
+                seat_class=seat_class,
+                sold=row['sold'],
+                cancelled=row['cancelled'],
+                revenue=row['sold'] * getattr(flight, price_field),
+            ))
+    FlightSalesRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_alter_ticket_passport'),
+        ('flights', '0002_flight_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(choices=[('Economy', 'Economy'), ('Business', 'Business'), ('First', 'First')], max_length=20)),
+                ('sold', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='flights.flight')),
+            ],
+            options={
+                'db_table': 'FlightSalesRollup',
+                'constraints': [models.UniqueConstraint(fields=('flight', 'seat_class'), name='unique_flight_sales_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
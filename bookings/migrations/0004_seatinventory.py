@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+CAPACITY_FIELDS = {
+    'Economy': 'economy_class',
+    'Business': 'business_class',
+    'First': 'first_class',
+}
+
+
+def backfill_inventory(apps, schema_editor):
+    """Builds the seat inventory of existing flights from their tickets."""
+    Flight = apps.get_model('flights', 'Flight')
+    Ticket = apps.get_model('bookings', 'Ticket')
+    SeatInventory = apps.get_model('bookings', 'SeatInventory')
+
+    totals = {
+        (row['booking__flight_id'], row['booking__seat_class']): row
+        for row in Ticket.objects.values('booking__flight_id', 'booking__seat_class').annotate(
+            held=Count('ticket_id', filter=Q(booking__status='Pending')),
+            sold=Count('ticket_id', filter=Q(booking__status='Confirmed')),
+        )
+    }
+
+    rows = []
+    for flight in Flight.objects.select_related('aircraft'):
+        for seat_class, capacity_field in CAPACITY_FIELDS.items():
+            row = totals.get((flight.flight_number, seat_class), {'held': 0, 'sold': 0})
+            rows.append(SeatInventory(
+                flight=flight,
+                seat_class=seat_class,
+                capacity=getattr(flight.aircraft, capacity_field),
+                held=row['held'],
+                sold=row['sold'],
+            ))
+    SeatInventory.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_flightsalesrollup'),
+        ('flights', '0002_flight_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(choices=[('Economy', 'Economy'), ('Business', 'Business'), ('First', 'First')], max_length=20)),
+                ('capacity', models.PositiveIntegerField(default=0)),
+                ('held', models.PositiveIntegerField(default=0)),
+                ('sold', models.PositiveIntegerField(default=0)),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_inventory', to='flights.flight')),
+            ],
+            options={
+                'db_table': 'SeatInventory',
+                'constraints': [models.UniqueConstraint(fields=('flight', 'seat_class'), name='unique_seat_inventory')],
+            },
+        ),
+        migrations.RunPython(backfill_inventory, migrations.RunPython.noop),
+    ]
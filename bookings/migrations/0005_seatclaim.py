@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_claims(apps, schema_editor):
+    """Claims the seats of tickets on active bookings, keeping the first claim of any seat."""
+    Ticket = apps.get_model('bookings', 'Ticket')
+    SeatClaim = apps.get_model('bookings', 'SeatClaim')
+
+    tickets = Ticket.objects.filter(booking__status__in=['Confirmed', 'Pending']).order_by('ticket_id')
+    SeatClaim.objects.bulk_create([
+        SeatClaim(flight_id=flight_id, seat_number=seat_number, booking_id=booking_id)
+        for flight_id, seat_number, booking_id in tickets.values_list('booking__flight_id', 'seat_number', 'booking_id')
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_seatinventory'),
+        ('flights', '0002_flight_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_number', models.CharField(max_length=10)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_claims', to='bookings.booking')),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_claims', to='flights.flight')),
+            ],
+            options={
+                'db_table': 'SeatClaim',
+                'constraints': [models.UniqueConstraint(fields=('flight', 'seat_number'), name='unique_seat_claim')],
+            },
+        ),
+        migrations.RunPython(backfill_claims, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:17
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_deadlines(apps, schema_editor):
+    """Gives pending bookings the deadline they had under the booking_date rule."""
+    Booking = apps.get_model('bookings', 'Booking')
+    Booking.objects.filter(status='Pending').update(
+        hold_expires_at=models.F('booking_date') + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_seatclaim'),
+        ('flights', '0002_flight_status'),
+        ('users', '0008_alter_admin_hire_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'hold_expires_at'], name='booking_hold_expiry_idx'),
+        ),
+        migrations.RunPython(backfill_deadlines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_booking_hold_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seatclaim',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='seatclaim',
+            name='holder',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='seatclaim',
+            name='booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='seat_claims', to='bookings.booking'),
+        ),
+    ]
@@ -1,4 +1,8 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 
@@ -9,10 +13,13 @@ class Booking(models.Model):
         booking_id: The unique identifier for the booking.
         booking_date: The date and time when the booking was created.
         status: The current status of the booking (e.g., 'Confirmed', 'Pending', 'Cancelled').
+            Bookings in ACTIVE_STATUSES hold their seats.
         number_of_passengers: The number of passengers included in the booking.
         seat_class: The class of seats booked (e.g., 'Economy', 'Business', 'First').
         passenger: The passenger profile associated with the booking.
         flight: The flight associated with the booking.
+        hold_expires_at: When a pending booking stops holding its seats. It is set
+            when the booking is saved as pending and cleared once it leaves that state.
     """
     
     STATUS_CHOICES = [
@@ -21,6 +28,8 @@ class Booking(models.Model):
         ('Cancelled', 'Cancelled'),
     ]
 
+    ACTIVE_STATUSES = ('Confirmed', 'Pending')
+
     SEAT_CLASS_CHOICES = [
         ('Economy', 'Economy'),
         ('Business', 'Business'),
@@ -34,6 +43,18 @@ class Booking(models.Model):
     seat_class = models.CharField(max_length=20, choices=SEAT_CLASS_CHOICES, default='Economy')
     passenger = models.ForeignKey('users.PassengerProfile', on_delete=models.RESTRICT)
     flight = models.ForeignKey('flights.Flight', on_delete=models.RESTRICT)
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        """Saves the booking, keeping the hold deadline in step with the status.
+
+        A pending booking without a deadline gets one BOOKING_HOLD_MINUTES from now.
+        """
+        if self.status != 'Pending':
+            self.hold_expires_at = None
+        elif self.hold_expires_at is None:
+            self.hold_expires_at = timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+        super().save(*args, **kwargs)
 
     def total_price(self):
         """Calculates the total price of the booking based on seat class and passenger count.
@@ -73,6 +94,9 @@ class Booking(models.Model):
 
     class Meta:
         db_table = 'Booking'
+        indexes = [
+            models.Index(fields=['status', 'hold_expires_at'], name='booking_hold_expiry_idx'),
+        ]
 
 class Ticket(models.Model):
     """Represents a specific ticket for a seat within a booking.
@@ -108,3 +132,160 @@ class Ticket(models.Model):
     class Meta:
         db_table = 'Ticket'
 
+class FlightSalesRollup(models.Model):
+    """Holds the running ticket sales totals of a flight for one seat class.
+
+    The rows are kept up to date by bookings.ledger whenever a booking or
+    ticket changes state, so reports can read them instead of counting tickets.
+
+    Attributes:
+        flight: The flight the totals belong to.
+        seat_class: The seat class the totals belong to.
+        sold: The number of tickets held by active (pending or confirmed) bookings.
+        cancelled: The number of tickets released by cancellations.
+        revenue: The value of the sold tickets at the current seat class price.
+    """
+    flight = models.ForeignKey('flights.Flight', on_delete=models.CASCADE, related_name='sales_rollups')
+    seat_class = models.CharField(max_length=20, choices=Booking.SEAT_CLASS_CHOICES)
+    sold = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        """Returns the string representation of the rollup.
+
+        Returns:
+            str: The flight and seat class of the rollup.
+        """
+        return f"{self.flight_id} {self.seat_class} sales"
+
+    class Meta:
+        db_table = 'FlightSalesRollup'
+        constraints = [
+            models.UniqueConstraint(fields=['flight', 'seat_class'], name='unique_flight_sales_rollup'),
+        ]
+
+class SeatInventory(models.Model):
+    """Holds the seat counters of a flight for one seat class.
+
+    The counters are changed by bookings.ledger with conditional UPDATEs, so the
+    availability of a flight can be read without counting its tickets.
+
+    Attributes:
+        flight: The flight the counters belong to.
+        seat_class: The seat class the counters belong to.
+        capacity: The number of seats of the class on the flight's aircraft.
+        held: The number of seats held by pending bookings.
+        sold: The number of seats sold to confirmed bookings.
+    """
+    flight = models.ForeignKey('flights.Flight', on_delete=models.CASCADE, related_name='seat_inventory')
+    seat_class = models.CharField(max_length=20, choices=Booking.SEAT_CLASS_CHOICES)
+    capacity = models.PositiveIntegerField(default=0)
+    held = models.PositiveIntegerField(default=0)
+    sold = models.PositiveIntegerField(default=0)
+
+    def available(self):
+        """Returns the number of seats that can still be booked.
+
+        Returns:
+            int: The unbooked seats, never below zero.
+        """
+        return max(self.capacity - self.held - self.sold, 0)
+
+    def __str__(self):
+        """Returns the string representation of the inventory.
+
+        Returns:
+            str: The flight and seat class of the inventory.
+        """
+        return f"{self.flight_id} {self.seat_class} inventory"
+
+    class Meta:
+        db_table = 'SeatInventory'
+        constraints = [
+            models.UniqueConstraint(fields=['flight', 'seat_class'], name='unique_seat_inventory'),
+        ]
+
+class SeatClaim(models.Model):
+    """Reserves a seat on a flight for an active booking.
+
+    The unique constraint on (flight, seat_number) makes the database reject a
+    second claim on the same seat, so concurrent bookings cannot double-sell it.
+    Claims are removed by bookings.ledger when their tickets or booking are
+    cancelled.
+
+    A claim without a booking is a short reservation made by automatic seat
+    assignment for a visitor who has not entered passenger details yet. It
+    belongs to the session of that visitor, is turned into a booking claim by
+    the booking of the same session and lapses at expires_at.
+
+    Attributes:
+        flight: The flight the seat belongs to.
+        seat_number: The claimed seat number (e.g., '12A').
+        booking: The booking holding the seat, or None for a reservation.
+        holder: The session key holding a reservation.
+        expires_at: When a reservation lapses.
+    """
+    flight = models.ForeignKey('flights.Flight', on_delete=models.CASCADE, related_name='seat_claims')
+    seat_number = models.CharField(max_length=10)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='seat_claims', null=True, blank=True)
+    holder = models.CharField(max_length=40, blank=True, default='')
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """Returns the string representation of the claim.
+
+        Returns:
+            str: The flight and seat number of the claim.
+        """
+        return f"{self.flight_id} seat {self.seat_number}"
+
+    class Meta:
+        db_table = 'SeatClaim'
+        constraints = [
+            models.UniqueConstraint(fields=['flight', 'seat_number'], name='unique_seat_claim'),
+        ]
+
+
+
+class IdempotencyKey(models.Model):
+    """Remembers the outcome of a request sent with an idempotency key.
+
+    A client that retries a request with the same key gets the stored response
+    instead of running the request again (see bookings.idempotency). The
+    unique constraint on (user, scope, key) lets exactly one of several
+    concurrent retries run the request.
+
+    Attributes:
+        user: The user who sent the request.
+        scope: The view the key was used for (e.g., 'create_booking').
+        key: The key sent by the client.
+        status_code: The status of the stored response, or None while the
+            request is still running.
+        content_type: The content type of the stored response.
+        location: The Location header of a stored redirect.
+        content: The body of the stored response.
+        created_at: When the key was first used.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    location = models.CharField(max_length=500, blank=True, default='')
+    content = models.BinaryField(blank=True, default=b'')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        """Returns the string representation of the key.
+
+        Returns:
+            str: The scope and key.
+        """
+        return f"{self.scope} {self.key}"
+
+    class Meta:
+        db_table = 'IdempotencyKey'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
@@ -0,0 +1,247 @@
+"""PDF rendering off the request thread.
+
+xhtml2pdf spends hundreds of milliseconds of pure CPU on a page, so PDFs are
+rendered by a pool of PDF_RENDER_WORKERS worker processes instead of the web
+workers that serve requests. Templates are rendered to HTML by the caller,
+which has the database; the workers only turn HTML into PDF files.
+
+Workers are started with 'spawn', so they do not inherit the threads, locks
+or database connections of the web process. With PDF_RENDER_WORKERS set to 0
+PDFs are rendered in the calling thread, which suits tests and development.
+
+A worker that dies, e.g. killed for its memory, breaks the whole pool: its
+jobs fail with BrokenExecutor. A broken pool is replaced by a new one for
+the next job.
+
+A file is written under a temporary name and moved into place, so a reader
+never sees half a PDF. The same path submitted twice while it is rendering
+shares one job. Large documents can be split and rendered in parallel with
+render_many.
+
+The pool serves its jobs in order, so the parts of a large document would
+queue e-tickets behind them for minutes. render_many therefore keeps at most
+PDF_RENDER_WORKERS - 1 parts in the pool at a time, across all callers,
+which leaves a worker for the e-tickets.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+
+
+class PdfRenderError(Exception):
+    """Raised when xhtml2pdf cannot render a document."""
+
+
+_executor = None
+_executor_workers = None
+_pending = {}
+_lock = threading.RLock()
+_parts_in_pool = 0
+_part_done = threading.Condition(_lock)
+
+
+def render_pdf(html):
+    """Renders HTML to PDF in the current process.
+
+    Args:
+        html (str): The HTML document.
+
+    Returns:
+        bytes: The PDF document.
+
+    Raises:
+        PdfRenderError: If xhtml2pdf reports errors.
+    """
+    from xhtml2pdf import pisa
+
+    output = BytesIO()
+    status = pisa.CreatePDF(html, dest=output)
+    if status.err:
+        raise PdfRenderError(f"xhtml2pdf reported {status.err} error(s)")
+    return output.getvalue()
+
+
+def render_to_file(html, path, replaces=()):
+    """Renders HTML to a PDF file in the current process.
+
+    Args:
+        html (str): The HTML document.
+        path (str): Where to write the PDF.
+        replaces (iterable, optional): Older files to delete once the new one is in place.
+
+    Returns:
+        str: The path of the PDF.
+
+    Raises:
+        PdfRenderError: If xhtml2pdf reports errors.
+    """
+    return write_file(render_pdf(html), path, replaces)
+
+
+def write_file(content, path, replaces=()):
+    """Writes a PDF under a temporary name and moves it into place.
+
+    Args:
+        content (bytes): The PDF document.
+        path (str): Where to write the PDF.
+        replaces (iterable, optional): Older files to delete once the new one is in place.
+
+    Returns:
+        str: The path of the PDF.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as output:
+        output.write(content)
+    os.replace(temporary, path)
+    for old in replaces:
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def _get_executor():
+    """Returns the process pool of this process, creating it on first use or after it broke."""
+    global _executor, _executor_workers
+    workers = settings.PDF_RENDER_WORKERS
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        _executor_workers = workers
+    return _executor
+
+
+def _discard(executor):
+    """Drops a broken pool, so the next job starts a new one."""
+    global _executor, _executor_workers
+    with _lock:
+        if _executor is executor:
+            _executor, _executor_workers = None, None
+    executor.shutdown(wait=False)
+
+
+def _discard_if_broken(executor):
+    """Returns a callback that drops the pool of a job that failed because the pool broke."""
+    def callback(future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenExecutor):
+            _discard(executor)
+    return callback
+
+
+def _submit(fn, *args):
+    """Submits a job to the pool, replacing the pool once if it broke while idle."""
+    executor = _get_executor()
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenExecutor:
+        _discard(executor)
+        executor = _get_executor()
+        future = executor.submit(fn, *args)
+    future.add_done_callback(_discard_if_broken(executor))
+    return future
+
+
+def shutdown():
+    """Stops the worker pool of this process, waiting for the jobs it is running."""
+    global _executor, _executor_workers
+    with _lock:
+        executor, _executor, _executor_workers = _executor, None, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _forget(path):
+    """Returns a callback that drops a finished job from the pending jobs."""
+    def callback(future):
+        with _lock:
+            if _pending.get(path) is future:
+                del _pending[path]
+    return callback
+
+
+def submit(html, path, replaces=()):
+    """Renders HTML to a PDF file in the worker pool.
+
+    Args:
+        html (str): The HTML document.
+        path (str): Where to write the PDF.
+        replaces (iterable, optional): Older files to delete once the new one is in place.
+
+    Returns:
+        Future: Resolves to the path of the PDF, or raises PdfRenderError, or
+            BrokenExecutor if a worker died.
+    """
+    with _lock:
+        future = _pending.get(path)
+        if future is not None:
+            return future
+        if settings.PDF_RENDER_WORKERS > 0:
+            future = _submit(render_to_file, html, path, tuple(replaces))
+            _pending[path] = future
+            future.add_done_callback(_forget(path))
+            return future
+
+    future = Future()
+    try:
+        future.set_result(render_to_file(html, path, replaces))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def render_many(htmls):
+    """Renders several HTML documents to PDF in parallel in the worker pool.
+
+    Args:
+        htmls (iterable): The HTML documents.
+
+    Returns:
+        list: The PDF documents as bytes, in the order of the HTML documents.
+
+    Raises:
+        PdfRenderError: If xhtml2pdf reports errors for any of the documents.
+        BrokenExecutor: If a worker died while rendering.
+    """
+    if settings.PDF_RENDER_WORKERS <= 0:
+        return [render_pdf(html) for html in htmls]
+    futures = []
+    try:
+        for html in htmls:
+            futures.append(_submit_part(html))
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _part_limit():
+    """Returns how many parts of documents may be in the pool at a time."""
+    return max(1, settings.PDF_RENDER_WORKERS - 1)
+
+
+def _release_part(future):
+    """Frees the place in the pool of a finished part."""
+    global _parts_in_pool
+    with _part_done:
+        _parts_in_pool -= 1
+        _part_done.notify_all()
+
+
+def _submit_part(html):
+    """Submits one part of a document once there is room for it in the pool."""
+    global _parts_in_pool
+    with _part_done:
+        while _parts_in_pool >= _part_limit():
+            _part_done.wait()
+        future = _submit(render_pdf, html)
+        _parts_in_pool += 1
+    future.add_done_callback(_release_part)
+    return future
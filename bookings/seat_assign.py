@@ -0,0 +1,171 @@
+"""Automatic seat assignment for a party.
+
+find_seats searches the seat map of a cabin for the best free block for a
+party, working on the seat grid and the bitmap only:
+
+1. Seats side by side in one row, preferring blocks that do not cross an
+   aisle, then blocks with a window or aisle seat if one was asked for, then
+   rows further forward.
+2. Otherwise the fewest consecutive rows that seat the whole party, filling
+   the longest free runs of each row first.
+
+assign_seats reserves the chosen seats for the session in one step through
+bookings.ledger. If another booking wins one of the seats in the meantime the
+map is rebuilt and the search runs again, at most ASSIGN_ATTEMPTS times.
+"""
+import functools
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import ledger
+from .seat_map import seat_map
+
+
+ASSIGN_ATTEMPTS = 3
+MAX_PARTY = 9
+PREFERENCES = ('window', 'aisle')
+
+
+@functools.lru_cache(maxsize=64)
+def _cabin_rows(grid, seat_class):
+    """Returns the seats of each row of a cabin with their aisle group.
+
+    Grids are immutable, so this is worked out once per grid and cabin.
+
+    Returns:
+        tuple: For each row, front to back, a tuple of (seat, group) pairs
+            where group counts the aisles to the left of the seat.
+    """
+    rows = []
+    for row in grid.cabin_rows(seat_class):
+        group, cells = 0, []
+        for seat in row.cells:
+            if seat is None:
+                group += 1
+            else:
+                cells.append((seat, group))
+        rows.append(tuple(cells))
+    return tuple(rows)
+
+
+def _free_rows(seats):
+    """Returns the free seats of each row of a cabin, split at the aisles.
+
+    Args:
+        seats (SeatMap): The seat map of the cabin.
+
+    Returns:
+        list: For each row, front to back, a list of (seat, group, free) tuples.
+    """
+    taken = int.from_bytes(seats.bits, 'little')
+    return [
+        [(seat, group, not taken >> seat.cabin_index & 1) for seat, group in cells]
+        for cells in _cabin_rows(seats.grid, seats.seat_class)
+    ]
+
+
+def _same_row(rows, party_size, preference):
+    """Returns the best block of free seats side by side in one row, or None."""
+    best = None
+    for r, cells in enumerate(rows):
+        run = 0
+        for end, (_, _, free) in enumerate(cells):
+            run = run + 1 if free else 0
+            if run < party_size:
+                continue
+            block = cells[end - party_size + 1:end + 1]
+            crossings = block[-1][1] - block[0][1]
+            missed = bool(preference) and not any(getattr(seat, preference) for seat, _, _ in block)
+            score = (crossings, missed, r, end)
+            if best is None or score < best[0]:
+                best = (score, block)
+        if best is not None and best[0][:2] == (0, False):
+            break
+    return [seat.number for seat, _, _ in best[1]] if best else None
+
+
+def _runs(cells):
+    """Returns the runs of free seats of a row within one aisle group, longest first."""
+    runs, run = [], []
+    for seat, group, free in cells:
+        if run and (not free or group != run[-1][1]):
+            runs.append(run)
+            run = []
+        if free:
+            run.append((seat, group))
+    if run:
+        runs.append(run)
+    return sorted(runs, key=len, reverse=True)
+
+
+def _consecutive_rows(rows, party_size):
+    """Returns the free seats of the fewest consecutive rows that seat a party, or None."""
+    free = [sum(1 for _, _, is_free in cells if is_free) for cells in rows]
+    if sum(free) < party_size:
+        return None
+    for span in range(2, len(rows) + 1):
+        for start in range(len(rows) - span + 1):
+            if sum(free[start:start + span]) < party_size:
+                continue
+            chosen = []
+            for cells in rows[start:start + span]:
+                for run in _runs(cells):
+                    chosen.extend(seat.number for seat, _ in run)
+            return chosen[:party_size]
+    return None
+
+
+def find_seats(seats, party_size, preference=None):
+    """Finds the best free seats of a cabin for a party.
+
+    Args:
+        seats (SeatMap): The seat map of the cabin.
+        party_size (int): The number of seats to find.
+        preference (str, optional): 'window' or 'aisle', to favour blocks
+            that include such a seat.
+
+    Returns:
+        list: The seat numbers, front to back and left to right, or None if
+            the cabin has too few free seats.
+    """
+    rows = _free_rows(seats)
+    return _same_row(rows, party_size, preference) or _consecutive_rows(rows, party_size)
+
+
+def assign_seats(flight, seat_class, party_size, holder, preference=None):
+    """Finds and reserves the best free seats of a cabin for a party.
+
+    Seats the holder already reserved on the flight count as free, since the
+    new reservation replaces them.
+
+    Args:
+        flight (Flight): The flight.
+        seat_class (str): The seat class (e.g., 'Economy').
+        party_size (int): The number of seats to assign.
+        holder (str): The session key to reserve the seats for.
+        preference (str, optional): 'window' or 'aisle'.
+
+    Returns:
+        tuple: The reserved seat numbers and the time the reservation lapses.
+
+    Raises:
+        ValidationError: If the seat class is invalid.
+        SeatsUnavailable: If the cabin has too few free seats.
+        SeatTaken: If the chosen seats kept being taken by other bookings.
+    """
+    expires_at = timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+    own = ledger.reserved_seats(flight, holder)
+    for attempt in range(ASSIGN_ATTEMPTS):
+        seats = seat_map(flight, seat_class, fresh=attempt > 0)
+        seats.mark(own, taken=False)
+        chosen = find_seats(seats, party_size, preference)
+        if chosen is None:
+            raise ledger.SeatsUnavailable()
+        try:
+            ledger.reserve_seats(flight, holder, chosen, expires_at)
+        except ledger.SeatTaken:
+            continue
+        return chosen, expires_at
+    raise ledger.SeatTaken(chosen)
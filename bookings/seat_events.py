@@ -0,0 +1,249 @@
+"""Live seat events: claims and releases pushed to open seat selection pages.
+
+Once a transaction that claims or releases seats commits, bookings.seat_map
+publishes a seat event for the flight through the broker configured by
+SEAT_EVENTS_BACKEND. The seat_events view streams the events of one flight to
+the browser as Server-Sent Events, so it needs an ASGI server to hold many
+connections open.
+
+A broker has two methods:
+
+- publish(flight_id, message): called from synchronous code after commit; must
+  not block. The message is already in the Server-Sent Events format, so it
+  is encoded once however many pages listen.
+- subscribe(flight_id): returns a subscription with an async get() that
+  returns the next message, None for a heartbeat or OVERFLOW if messages
+  were dropped, and a close() method.
+
+InProcessBroker, the default, delivers to the subscribers of the current
+process only, which is enough on a single node. Several nodes need a broker
+backed by a shared channel (e.g. Redis pub/sub) with the same two methods.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+OVERFLOW = object()
+
+
+class Subscription:
+    """The seat events of one flight for one listener.
+
+    Attributes:
+        flight_id: The flight number the listener follows.
+        loop: The event loop the listener runs on.
+        overflowed: Whether events were dropped because the listener fell behind.
+    """
+
+    def __init__(self, broker, flight_id):
+        """Initializes a subscription on the running event loop.
+
+        Args:
+            broker (InProcessBroker): The broker delivering the events.
+            flight_id (str): The flight number to follow.
+        """
+        self.broker = broker
+        self.flight_id = flight_id
+        self.loop = asyncio.get_running_loop()
+        self.overflowed = False
+        self._events = deque()
+        self._waiter = None
+
+    def offer(self, message):
+        """Queues a message and wakes the listener; runs on the loop of the subscription."""
+        if self.overflowed:
+            return
+        if len(self._events) >= QUEUE_SIZE:
+            self.overflowed = True
+        else:
+            self._events.append(message)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self):
+        """Waits for the next message.
+
+        Returns:
+            The message, None for a heartbeat, or OVERFLOW if the subscription
+            dropped messages.
+        """
+        while not self._events and not self.overflowed:
+            self._waiter = self.loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        if self.overflowed:
+            return OVERFLOW
+        return self._events.popleft()
+
+    def close(self):
+        """Stops receiving events."""
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Delivers seat events to the subscribers of this process.
+
+    Waiting listeners cost no timers: one heartbeat per event loop wakes all
+    of its subscriptions every heartbeat seconds instead.
+    """
+
+    def __init__(self, heartbeat=HEARTBEAT_SECONDS):
+        """Initializes a broker without subscribers.
+
+        Args:
+            heartbeat (float, optional): Seconds between heartbeats.
+        """
+        self.heartbeat = heartbeat
+        self._subscribers = defaultdict(set)
+        self._by_loop = defaultdict(set)
+        self._beating = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, flight_id):
+        """Starts following the seat events of a flight.
+
+        Must be called from a coroutine; events are delivered on its loop.
+
+        Args:
+            flight_id (str): The flight number.
+
+        Returns:
+            Subscription: The new subscription.
+        """
+        subscription = Subscription(self, flight_id)
+        with self._lock:
+            self._subscribers[flight_id].add(subscription)
+            self._by_loop[subscription.loop].add(subscription)
+            start_beating = subscription.loop not in self._beating
+            self._beating.add(subscription.loop)
+        if start_beating:
+            subscription.loop.call_later(self.heartbeat, self._beat, subscription.loop)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stops delivering events to a subscription."""
+        with self._lock:
+            for index, key in ((self._subscribers, subscription.flight_id), (self._by_loop, subscription.loop)):
+                subscribers = index.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del index[key]
+
+    def subscriber_count(self, flight_id=None):
+        """Returns the number of subscriptions, of one flight or of all."""
+        with self._lock:
+            if flight_id is not None:
+                return len(self._subscribers.get(flight_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, flight_id, message):
+        """Delivers a message to every subscriber of a flight.
+
+        Subscribers are grouped by event loop, so a message costs one wake-up
+        per loop however many listeners there are.
+
+        Args:
+            flight_id (str): The flight number.
+            message (str): The Server-Sent Events message.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(flight_id, ()))
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, group, message)
+            except RuntimeError:
+                # The loop has closed; its subscriptions are gone with it.
+                for subscription in group:
+                    self.unsubscribe(subscription)
+
+    def _beat(self, loop):
+        """Sends a heartbeat to the subscriptions of a loop and schedules the next one."""
+        with self._lock:
+            subscribers = list(self._by_loop.get(loop, ()))
+            if not subscribers:
+                self._beating.discard(loop)
+                return
+        _deliver(subscribers, None)
+        loop.call_later(self.heartbeat, self._beat, loop)
+
+
+def _deliver(subscriptions, message):
+    """Queues a message for subscriptions sharing one loop."""
+    for subscription in subscriptions:
+        subscription.offer(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Returns the broker of this process, creating it from SEAT_EVENTS_BACKEND on first use."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.SEAT_EVENTS_BACKEND)()
+    return _broker
+
+
+def publish(flight_id, seat_numbers, taken):
+    """Announces seats of a flight that were claimed or released.
+
+    Args:
+        flight_id (str): The flight number.
+        seat_numbers (list): The seat numbers.
+        taken (bool): Whether the seats were claimed or released.
+    """
+    if seat_numbers:
+        get_broker().publish(flight_id, format_event({'seats': list(seat_numbers), 'taken': taken}))
+
+
+def format_event(event):
+    """Returns a seat event in the Server-Sent Events wire format."""
+    return f"event: seats\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(flight_id, broker=None):
+    """Yields the seat events of a flight as Server-Sent Events.
+
+    Heartbeats become comment lines so proxies keep the connection open. A
+    listener that falls behind gets a 'reset' event and the stream ends; the
+    page reloads the seat map.
+
+    Args:
+        flight_id (str): The flight number.
+        broker (optional): The broker to subscribe to. Defaults to get_broker().
+
+    Yields:
+        str: The next chunk of the stream.
+    """
+    subscription = (broker or get_broker()).subscribe(flight_id)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while True:
+            message = await subscription.get()
+            if message is None:
+                yield ": keep-alive\n\n"
+            elif message is OVERFLOW:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            else:
+                yield message
+    finally:
+        subscription.close()
@@ -0,0 +1,194 @@
+"""Compact seat maps: one bit per seat of a cabin, set when the seat is claimed.
+
+Seats are numbered within their cabin by the seat grid of the aircraft
+(flights.seat_grid), front to back and left to right, as seat_selection draws
+them. The n-th seat of a cabin is bit n of that cabin's map, so checking a
+seat is a constant-time bit test and a map is ceil(seats / 8) bytes whatever
+the number of bookings.
+
+Maps are built from the SeatClaim rows of the flight, lapsed reservations
+aside, and cached. The booking
+ledger flips their bits once its claims and releases commit. A map also expires
+after MAP_TIMEOUT, which corrects any drift from concurrent updates. It is
+rebuilt when the seat grid of the aircraft is not the one it was built for.
+The same commit hooks push the change to open seat selection pages (see
+bookings.seat_events) and bump the version stamp of the flight that validates
+cached copies of them (see flights.page_versions).
+"""
+import base64
+import math
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from flights.page_versions import flight_changed
+from flights.seat_grid import CABIN_ORDER, cached_grid, seat_grid
+from . import seat_events
+from .models import SeatClaim
+
+
+MAP_TIMEOUT = 300
+
+
+class SeatMap:
+    """The claimed seats of one cabin of a flight as a bitset.
+
+    Attributes:
+        grid: The seat grid of the aircraft.
+        seat_class: The seat class of the cabin.
+        bits: One bit per seat of the cabin, least significant bit first.
+    """
+
+    def __init__(self, grid, seat_class, bits=None):
+        """Initializes a seat map, empty unless bits are given.
+
+        Args:
+            grid (SeatGrid): The seat grid of the aircraft.
+            seat_class (str): The seat class of the cabin.
+            bits (bytes, optional): The bitset of an existing map.
+        """
+        self.grid = grid
+        self.seat_class = seat_class
+        self.bits = bytearray(bits) if bits is not None else bytearray(math.ceil(self.size / 8))
+
+    @property
+    def size(self):
+        """The number of seats of the cabin."""
+        return self.grid.capacity(self.seat_class)
+
+    def index(self, seat_number):
+        """Returns the bit of a seat, or None if the seat is not in the cabin.
+
+        Args:
+            seat_number (str): A seat number such as '12C'.
+
+        Returns:
+            int: The position of the seat in the bitset, or None.
+        """
+        seat = self.grid.seat(seat_number)
+        if seat is None or seat.seat_class != self.seat_class:
+            return None
+        return seat.cabin_index
+
+    def is_taken(self, seat_number):
+        """Returns whether a seat of the cabin is claimed.
+
+        Args:
+            seat_number (str): A seat number such as '12C'.
+
+        Returns:
+            bool: True if the seat is claimed, False if it is free or not in the cabin.
+        """
+        i = self.index(seat_number)
+        return i is not None and bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def mark(self, seat_numbers, taken=True):
+        """Sets or clears the bits of seats; seats outside the cabin are ignored.
+
+        Args:
+            seat_numbers (list): The seat numbers.
+            taken (bool, optional): Whether the seats are now claimed.
+        """
+        for seat_number in seat_numbers:
+            i = self.index(seat_number)
+            if i is None:
+                continue
+            if taken:
+                self.bits[i >> 3] |= 1 << (i & 7)
+            else:
+                self.bits[i >> 3] &= ~(1 << (i & 7))
+
+    def taken_count(self):
+        """Returns the number of claimed seats of the cabin."""
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def encode(self):
+        """Returns the bitset as base64 text, e.g. for the seat selection page."""
+        return base64.b64encode(bytes(self.bits)).decode()
+
+    def as_dict(self):
+        """Returns the map in the form the seat selection page reads.
+
+        Returns:
+            dict: The 'seat_class', number of 'seats' and base64 'bitmap' of the map.
+        """
+        return {'seat_class': self.seat_class, 'seats': self.size, 'bitmap': self.encode()}
+
+
+def _key(flight_number, seat_class):
+    """Returns the cache key of the seat map of a cabin."""
+    return f"seat-map:{flight_number}:{seat_class}"
+
+
+def seat_map(flight, seat_class, fresh=False):
+    """Returns the seat map of a cabin of a flight, from the cache when possible.
+
+    Args:
+        flight (Flight): The flight.
+        seat_class (str): The seat class (e.g., 'Economy', 'Business', 'First').
+        fresh (bool, optional): Whether to rebuild the map from the seat
+            claims even if it is cached.
+
+    Returns:
+        SeatMap: The claimed seats of the cabin.
+
+    Raises:
+        ValidationError: If the seat class is invalid.
+    """
+    if seat_class not in CABIN_ORDER:
+        raise ValidationError("Invalid seat class")
+    grid = seat_grid(flight.aircraft)
+
+    cached = None if fresh else cache.get(_key(flight.pk, seat_class))
+    if cached is not None and cached[0] == grid.key:
+        return SeatMap(grid, seat_class, cached[1])
+
+    seats = SeatMap(grid, seat_class)
+    claims = SeatClaim.objects.filter(flight=flight).exclude(expires_at__lte=timezone.now())
+    seats.mark(claims.values_list('seat_number', flat=True))
+    cache.set(_key(flight.pk, seat_class), (grid.key, bytes(seats.bits)), timeout=MAP_TIMEOUT)
+    return seats
+
+
+def _update(flight_id, seat_numbers, taken):
+    """Flips the bits of seats in every cached cabin map of a flight and announces the change."""
+    for seat_class in CABIN_ORDER:
+        key = _key(flight_id, seat_class)
+        cached = cache.get(key)
+        if cached is None:
+            continue
+        grid = cached_grid(cached[0])
+        if grid is None:
+            cache.delete(key)
+            continue
+        seats = SeatMap(grid, seat_class, cached[1])
+        seats.mark(seat_numbers, taken)
+        cache.set(key, (grid.key, bytes(seats.bits)), timeout=MAP_TIMEOUT)
+    flight_changed(flight_id)
+    seat_events.publish(flight_id, seat_numbers, taken)
+
+
+def seats_claimed(flight_id, seat_numbers):
+    """Marks seats as claimed in the cached maps of a flight once the transaction commits.
+
+    Args:
+        flight_id (str): The flight number.
+        seat_numbers (list): The claimed seat numbers.
+    """
+    seat_numbers = list(seat_numbers)
+    if seat_numbers:
+        transaction.on_commit(lambda: _update(flight_id, seat_numbers, True))
+
+
+def seats_released(flight_id, seat_numbers):
+    """Marks seats as free in the cached maps of a flight once the transaction commits.
+
+    Args:
+        flight_id (str): The flight number.
+        seat_numbers (list): The released seat numbers.
+    """
+    seat_numbers = list(seat_numbers)
+    if seat_numbers:
+        transaction.on_commit(lambda: _update(flight_id, seat_numbers, False))
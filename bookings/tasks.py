@@ -1,25 +1,49 @@
-from django.utils import timezone
-from datetime import timedelta
-from bookings.models import Booking
+from bookings.expiry import expire_due_holds
+from bookings.idempotency import delete_expired_keys
+from flights.report_exports import delete_expired_exports
 
 def delete_expired_bookings():
     """Identifies and cancels expired pending bookings to release seats.
 
-    Finds bookings that have been in 'Pending' status for more than the allowed
-    duration (e.g., 5 minutes) and marks them as 'Cancelled'.
+    Cancels one bounded batch of 'Pending' bookings whose hold_expires_at
+    deadline has passed and releases their seats.
+
+    Returns:
+        int: The number of bookings cancelled.
     """
-    cutoff_time = timezone.now() - timedelta(minutes=5)
-    
-    expired_bookings = Booking.objects.filter(
-        status='Pending',
-        booking_date__lt=cutoff_time
-    )
-    
-    count = expired_bookings.count()
-    
-    if count > 0:
+    count = expire_due_holds()
 
-        expired_bookings.update(status='Cancelled')
+    if count > 0:
         print(f"[Auto-Scheduler] Cancelled {count} expired bookings. Seats released.")
     else:
-        print("[Auto-Scheduler] No expired bookings found.")
\ No newline at end of file
+        print("[Auto-Scheduler] No expired bookings found.")
+
+    return count
+
+
+def delete_expired_idempotency_keys():
+    """Deletes the idempotency keys whose stored responses are no longer replayed.
+
+    Returns:
+        int: The number of keys deleted.
+    """
+    count = delete_expired_keys()
+
+    if count > 0:
+        print(f"[Auto-Scheduler] Deleted {count} expired idempotency keys.")
+
+    return count
+
+
+def delete_expired_report_exports():
+    """Deletes the report exports whose PDFs are no longer kept.
+
+    Returns:
+        int: The number of exports deleted.
+    """
+    count = delete_expired_exports()
+
+    if count > 0:
+        print(f"[Auto-Scheduler] Deleted {count} expired report exports.")
+
+    return count
@@ -0,0 +1,85 @@
+"""Shared fixtures of the booking and flight tests."""
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from flights.models import Aircraft, Airport, Flight
+from users.models import PassengerProfile
+from .holds import hold_seats
+from .models import Ticket
+
+
+class FlightTestCase(TestCase):
+    """A test case with a flight from Riyadh to Dubai ten days out and a passenger.
+
+    Subclasses pick the flight number, further fields of the flight such as
+    its prices, the seat counts of the aircraft and the username of the
+    passenger. With flight_number or username set to
+    None, setUp creates no flight or no passenger.
+    """
+
+    flight_number = 'SV100'
+    aircraft_model = "Airbus A320"
+    flight_fields = {}
+    seats = {'first_class': 6, 'business_class': 12, 'economy_class': 60}
+    username = 'passenger'
+
+    def setUp(self):
+        """Sets up the airports, the aircraft, the flight and the passenger."""
+        self.origin = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        self.destination = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai",
+                                                  country="UAE")
+        self.aircraft = Aircraft.objects.create(model=self.aircraft_model, **self.seats)
+        self.departure = timezone.now() + timedelta(days=10)
+        self.flight = None
+        if self.flight_number:
+            self.flight = Flight.objects.create(
+                flight_number=self.flight_number, aircraft=self.aircraft,
+                departure_datetime=self.departure, arrival_datetime=self.departure + timedelta(hours=2),
+                departure_airport=self.origin, arrival_airport=self.destination, **self.flight_fields
+            )
+        self.profile = None
+        if self.username:
+            user = User.objects.create_user(username=self.username, password='password')
+            self.profile = PassengerProfile.objects.create(user=user)
+
+    def create_flights(self, first_number, count, **fields):
+        """Creates flights on the route an hour apart, numbered from SV<first_number>.
+
+        Args:
+            first_number (int): The number of the first flight.
+            count (int): The number of flights to create.
+            **fields: Further fields of every flight, e.g. prices.
+
+        Returns:
+            list: The flights, in departure order.
+        """
+        return Flight.objects.bulk_create([
+            Flight(flight_number=f"SV{first_number + i}", aircraft=self.aircraft,
+                   departure_airport=self.origin, arrival_airport=self.destination,
+                   departure_datetime=self.departure + timedelta(hours=i),
+                   arrival_datetime=self.departure + timedelta(hours=i + 2), **fields)
+            for i in range(count)
+        ])
+
+    def hold(self, *seats, seat_class='Economy', passenger=None, holder=''):
+        """Holds seats on the flight through hold_seats and runs the commit callbacks of the hold.
+
+        Args:
+            *seats (str): The seat numbers to hold.
+            seat_class (str, optional): The cabin of the seats. Defaults to 'Economy'.
+            passenger (PassengerProfile, optional): Who holds them. Defaults to the passenger of the test.
+            holder (str, optional): The session key making the booking, whose reserved seats it may take.
+
+        Returns:
+            Booking: The pending booking.
+        """
+        tickets = [
+            Ticket(seat_number=seat, passenger_name='Test Passenger', passport='P12345678',
+                   nationality='1010101010', passenger_dob=date(1990, 1, 1))
+            for seat in seats
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            return hold_seats(self.flight, seat_class, passenger or self.profile, tickets, holder=holder)
@@ -1,15 +1,39 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from unittest.mock import patch
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import date, timedelta
 from decimal import Decimal
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from io import StringIO
+import asyncio
+from concurrent.futures import BrokenExecutor
+from concurrent.futures.process import BrokenProcessPool
+import base64
+import os
+import tempfile
 
-from bookings.models import Booking, Ticket
+from bookings import ledger
+from bookings.expiry import HoldDeadlines, expire_due_holds
+from bookings.group_booking import InvalidPassengers, parse_passengers, validate_passengers
+from bookings.holds import hold_seats
+from bookings import etickets, idempotency, pdf_render
+from bookings.seat_assign import assign_seats, find_seats
+from bookings import seat_events
+from bookings.seat_map import SeatMap, seat_map
+from bookings.testing import FlightTestCase
+from bookings.updater import LeaderLock, should_autostart
+from bookings.models import Booking, Ticket, FlightSalesRollup, IdempotencyKey, SeatInventory, SeatClaim
+from bookings.tasks import delete_expired_bookings
 from bookings.forms import TicketForm
 from users.models import PassengerProfile
-from flights.models import Flight, Aircraft, Airport
+from flights.models import Flight, Aircraft, Airport, CabinLayout
+from flights.seat_grid import seat_grid
+from payments.models import Payment
 
 class BookingModelTests(TestCase):
     """Tests for the Booking and Ticket models."""
@@ -223,7 +247,7 @@ class BookingFlowTests(TestCase):
         url = reverse('seat_selection', args=[self.flight.flight_number, 'Economy'])
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assertIsNotNone(response.context['eco_range'])
+        self.assertEqual([cabin['seat_class'] for cabin in response.context['cabins']], ['First', 'Business', 'Economy'])
 
     def test_create_booking_process(self):
         """Tests the process of creating a booking.
@@ -341,7 +365,9 @@ class BookingFlowTests(TestCase):
         """
         booking = Booking.objects.create(flight=self.flight, passenger=self.profile, status='Confirmed')
         url = reverse('download_ticket_pdf', args=[booking.booking_id])
-        response = self.client.get(url)
+        with tempfile.TemporaryDirectory() as directory, override_settings(ETICKET_DIR=directory):
+            response = self.client.get(url)
+            response.close()
         
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/pdf')
@@ -370,4 +396,1039 @@ class BookingFlowTests(TestCase):
         # currently the code tries to insert passenger=None which violates DB constraint.
         # We assert it raises an Exception (IntegrityError usually)
         with self.assertRaises(Exception): 
-            self.client.post(url, post_data)
\ No newline at end of file
+            self.client.post(url, post_data)
+
+class SalesRollupTests(TestCase):
+    """Tests that the booking ledger keeps FlightSalesRollup rows in step with bookings."""
+
+    def setUp(self):
+        """Sets up a logged in passenger and a flight."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='flyer', password='password123')
+        self.profile = PassengerProfile.objects.create(user=self.user)
+        self.client.login(username='flyer', password='password123')
+
+        origin = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        dest = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai", country="UAE")
+        aircraft = Aircraft.objects.create(model="Airbus A320", first_class=6, business_class=12, economy_class=60)
+        self.flight = Flight.objects.create(
+            flight_number="SV202", aircraft=aircraft,
+            economy_price=Decimal("100.00"), business_price=Decimal("250.00"), first_class_price=Decimal("500.00"),
+            departure_datetime=timezone.now() + timedelta(days=10),
+            arrival_datetime=timezone.now() + timedelta(days=10, hours=2),
+            departure_airport=origin, arrival_airport=dest
+        )
+
+    def rollup(self, seat_class='Economy'):
+        """Returns the stored rollup of the test flight for a seat class."""
+        return FlightSalesRollup.objects.get(flight=self.flight, seat_class=seat_class)
+
+    def book(self, *seats):
+        """Books seats in economy through the create_booking view and returns the booking."""
+        post_data = {'flight_id': self.flight.flight_number, 'seats_str': ','.join(seats), 'seat_class': 'Economy'}
+        for i, seat in enumerate(seats):
+            post_data.update({
+                f'{seat}-passenger_name': 'Test Passenger',
+                f'{seat}-passport': f'P1234567{i}',
+                f'{seat}-nationality': '1010101010',
+                f'{seat}-passenger_dob': '1990-01-01',
+            })
+        self.client.post(reverse('create_booking'), post_data)
+        return Booking.objects.latest('booking_id')
+
+    def test_create_booking_counts_sold_tickets(self):
+        """Tests that a new booking adds its tickets and revenue to the rollup."""
+        self.book('12A', '12B')
+        rollup = self.rollup()
+        self.assertEqual((rollup.sold, rollup.cancelled), (2, 0))
+        self.assertEqual(rollup.revenue, Decimal("200.00"))
+        self.assertEqual(self.rollup('First').sold, 0)
+
+    def test_cancel_ticket_moves_ticket_to_cancelled(self):
+        """Tests that cancelling tickets releases them from the sold count."""
+        booking = self.book('12A', '12B')
+        for ticket in booking.tickets.all():
+            self.client.post(reverse('cancel_ticket', args=[ticket.ticket_id]))
+
+        rollup = self.rollup()
+        self.assertEqual((rollup.sold, rollup.cancelled), (0, 2))
+        self.assertEqual(rollup.revenue, 0)
+
+    def test_expired_bookings_release_sales(self):
+        """Tests that the expiry task moves the tickets of expired holds to cancelled."""
+        booking = self.book('12A')
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+
+        delete_expired_bookings()
+
+        rollup = self.rollup()
+        self.assertEqual((rollup.sold, rollup.cancelled), (0, 1))
+
+    def test_payment_of_cancelled_booking_restores_sales(self):
+        """Tests that paying for a cancelled hold counts its tickets as sold again."""
+        booking = self.book('12A')
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        delete_expired_bookings()
+
+        self.client.post(reverse('process_payment', args=[booking.booking_id]))
+
+        rollup = self.rollup()
+        self.assertEqual((rollup.sold, rollup.cancelled), (1, 0))
+
+    def test_check_command_detects_and_rebuild_repairs_drift(self):
+        """Tests the drift check and rebuild of the rebuild_rollups command."""
+        self.book('12A')
+        FlightSalesRollup.objects.filter(flight=self.flight, seat_class='Economy').update(sold=7)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup().sold, 1)
+        call_command('rebuild_rollups', check=True, stdout=StringIO())
+
+
+class SeatInventoryTests(TestCase):
+    """Tests for the per-flight seat inventory counters and availability API."""
+
+    def setUp(self):
+        """Sets up a logged in passenger and a flight with two economy seats."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='flyer', password='password123')
+        self.profile = PassengerProfile.objects.create(user=self.user)
+        self.client.login(username='flyer', password='password123')
+
+        self.origin = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        self.dest = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai", country="UAE")
+        self.aircraft = Aircraft.objects.create(model="Tiny Jet", first_class=0, business_class=4, economy_class=2)
+        self.flight = self.create_flight("SV303")
+
+    def create_flight(self, flight_number):
+        """Creates a flight on the test route."""
+        return Flight.objects.create(
+            flight_number=flight_number, aircraft=self.aircraft,
+            economy_price=Decimal("100.00"), business_price=Decimal("250.00"), first_class_price=Decimal("500.00"),
+            departure_datetime=timezone.now() + timedelta(days=10),
+            arrival_datetime=timezone.now() + timedelta(days=10, hours=2),
+            departure_airport=self.origin, arrival_airport=self.dest
+        )
+
+    def book(self, seat, passport='P12345678'):
+        """Books one economy seat through the create_booking view."""
+        return self.client.post(reverse('create_booking'), {
+            'flight_id': self.flight.flight_number, 'seats_str': seat, 'seat_class': 'Economy',
+            f'{seat}-passenger_name': 'Test Passenger', f'{seat}-passport': passport,
+            f'{seat}-nationality': '1010101010', f'{seat}-passenger_dob': '1990-01-01',
+        })
+
+    def inventory(self):
+        """Returns the economy inventory of the test flight."""
+        return SeatInventory.objects.get(flight=self.flight, seat_class='Economy')
+
+    def test_booking_and_payment_move_seats_from_held_to_sold(self):
+        """Tests that a hold is counted as held, then as sold once paid."""
+        self.book('1A')
+        self.assertEqual((self.inventory().held, self.inventory().sold), (1, 0))
+
+        booking = Booking.objects.get()
+        self.client.post(reverse('process_payment', args=[booking.booking_id]))
+        self.assertEqual((self.inventory().held, self.inventory().sold), (0, 1))
+        self.assertEqual(self.flight.seats_available('Economy'), 1)
+
+    def test_booking_rejected_when_class_is_full(self):
+        """Tests that the inventory refuses more tickets than the cabin holds."""
+        self.book('1A')
+        self.book('1B', passport='P22345678')
+        response = self.book('1C', passport='P32345678')
+
+        self.assertRedirects(response, reverse('seat_selection', args=[self.flight.flight_number, 'Economy']),
+                             fetch_redirect_response=False)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(self.flight.seats_available('Economy'), 0)
+
+    def test_cancelled_ticket_releases_seat(self):
+        """Tests that cancelling a ticket returns its seat to the inventory."""
+        self.book('1A')
+        ticket = Ticket.objects.get()
+        self.client.post(reverse('cancel_ticket', args=[ticket.ticket_id]))
+        self.assertEqual(self.flight.seats_available('Economy'), 2)
+
+    def test_seats_available_is_a_single_query(self):
+        """Tests that the availability of a flight is read with one query."""
+        self.book('1A')
+        flight = Flight.objects.get(pk=self.flight.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(flight.seats_available(), 5)
+
+    def test_with_availability_annotates_flights_in_one_query(self):
+        """Tests the bulk availability of a queryset of flights."""
+        self.book('1A')
+        self.create_flight("SV304")
+
+        with self.assertNumQueries(1):
+            flights = {f.flight_number: f for f in Flight.objects.with_availability()}
+
+        self.assertEqual(flights['SV303'].economy_available, 1)
+        self.assertEqual(flights['SV304'].economy_available, 2)
+        self.assertEqual(flights['SV304'].seats_available(), 6)
+
+
+class SeatClaimTests(FlightTestCase):
+    """Tests that a seat can only be held by one active booking at a time."""
+
+    flight_number = 'SV404'
+    aircraft_model = "Tiny Jet"
+    seats = {'first_class': 0, 'business_class': 0, 'economy_class': 10}
+    username = 'first'
+
+    def setUp(self):
+        """Sets up two passengers and a flight with free economy seats."""
+        super().setUp()
+        self.rival = PassengerProfile.objects.create(user=User.objects.create_user(username='second'))
+
+    def test_taken_seat_cannot_be_held_again(self):
+        """Tests that a second hold on a held seat fails and writes nothing."""
+        self.hold('1A', '1B')
+
+        with self.assertRaises(ledger.SeatTaken) as caught:
+            self.hold('1B', '1C', passenger=self.rival)
+
+        self.assertEqual(caught.exception.seats, ['1B'])
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(SeatClaim.objects.count(), 2)
+        self.assertEqual(self.flight.seats_available('Economy'), 8)
+
+    def test_duplicate_seat_in_one_request_is_rejected(self):
+        """Tests that one hold cannot claim the same seat twice."""
+        with self.assertRaises(ledger.SeatTaken):
+            self.hold('1A', '1A')
+        self.assertFalse(Booking.objects.exists())
+
+    def test_seat_missing_from_the_aircraft_is_rejected(self):
+        """Tests that a hold cannot claim a seat that is not on the seat grid of the aircraft."""
+        with self.assertRaises(ledger.InvalidSeats) as caught:
+            self.hold('1A', '9A', '1Z')
+
+        self.assertEqual(caught.exception.seats, ['1Z', '9A'])
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(SeatClaim.objects.exists())
+
+    def test_create_booking_reports_taken_seat(self):
+        """Tests that the booking view tells the passenger the seat was taken."""
+        self.hold('1A', passenger=self.rival)
+        client = Client()
+        client.force_login(self.profile.user)
+
+        response = client.post(reverse('create_booking'), {
+            'flight_id': self.flight.flight_number, 'seats_str': '1A', 'seat_class': 'Economy',
+            '1A-passenger_name': 'Test Passenger', '1A-passport': 'P22345678',
+            '1A-nationality': '1010101010', '1A-passenger_dob': '1990-01-01',
+        }, follow=True)
+
+        self.assertContains(response, 'have just been taken')
+        self.assertEqual(Booking.objects.filter(passenger=self.profile).count(), 0)
+
+    def test_expired_hold_frees_its_seats(self):
+        """Tests that a cancelled hold releases its claims for other passengers."""
+        booking = self.hold('1A')
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        delete_expired_bookings()
+
+        self.assertFalse(SeatClaim.objects.filter(booking=booking).exists())
+        self.hold('1A', passenger=self.rival)
+        self.assertEqual(SeatClaim.objects.get().booking.passenger, self.rival)
+
+    def test_paying_for_a_reclaimed_seat_fails(self):
+        """Tests that an expired hold cannot be revived once its seat is taken."""
+        booking = self.hold('1A')
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        delete_expired_bookings()
+        self.hold('1A', passenger=self.rival)
+
+        client = Client()
+        client.force_login(self.profile.user)
+        client.post(reverse('process_payment', args=[booking.booking_id]))
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'Cancelled')
+        self.assertFalse(Payment.objects.filter(booking=booking).exists())
+
+
+class SeatMapTests(FlightTestCase):
+    """Tests for the cached per-cabin seat bitmaps."""
+
+    flight_number = 'SV505'
+    username = 'mapper'
+
+    def setUp(self):
+        """Sets up a three-cabin flight, a passenger and an empty cache."""
+        cache.clear()
+        super().setUp()
+
+    def test_bits_follow_the_seats_of_the_cabin(self):
+        """Tests that the bits of a cabin map follow its seats in the seat grid."""
+        seats = SeatMap(seat_grid(self.aircraft), 'Economy')
+        self.assertEqual(seats.index('4A'), 0)
+        self.assertEqual(seats.index('5C'), 8)
+        self.assertIsNone(seats.index('3F'))
+        self.assertIsNone(seats.index('14A'))
+        self.assertIsNone(seats.index('5Z'))
+        self.assertEqual(len(seats.bits), 8)
+
+    def test_custom_layout_skips_missing_rows(self):
+        """Tests that a map of a cabin layout has no bits for skipped rows or other cabins."""
+        with self.captureOnCommitCallbacks(execute=True):
+            CabinLayout.objects.create(aircraft=self.aircraft, seat_class='Business', first_row=1, last_row=2,
+                                       letters='AC DF')
+            CabinLayout.objects.create(aircraft=self.aircraft, seat_class='Economy', first_row=10, last_row=14,
+                                       letters='ABC DEF', skipped_rows='13')
+        self.flight.aircraft.refresh_from_db()
+        self.hold('14A')
+
+        seats = seat_map(self.flight, 'Economy')
+
+        self.assertEqual(seats.size, 24)
+        self.assertEqual(seats.index('14A'), 18)
+        self.assertTrue(seats.is_taken('14A'))
+        self.assertIsNone(seats.index('13A'))
+        self.assertIsNone(seats.index('1A'))
+        self.assertEqual(len(seats.bits), 3)
+
+    def test_map_holds_claims_of_active_bookings_only(self):
+        """Tests that a map is built from the seat claims, so cancelled bookings free their seats."""
+        self.hold('4A', '5C')
+        cancelled = self.hold('6F')
+        ledger.status_changed(cancelled, 'Cancelled')
+        cancelled.status = 'Cancelled'
+        cancelled.save()
+        self.hold('2B', seat_class='Business')
+
+        seats = seat_map(self.flight, 'Economy')
+
+        self.assertTrue(seats.is_taken('4A'))
+        self.assertTrue(seats.is_taken('5C'))
+        self.assertFalse(seats.is_taken('6F'))
+        self.assertFalse(seats.is_taken('2B'))
+        self.assertEqual(seats.taken_count(), 2)
+        self.assertTrue(seat_map(self.flight, 'Business').is_taken('2B'))
+
+    def test_cached_map_is_updated_in_place(self):
+        """Tests that claims and releases flip bits of the cached map without rebuilding it."""
+        seat_map(self.flight, 'Economy')
+        booking = self.hold('7D')
+
+        with self.assertNumQueries(0):
+            self.assertTrue(seat_map(self.flight, 'Economy').is_taken('7D'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.status_changed(booking, 'Cancelled')
+            booking.status = 'Cancelled'
+            booking.save()
+        with self.assertNumQueries(0):
+            self.assertFalse(seat_map(self.flight, 'Economy').is_taken('7D'))
+
+    def test_map_is_rebuilt_for_a_new_layout(self):
+        """Tests that a cached map built for another aircraft layout is not reused."""
+        self.hold('4A')
+        seat_map(self.flight, 'Economy')
+        self.aircraft.first_class = 0
+        self.aircraft.save()
+
+        seats = seat_map(self.flight, 'Economy')
+
+        self.assertEqual(seats.index('3A'), 0)
+        self.assertTrue(seats.is_taken('4A'))
+
+    def test_invalid_seat_class_is_rejected(self):
+        """Tests that an unknown seat class raises a ValidationError."""
+        with self.assertRaises(ValidationError):
+            seat_map(self.flight, 'Galley')
+
+    def test_seat_selection_sends_a_constant_size_bitmap(self):
+        """Tests that the page carries a bitmap of the booked cabin instead of a list of seats."""
+        client = Client()
+        client.force_login(self.profile.user)
+        url = reverse('seat_selection', args=[self.flight.flight_number, 'Economy'])
+        empty = client.get(url).context['seat_map']
+
+        self.hold('4B', '13F')
+        full = client.get(url).context['seat_map']
+
+        self.assertEqual(len(full['bitmap']), len(empty['bitmap']))
+        bits = base64.b64decode(full['bitmap'])
+        self.assertEqual(bits[0], 0b10)
+        self.assertEqual(bits[7], 0b1000)
+        self.assertNotIn('taken_seats', client.get(url).context)
+
+    def test_passenger_details_rejects_taken_seats(self):
+        """Tests that seats taken since the page was loaded send the passenger back to the seat map."""
+        self.hold('4A')
+        client = Client()
+        client.force_login(self.profile.user)
+
+        response = client.post(reverse('passenger_details'), {
+            'flight_id': self.flight.flight_number, 'selected_seats': '4A,4B', 'seat_class': 'economy',
+        })
+
+        self.assertRedirects(response, reverse('seat_selection', args=[self.flight.flight_number, 'Economy']),
+                             fetch_redirect_response=False)
+
+
+class SeatAssignmentTests(FlightTestCase):
+    """Tests for automatic seat assignment and the reservations it makes."""
+
+    flight_number = 'SV606'
+    username = 'family'
+
+    def setUp(self):
+        """Sets up a three-cabin flight, a passenger and an empty cache."""
+        cache.clear()
+        super().setUp()
+
+    def find(self, party_size, preference=None):
+        """Returns the seats find_seats picks in the economy cabin."""
+        return find_seats(seat_map(self.flight, 'Economy'), party_size, preference)
+
+    def test_party_is_seated_in_one_row_without_crossing_the_aisle(self):
+        """Tests that a block on one side of the aisle beats one across it."""
+        self.hold('4A')
+
+        self.assertEqual(self.find(3), ['4D', '4E', '4F'])
+        self.assertEqual(self.find(4), ['4B', '4C', '4D', '4E'])
+        self.assertEqual(self.find(2, 'aisle'), ['4B', '4C'])
+        self.assertEqual(self.find(1, 'window'), ['4F'])
+
+    def test_large_party_spans_the_fewest_rows(self):
+        """Tests that a party wider than a row fills consecutive rows, longest free runs first."""
+        self.hold('4A', '5D')
+
+        self.assertEqual(self.find(8), ['4D', '4E', '4F', '4B', '4C', '5A', '5B', '5C'])
+        self.assertIsNone(self.find(59))
+
+    def test_assignment_reserves_seats_until_the_booking_takes_them(self):
+        """Tests that reserved seats block other bookings but not the booking of the same session."""
+        with self.captureOnCommitCallbacks(execute=True):
+            seats, _ = assign_seats(self.flight, 'Economy', 2, 'session-1')
+
+        self.assertEqual(seats, ['4A', '4B'])
+        self.assertTrue(seat_map(self.flight, 'Economy').is_taken('4A'))
+        with self.assertRaises(ledger.SeatTaken):
+            self.hold('4A', holder='session-2')
+
+        booking = self.hold('4A', '4B', holder='session-1')
+        self.assertEqual(SeatClaim.objects.get(seat_number='4A').booking, booking)
+        self.assertEqual(ledger.reserved_seats(self.flight, 'session-1'), set())
+
+    def test_new_assignment_replaces_the_previous_one(self):
+        """Tests that assigning again frees the seats the session reserved before."""
+        with self.captureOnCommitCallbacks(execute=True):
+            assign_seats(self.flight, 'Economy', 2, 'session-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            seats, _ = assign_seats(self.flight, 'Economy', 3, 'session-1', 'aisle')
+
+        self.assertEqual(seats, ['4A', '4B', '4C'])
+        self.assertEqual(ledger.reserved_seats(self.flight, 'session-1'), {'4A', '4B', '4C'})
+        self.assertEqual(SeatClaim.objects.count(), 3)
+
+    def test_lapsed_reservation_gives_way(self):
+        """Tests that a reservation past its expiry no longer blocks the seat."""
+        assign_seats(self.flight, 'Economy', 1, 'session-1')
+        SeatClaim.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        booking = self.hold('4A', holder='session-2')
+
+        self.assertEqual(SeatClaim.objects.get().booking, booking)
+
+    def test_assignment_retries_when_the_cached_map_is_stale(self):
+        """Tests that a seat taken behind the cache's back sends the search round again."""
+        seat_map(self.flight, 'Economy')
+        SeatClaim.objects.create(flight=self.flight, seat_number='4A', holder='other',
+                                 expires_at=timezone.now() + timedelta(minutes=5))
+
+        seats, _ = assign_seats(self.flight, 'Economy', 1, 'session-1')
+
+        self.assertEqual(seats, ['4B'])
+
+    def test_auto_assign_endpoint(self):
+        """Tests the JSON endpoint and that passenger details accept the reserved seats."""
+        client = Client()
+        client.force_login(self.profile.user)
+        url = reverse('auto_assign_seats', args=[self.flight.flight_number, 'economy'])
+
+        self.assertEqual(client.get(url).status_code, 405)
+        self.assertEqual(client.post(url, {'passengers': 'x'}).status_code, 400)
+        self.assertEqual(client.post(url, {'passengers': 2, 'preference': 'galley'}).status_code, 400)
+        self.assertEqual(client.post(url, {'passengers': 61}).status_code, 400)
+
+        response = client.post(url, {'passengers': 2, 'preference': 'aisle'})
+        self.assertEqual(response.json()['seats'], ['4B', '4C'])
+
+        response = client.post(reverse('passenger_details'), {
+            'flight_id': self.flight.flight_number, 'selected_seats': '4B,4C', 'seat_class': 'economy',
+        })
+        self.assertEqual(response.status_code, 200)
+
+        SeatClaim.objects.bulk_create([
+            SeatClaim(flight=self.flight, seat_number=f'{row}{letter}', holder='other')
+            for row in range(5, 14) for letter in 'ABCDEF'
+        ])
+        cache.clear()
+        self.assertEqual(client.post(url, {'passengers': 6}).json()['seats'], ['4A', '4B', '4C', '4D', '4E', '4F'])
+        self.assertEqual(client.post(url, {'passengers': 7}).status_code, 409)
+
+
+class SeatEventTests(FlightTestCase):
+    """Tests for the live seat events pushed to seat selection pages."""
+
+    flight_number = 'SV707'
+    aircraft_model = "Tiny Jet"
+    seats = {'first_class': 0, 'business_class': 0, 'economy_class': 12}
+    username = 'watcher'
+
+    def setUp(self):
+        """Sets up a flight, a passenger and a fresh broker."""
+        super().setUp()
+        self.broker = seat_events.InProcessBroker(heartbeat=0.01)
+
+    async def test_events_reach_the_subscribers_of_their_flight_only(self):
+        """Tests that a message reaches every subscriber of its flight while the others only get heartbeats."""
+        first, second = self.broker.subscribe('SV707'), self.broker.subscribe('SV707')
+        other = self.broker.subscribe('SV808')
+
+        self.broker.publish('SV707', 'seats 1A')
+
+        self.assertEqual(await first.get(), 'seats 1A')
+        self.assertEqual(await second.get(), 'seats 1A')
+        self.assertIsNone(await other.get())
+
+        first.close()
+        self.assertEqual(self.broker.subscriber_count('SV707'), 1)
+
+    async def test_slow_subscriber_is_told_to_reset(self):
+        """Tests that a subscriber whose queue fills up gets OVERFLOW instead of a partial history."""
+        subscription = self.broker.subscribe('SV707')
+        for i in range(seat_events.QUEUE_SIZE + 1):
+            self.broker.publish('SV707', f'seats {i}A')
+        await asyncio.sleep(0)
+
+        self.assertIs(await subscription.get(), seat_events.OVERFLOW)
+
+    async def test_stream_sends_events_and_heartbeats(self):
+        """Tests the Server-Sent Events framing of the stream and that closing it unsubscribes."""
+        stream = seat_events.event_stream('SV707', self.broker)
+
+        self.assertEqual(await anext(stream), f"retry: {seat_events.RETRY_MILLISECONDS}\n\n")
+        self.assertEqual(await anext(stream), ": keep-alive\n\n")
+        self.broker.publish('SV707', seat_events.format_event({'seats': ['1B'], 'taken': False}))
+        self.assertEqual(await anext(stream), 'event: seats\ndata: {"seats": ["1B"], "taken": false}\n\n')
+
+        await stream.aclose()
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    def test_committed_claims_and_releases_are_published(self):
+        """Tests that the ledger announces seats once the hold and its cancellation commit."""
+        tickets = [Ticket(seat_number='2C', passenger_name='Test Passenger', passport='P12345678',
+                          nationality='1010101010', passenger_dob=date(1990, 1, 1))]
+        with patch.object(seat_events, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                booking = hold_seats(self.flight, 'Economy', self.profile, tickets)
+            publish.assert_called_once_with('SV707', ['2C'], True)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                ledger.status_changed(booking, 'Cancelled')
+                booking.status = 'Cancelled'
+                booking.save()
+            publish.assert_called_with('SV707', ['2C'], False)
+
+    @override_settings(SEAT_EVENTS_ENABLED=True)
+    async def test_seat_events_view_streams_the_flight(self):
+        """Tests that the view answers with an event stream for known flights only."""
+        await self.async_client.aforce_login(self.profile.user)
+
+        missing = await self.async_client.get(reverse('seat_events', args=['XX000']))
+        self.assertEqual(missing.status_code, 404)
+
+        response = await self.async_client.get(reverse('seat_events', args=['SV707']))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+
+        seat_events.publish('SV707', ['3D'], True)
+        self.assertIn(b'"3D"', await anext(chunks))
+
+    async def test_seat_events_view_is_off_by_default(self):
+        """Tests that the stream answers 204 unless live seat events are enabled."""
+        await self.async_client.aforce_login(self.profile.user)
+        response = await self.async_client.get(reverse('seat_events', args=['SV707']))
+        self.assertEqual(response.status_code, 204)
+
+    @override_settings(SEAT_EVENTS_ENABLED=True)
+    def test_seat_events_are_not_streamed_under_wsgi(self):
+        """Tests that a WSGI request gets 204 instead of a stream that would hold its thread."""
+        self.client.force_login(self.profile.user)
+        response = self.client.get(reverse('seat_events', args=['SV707']))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    def test_seat_selection_page_subscribes_only_when_enabled(self):
+        """Tests that the seat selection page opens the event stream only with SEAT_EVENTS_ENABLED."""
+        self.client.force_login(self.profile.user)
+        url = reverse('seat_selection', args=['SV707', 'Economy'])
+        self.assertNotContains(self.client.get(url), 'EventSource')
+        with override_settings(SEAT_EVENTS_ENABLED=True):
+            self.assertContains(self.client.get(url), 'EventSource')
+
+
+class GroupBookingTests(FlightTestCase):
+    """Tests for booking a whole group from a passenger list."""
+
+    flight_number = 'SV150'
+    flight_fields = {'economy_price': Decimal('300.00')}
+    username = 'operator'
+
+    def setUp(self):
+        """Sets up a flight and a logged in tour operator."""
+        cache.clear()
+        super().setUp()
+        self.client.force_login(self.profile.user)
+        self.url = reverse('group_booking', args=[self.flight.flight_number, 'Economy'])
+
+    def rows(self, count, **fields):
+        """Returns valid passenger rows, with fields overriding every row."""
+        return [
+            {'passenger_name': 'Group Passenger', 'passport': f'G{i:08d}', 'nationality': f'{i:010d}',
+             'passenger_dob': '1990-01-01', **fields}
+            for i in range(count)
+        ]
+
+    def post(self, rows):
+        """Posts a JSON passenger list and runs the commit callbacks of the booking."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, rows, content_type='application/json')
+
+    def test_group_is_booked_in_one_transaction(self):
+        """Tests that a group gets one pending booking with its seats claimed together."""
+        with self.assertNumQueries(22):
+            response = self.post(self.rows(12))
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        booking = Booking.objects.get(pk=data['booking_id'])
+        self.assertEqual((booking.status, booking.number_of_passengers), ('Pending', 12))
+        self.assertEqual(data['seats'][:6], ['4A', '4B', '4C', '4D', '4E', '4F'])
+        self.assertEqual(data['total_price'], '3600.00')
+        self.assertEqual(booking.tickets.count(), 12)
+        self.assertEqual(SeatInventory.objects.get(flight=self.flight, seat_class='Economy').held, 12)
+        self.assertEqual(seat_map(self.flight, 'Economy').taken_count(), 12)
+
+    def test_invalid_rows_are_reported_and_nothing_is_booked(self):
+        """Tests that every failing row is reported with the TicketForm messages."""
+        rows = self.rows(4)
+        rows[1]['passport'] = '123'
+        rows[3].update(passenger_name='R2-D2', passenger_dob='2990-01-01')
+
+        response = self.post(rows)
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual([error['row'] for error in errors], [2, 4])
+        self.assertIn('Passport must be exactly 9', errors[0]['errors']['passport'])
+        self.assertEqual(set(errors[1]['errors']), {'passenger_name', 'passenger_dob'})
+        self.assertFalse(Booking.objects.exists())
+
+    def test_csv_rows_keep_their_named_seats(self):
+        """Tests that a CSV list books the seats it names and seats the other rows elsewhere."""
+        body = "passenger_name,passport,nationality,passenger_dob,seat_number\n" \
+               "Ann Lee,A12345678,1234567890,1980-05-01,10c\n" \
+               "Bo Lee,B12345678,1234567891,1982-05-01,\n"
+
+        rows = parse_passengers(body.encode(), 'text/csv')
+        tickets = validate_passengers(rows)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, body, content_type='text/csv')
+
+        self.assertEqual([ticket.seat_number for ticket in tickets], ['10C', ''])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['seats'], ['10C', '4A'])
+
+    def test_taken_and_foreign_seats_are_reported_per_row(self):
+        """Tests the row errors for a seat of another booking and for a seat outside the cabin."""
+        hold_seats(self.flight, 'Economy', self.profile, [
+            Ticket(seat_number='5A', passenger_name='Test Passenger', passport='P12345678',
+                   nationality='1010101010', passenger_dob=date(1990, 1, 1))
+        ])
+        rows = self.rows(2)
+        rows[1]['seat_number'] = '5A'
+
+        taken = self.post(rows)
+        rows[1]['seat_number'] = '1A'
+        foreign = self.post(rows)
+
+        self.assertEqual(taken.status_code, 409)
+        self.assertEqual(taken.json()['errors'], [{'row': 2, 'errors': {'seat_number': "Seat 5A is already taken."}}])
+        self.assertEqual(foreign.status_code, 400)
+        self.assertEqual(foreign.json()['errors'][0]['row'], 2)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_api_clients_post_with_the_csrf_token_from_a_get(self):
+        """Tests that the session-authenticated POST needs the CSRF token a GET hands out."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.profile.user)
+
+        refused = client.post(self.url, self.rows(2), content_type='application/json')
+        self.assertEqual(refused.status_code, 403)
+        self.assertFalse(Booking.objects.exists())
+
+        token = client.get(self.url).json()['csrf_token']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(self.url, self.rows(2), content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 201)
+
+    def test_malformed_lists_are_rejected(self):
+        """Tests that unreadable, duplicate-seat and oversized lists are refused."""
+        with self.assertRaises(ValidationError):
+            parse_passengers(b'{"passengers": 3}', 'application/json')
+        with self.assertRaises(ValidationError):
+            parse_passengers(b'[]', 'application/json')
+        with self.assertRaises(InvalidPassengers) as raised:
+            validate_passengers(self.rows(2, seat_number='3B'))
+        self.assertEqual(raised.exception.errors[0]['row'], 2)
+
+        response = self.post(self.rows(501))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 500', response.json()['error'])
+
+
+class IdempotencyTests(FlightTestCase):
+    """Tests for replaying booking submissions sent with an idempotency key."""
+
+    flight_number = 'SV707'
+    username = 'retrier'
+
+    def setUp(self):
+        """Sets up a flight and a logged in passenger."""
+        cache.clear()
+        super().setUp()
+        self.user = self.profile.user
+        self.client.force_login(self.user)
+
+    def book(self, key, seat='12A'):
+        """Submits the passenger details form for one seat with an idempotency key."""
+        return self.client.post(reverse('create_booking'), {
+            'flight_id': self.flight.flight_number, 'seats_str': seat, 'seat_class': 'Economy',
+            f'{seat}-passenger_name': 'Test Passenger', f'{seat}-passport': 'P12345678',
+            f'{seat}-nationality': '1010101010', f'{seat}-passenger_dob': '1990-01-01',
+            'idempotency_key': key,
+        })
+
+    def test_resubmitted_form_creates_one_booking(self):
+        """Tests that a double submit replays the first redirect instead of booking again."""
+        first = self.book('key-1')
+        second = self.book('key-1')
+
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(second.status_code, 302)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.book('key-2', seat='12B').status_code, 302)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_passenger_details_issue_a_key(self):
+        """Tests that the passenger details form carries a fresh key."""
+        response = self.client.post(reverse('passenger_details'), {
+            'flight_id': self.flight.flight_number, 'selected_seats': '12A', 'seat_class': 'Economy'})
+
+        self.assertContains(response, f'name="idempotency_key" value="{response.context["idempotency_key"]}"')
+
+    def test_retry_during_the_first_request_waits_then_gets_409(self):
+        """Tests that a key still running is not run twice."""
+        IdempotencyKey.objects.create(user=self.user, scope='create_booking', key='busy')
+
+        with patch.object(idempotency, 'WAIT_SECONDS', 0):
+            response = self.book('busy')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_abandoned_key_is_taken_over(self):
+        """Tests that a key left running by a dead process runs again after STALE_AFTER."""
+        record = IdempotencyKey.objects.create(user=self.user, scope='create_booking', key='orphan')
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.book('orphan')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get(pk=record.pk).status_code, 302)
+
+    def test_api_retry_with_header_replays_the_json(self):
+        """Tests that the group booking API replays its first response for a repeated header."""
+        url = reverse('group_booking', args=[self.flight.flight_number, 'Economy'])
+        rows = [{'passenger_name': 'Group Passenger', 'passport': 'G12345678', 'nationality': '1234567890',
+                 'passenger_dob': '1990-01-01'}]
+
+        first = self.client.post(url, rows, content_type='application/json', HTTP_IDEMPOTENCY_KEY='api-1')
+        second = self.client.post(url, rows, content_type='application/json', HTTP_IDEMPOTENCY_KEY='api-1')
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_failed_request_can_be_retried_and_old_keys_expire(self):
+        """Tests that an exception frees the key and that keys are purged after KEY_TTL."""
+        with patch('bookings.views.hold_seats', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.book('flaky')
+        self.assertFalse(IdempotencyKey.objects.filter(key='flaky').exists())
+        self.assertEqual(self.book('flaky').status_code, 302)
+
+        self.assertEqual(idempotency.delete_expired_keys(timezone.now() + idempotency.KEY_TTL - timedelta(minutes=1)), 0)
+        self.assertEqual(idempotency.delete_expired_keys(timezone.now() + idempotency.KEY_TTL + timedelta(1)), 1)
+
+
+class ETicketTests(FlightTestCase):
+    """Tests for e-ticket PDFs rendered once and kept on disk."""
+
+    flight_number = 'SV808'
+    username = 'traveller'
+
+    def setUp(self):
+        """Sets up a confirmed booking with one ticket and an empty ticket directory."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(ETICKET_DIR=self.directory, PDF_RENDER_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        super().setUp()
+        self.client.force_login(self.profile.user)
+        self.booking = Booking.objects.create(flight=self.flight, passenger=self.profile, status='Pending')
+        self.ticket = Ticket.objects.create(booking=self.booking, seat_number='7C', passenger_name='Test Passenger',
+                                            passport='P12345678', nationality='1010101010',
+                                            passenger_dob=date(1990, 1, 1))
+
+    def download(self):
+        """Downloads the e-ticket and returns its content."""
+        response = self.client.get(reverse('download_ticket_pdf', args=[self.booking.booking_id]))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def files(self):
+        """Returns the names of the stored PDFs."""
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.pdf'))
+
+    def test_ticket_is_rendered_once_until_it_changes(self):
+        """Tests that downloads reuse the stored PDF and a ticket change replaces it."""
+        with patch.object(pdf_render, 'render_to_file', wraps=pdf_render.render_to_file) as render:
+            self.assertTrue(self.download().startswith(b'%PDF'))
+            self.download()
+            first = self.files()
+
+            self.ticket.passenger_name = 'Renamed Passenger'
+            self.ticket.save()
+            self.download()
+
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(self.files()), 1)
+        self.assertNotEqual(self.files(), first)
+
+    def test_payment_renders_the_ticket_ahead(self):
+        """Tests that confirming a booking renders its e-ticket once the payment commits."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('process_payment', args=[self.booking.booking_id]))
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.files(), [os.path.basename(etickets.ticket_pdf(self.booking))])
+
+    def test_worker_pool_renders_the_ticket(self):
+        """Tests rendering in a worker process and sharing one job between concurrent requests."""
+        html = etickets.ticket_html(self.booking)
+        path = etickets.ticket_path(self.booking, html)
+
+        with override_settings(PDF_RENDER_WORKERS=1):
+            future = pdf_render.submit(html, path)
+            self.assertIs(pdf_render.submit(html, path), future)
+            self.assertEqual(future.result(timeout=60), path)
+
+        with open(path, 'rb') as pdf:
+            self.assertTrue(pdf.read().startswith(b'%PDF'))
+
+    def test_render_failure_is_reported(self):
+        """Tests that a ticket that cannot be rendered answers 503 and stores nothing."""
+        with patch.object(pdf_render, 'render_pdf', side_effect=pdf_render.PdfRenderError("broken")):
+            response = self.client.get(reverse('download_ticket_pdf', args=[self.booking.booking_id]))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.files(), [])
+
+    def test_broken_worker_pool_is_replaced(self):
+        """Tests that a worker dying fails its job with 503 and the next job gets a new pool."""
+        html = etickets.ticket_html(self.booking)
+        path = etickets.ticket_path(self.booking, html)
+        self.addCleanup(pdf_render.shutdown)
+
+        with override_settings(PDF_RENDER_WORKERS=1):
+            crashed = pdf_render._submit(os._exit, 1)
+            with self.assertRaises(BrokenExecutor):
+                crashed.result(timeout=60)
+
+            self.assertEqual(pdf_render.submit(html, path).result(timeout=60), path)
+            self.assertEqual(len(pdf_render.render_many([html])), 1)
+
+        with patch.object(etickets, 'ticket_pdf', side_effect=BrokenProcessPool("A worker died.")):
+            response = self.client.get(reverse('download_ticket_pdf', args=[self.booking.booking_id]))
+        self.assertEqual(response.status_code, 503)
+
+    def test_ticket_deleted_before_it_is_opened_is_rendered_again(self):
+        """Tests that a download survives a concurrent rendering deleting the PDF it was about to open."""
+        render = etickets.ticket_pdf
+        lost = []
+
+        def render_then_lose(booking):
+            path = render(booking)
+            if not lost:
+                os.remove(path)
+                lost.append(path)
+            return path
+
+        with patch.object(etickets, 'ticket_pdf', side_effect=render_then_lose) as ticket_pdf:
+            self.assertTrue(self.download().startswith(b'%PDF'))
+        self.assertEqual(ticket_pdf.call_count, 2)
+
+
+class HoldExpiryTests(FlightTestCase):
+    """Tests for the deadline-driven expiry of pending bookings."""
+
+    flight_number = 'SV505'
+    aircraft_model = "Tiny Jet"
+    seats = {'first_class': 0, 'business_class': 0, 'economy_class': 10}
+    username = 'flyer'
+
+    class FakeScheduler:
+        """Records the jobs it is asked to schedule."""
+
+        def __init__(self):
+            self.run_dates = []
+
+        def add_job(self, func, trigger, run_date, **kwargs):
+            self.run_dates.append(run_date)
+
+    def expire_in(self, booking, minutes):
+        """Moves the hold deadline of a booking relative to now."""
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() + timedelta(minutes=minutes))
+
+    @override_settings(BOOKING_HOLD_MINUTES=12)
+    def test_hold_deadline_follows_setting_and_clears_on_payment(self):
+        """Tests that a hold gets its deadline from settings and loses it once paid."""
+        before = timezone.now()
+        booking = self.hold('1A')
+        self.assertGreaterEqual(booking.hold_expires_at, before + timedelta(minutes=12))
+        self.assertLessEqual(booking.hold_expires_at, timezone.now() + timedelta(minutes=12))
+
+        booking.status = 'Confirmed'
+        booking.save()
+        booking.refresh_from_db()
+        self.assertIsNone(booking.hold_expires_at)
+
+    def test_only_holds_past_their_deadline_expire(self):
+        """Tests that expiry cancels due holds, releases their seats and leaves the rest."""
+        due = self.hold('1A')
+        current = self.hold('1B')
+        self.expire_in(due, -1)
+
+        self.assertEqual(expire_due_holds(), 1)
+
+        due.refresh_from_db()
+        current.refresh_from_db()
+        self.assertEqual((due.status, due.hold_expires_at), ('Cancelled', None))
+        self.assertEqual(current.status, 'Pending')
+        self.assertEqual(self.flight.seats_available('Economy'), 9)
+
+    def test_expiry_works_in_bounded_batches(self):
+        """Tests that one expiry run never cancels more than its batch size."""
+        for seat in ('1A', '1B', '1C'):
+            self.expire_in(self.hold(seat), -1)
+
+        self.assertEqual(expire_due_holds(batch_size=2), 2)
+        self.assertEqual(expire_due_holds(batch_size=2), 1)
+        self.assertEqual(expire_due_holds(batch_size=2), 0)
+
+    def test_job_wakes_at_the_next_deadline(self):
+        """Tests that the expiry job sleeps until the earliest deadline."""
+        scheduler = self.FakeScheduler()
+        queue = HoldDeadlines()
+        queue.attach(scheduler, expire_due_holds)
+
+        booking = self.hold('1A')
+        self.expire_in(booking, 0.5)
+        queue.run()
+
+        booking.refresh_from_db()
+        self.assertEqual(scheduler.run_dates[-1], booking.hold_expires_at)
+
+    def test_new_earlier_deadline_wakes_the_job_sooner(self):
+        """Tests that pushing a deadline before the planned wake-up reschedules the job."""
+        scheduler = self.FakeScheduler()
+        queue = HoldDeadlines()
+        queue.attach(scheduler, expire_due_holds)
+        queue.run()
+        planned = scheduler.run_dates[-1]
+
+        soon = timezone.now() + timedelta(seconds=5)
+        queue.push(soon)
+        self.assertLess(soon, planned)
+        self.assertEqual(scheduler.run_dates[-1], soon)
+
+        queue.push(soon + timedelta(seconds=30))
+        self.assertEqual(scheduler.run_dates[-1], soon)
+
+    def test_deadlines_are_not_kept_without_a_scheduler(self):
+        """Tests that a process without the scheduler does not collect the deadlines it books."""
+        queue = HoldDeadlines()
+        queue.push(timezone.now() + timedelta(minutes=5))
+        self.assertIsNone(queue.next_deadline())
+
+
+class SchedulerRuntimeTests(TestCase):
+    """Tests that only one process runs the background scheduler."""
+
+    def test_autostart_skips_management_commands_and_tests(self):
+        """Tests which processes start the scheduler when the app loads."""
+        self.assertFalse(should_autostart(['manage.py', 'test'], {}))
+        self.assertFalse(should_autostart(['manage.py', 'migrate'], {}))
+        self.assertFalse(should_autostart(['manage.py', 'seed_data'], {}))
+        self.assertFalse(should_autostart(['manage.py', 'runserver'], {}))
+        self.assertTrue(should_autostart(['manage.py', 'runserver'], {'RUN_MAIN': 'true'}))
+        self.assertTrue(should_autostart(['manage.py', 'runserver', '--noreload'], {}))
+        self.assertTrue(should_autostart(['/venv/bin/gunicorn', 'flightsystem.wsgi'], {}))
+
+        with override_settings(SCHEDULER_AUTOSTART=False):
+            self.assertFalse(should_autostart(['/venv/bin/gunicorn', 'flightsystem.wsgi'], {}))
+
+    def test_only_one_holder_of_the_leader_lock(self):
+        """Tests that a second lock on the same file fails until the first is released."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'scheduler.lock')
+            leader, follower = LeaderLock(path), LeaderLock(path)
+
+            self.assertTrue(leader.acquire())
+            self.assertFalse(follower.acquire())
+
+            leader.release()
+            self.assertTrue(follower.acquire())
+            follower.release()
+
+    def test_run_scheduler_exits_when_another_process_leads(self):
+        """Tests that run_scheduler --no-wait refuses to start a second scheduler."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'scheduler.lock')
+            leader = LeaderLock(path)
+            leader.acquire()
+
+            with override_settings(SCHEDULER_LOCK_FILE=path):
+                with self.assertRaises(CommandError):
+                    call_command('run_scheduler', '--no-wait', stdout=StringIO())
+            leader.release()
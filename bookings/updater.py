@@ -1,10 +1,147 @@
+import os
+import sys
+import threading
+
 from apscheduler.schedulers.background import BackgroundScheduler
-from .tasks import delete_expired_bookings
+from django.conf import settings
+
+from .expiry import deadlines
+from .tasks import delete_expired_bookings, delete_expired_idempotency_keys, delete_expired_report_exports
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LEADER_RETRY_SECONDS = 30
+IDEMPOTENCY_PURGE_HOURS = 1
+REPORT_EXPORT_PURGE_MINUTES = 15
+
+_leader = None
+
+
+class LeaderLock:
+    """An exclusive lock on a local file, held by the one process that runs the scheduler.
+
+    The operating system releases the lock when the holding process exits, so
+    a crashed leader never leaves a stale lock behind.
+
+    Attributes:
+        path: The path of the lock file.
+    """
+
+    def __init__(self, path):
+        """Initializes a lock on a file that is not held yet.
+
+        Args:
+            path: The path of the lock file.
+        """
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """Takes the lock without waiting.
+
+        Returns:
+            bool: True if this process now holds the lock, False if another one does.
+        """
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, 'a+')
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        """Gives up the lock if this process holds it."""
+        if self._file is None:
+            return
+        if fcntl:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def should_autostart(argv=None, environ=None):
+    """Decides whether this process should start the scheduler when the app loads.
+
+    Web server processes start it when SCHEDULER_AUTOSTART is on. Management
+    commands and the test runner never do, except the serving child of
+    runserver. A dedicated process can be run with `manage.py run_scheduler`.
+
+    Args:
+        argv (list, optional): The command line of the process. Defaults to sys.argv.
+        environ (dict, optional): The environment of the process. Defaults to os.environ.
+
+    Returns:
+        bool: True if the scheduler should be started.
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+
+    if not settings.SCHEDULER_AUTOSTART:
+        return False
+
+    program = os.path.basename(argv[0]) if argv else ''
+    if program in ('manage.py', 'django-admin', 'django-admin.py', '__main__.py'):
+        command = argv[1] if len(argv) > 1 else ''
+        if command != 'runserver':
+            return False
+        # With the autoreloader only the child process serves requests.
+        return '--noreload' in argv or environ.get('RUN_MAIN') == 'true'
+
+    return 'pytest' not in program
+
+
+def attach_jobs(scheduler):
+    """Adds the periodic jobs of the bookings app to a scheduler.
+
+    Args:
+        scheduler: The APScheduler scheduler to add the jobs to.
+    """
+    deadlines.attach(scheduler, delete_expired_bookings)
+    scheduler.add_job(delete_expired_idempotency_keys, 'interval', hours=IDEMPOTENCY_PURGE_HOURS,
+                      id='delete-idempotency-keys', replace_existing=True)
+    scheduler.add_job(delete_expired_report_exports, 'interval', minutes=REPORT_EXPORT_PURGE_MINUTES,
+                      id='delete-report-exports', replace_existing=True)
+
 
 def start():
-    """Starts the background scheduler for periodic tasks."""
+    """Starts the background scheduler for periodic tasks if this process wins the leader lock.
+
+    Processes that lose retry every LEADER_RETRY_SECONDS, so another one takes
+    over if the leader exits.
+
+    Returns:
+        BackgroundScheduler: The running scheduler, or None if another process leads.
+    """
+    global _leader
+
+    if _leader is not None:
+        return _leader[1]
+
+    lock = LeaderLock(settings.SCHEDULER_LOCK_FILE)
+    if not lock.acquire():
+        retry = threading.Timer(LEADER_RETRY_SECONDS, start)
+        retry.daemon = True
+        retry.start()
+        return None
+
     scheduler = BackgroundScheduler()
-    
-    scheduler.add_job(delete_expired_bookings, 'interval', minutes=1)
+    scheduler.start()
+    attach_jobs(scheduler)
 
-    scheduler.start()
\ No newline at end of file
+    _leader = (lock, scheduler)
+    return scheduler
@@ -1,17 +1,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, Http404
+from django.http import FileResponse, HttpResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.middleware.csrf import get_token
 from .models import *
 from bookings.models import *
 from flights.models import Flight
+from flights.seat_grid import CABIN_ORDER
 from users.models import PassengerProfile
 from .forms import *
-from django.template.loader import get_template
 from django.utils import timezone
+from django.db import connections, transaction
+from asgiref.sync import sync_to_async
+from concurrent.futures import BrokenExecutor
+from django.core.exceptions import ValidationError
+from flights import page_versions
+from . import etickets, idempotency, ledger
+from .group_booking import InvalidPassengers, book_group, parse_passengers, seat_errors, validate_passengers
+from .holds import hold_seats
+from .pdf_render import PdfRenderError
+from .seat_assign import MAX_PARTY, PREFERENCES, assign_seats
+from .seat_events import event_stream
+from .seat_map import seat_map
 
-from xhtml2pdf import pisa
-import math
 
 
 
@@ -52,8 +65,11 @@ def my_bookings(request):
 def seat_selection(request, flight_id, seat_class):
     """Handles seat selection for a specific flight and seat class.
 
-    Retrieves the flight and aircraft details, calculates available and taken seats,
-    and organizes them into class-specific row ranges for the template.
+    Retrieves the flight, lays out its seats cabin by cabin from the seat grid
+    of the aircraft (see flights.seat_grid) and sends the claimed seats of the
+    booked class as a compact bitmap (see bookings.seat_map). A page the
+    browser already has is answered with 304 until the flight or its seats
+    change (see flights.page_versions).
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -63,10 +79,6 @@ def seat_selection(request, flight_id, seat_class):
     Returns:
         HttpResponse: The rendered 'seat_selection' page.
     """
-    flight = get_object_or_404(Flight, flight_number=flight_id)
-    aircraft = flight.aircraft
-
-
     try:
         adults = int(request.GET.get('adults', 1))
         children = int(request.GET.get('children', 0))
@@ -75,42 +87,147 @@ def seat_selection(request, flight_id, seat_class):
         children = 0
     total_passengers = adults + children
 
-    taken_seats = list(Ticket.objects.filter(booking__flight=flight).values_list('seat_number', flat=True))
-
-    seats_per_row = 6
-    
-    first_rows_count = math.ceil(aircraft.first_class / seats_per_row)
-    bus_rows_count = math.ceil(aircraft.business_class / seats_per_row)
-    eco_rows_count = math.ceil(aircraft.economy_class / seats_per_row)
+    # The party is remembered for passenger_details even when the page is not re-rendered.
+    if request.session.get('adults') != adults or request.session.get('children') != children:
+        request.session['adults'] = adults
+        request.session['children'] = children
 
+    page_validators = page_versions.validators(request, flight_id)
+    response = page_versions.not_modified(request, page_validators)
+    if response is not None:
+        return response
 
-    first_start = 1
-    first_end = first_rows_count
-    
-    bus_start = first_end + 1
-    bus_end = first_end + bus_rows_count
-    
-    eco_start = bus_end + 1
-    eco_end = bus_end + eco_rows_count
+    flight = get_object_or_404(Flight, flight_number=flight_id)
 
-    first_range = range(first_start, first_end + 1) if first_rows_count > 0 else None
-    bus_range = range(bus_start, bus_end + 1) if bus_rows_count > 0 else None
-    eco_range = range(eco_start, eco_end + 1) if eco_rows_count > 0 else None
+    seat_class = seat_class.capitalize()
+    try:
+        seats = seat_map(flight, seat_class)
+    except ValidationError:
+        raise Http404("Invalid seat class")
+
+    cabins = []
+    for cabin in CABIN_ORDER:
+        rows = seats.grid.cabin_rows(cabin)
+        if rows:
+            cabins.append({
+                'seat_class': cabin,
+                'letters': [cell.letter if cell else None for cell in rows[0].cells],
+                'rows': rows,
+            })
 
     context = {
         'flight': flight,
-        'first_range': first_range,
-        'bus_range': bus_range,
-        'eco_range': eco_range,
-        'taken_seats': taken_seats,
+        'cabins': cabins,
+        'seat_map': seats.as_dict(),
+        'reserved_seats': sorted(ledger.reserved_seats(flight, request.session.session_key)),
         'total_passengers': total_passengers,
         'seat_class': seat_class,
+        'seat_events_enabled': settings.SEAT_EVENTS_ENABLED,
     }
-    
-    request.session['adults'] = adults
-    request.session['children'] = children
 
-    return render(request, 'bookings/seat_selection.html', context)
+    return page_versions.add_validators(render(request, 'bookings/seat_selection.html', context), page_validators)
+
+
+@login_required
+def auto_assign_seats(request, flight_id, seat_class):
+    """Picks and reserves the best block of free seats for the party of the visitor.
+
+    Expects a POST with the party size in 'passengers' (defaulting to the
+    adults and children of the session) and an optional 'preference' of
+    'window' or 'aisle'. The seats are reserved for the session until the
+    booking hold time runs out (see bookings.seat_assign).
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        flight_id: The unique identifier for the flight.
+        seat_class: The class of seat to assign (e.g., 'Economy').
+
+    Returns:
+        JsonResponse: The 'seats' and their 'expires_at', or an 'error' with
+            status 400 for a bad request or 409 when no seats can be assigned.
+
+    Raises:
+        Http404: If the flight or the seat class does not exist.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': "Use POST to assign seats."}, status=405)
+
+    flight = get_object_or_404(Flight, flight_number=flight_id)
+    seat_class = seat_class.capitalize()
+    if seat_class not in CABIN_ORDER:
+        raise Http404("Invalid seat class")
+
+    default_party = request.session.get('adults', 1) + request.session.get('children', 0)
+    try:
+        party_size = int(request.POST.get('passengers', default_party))
+    except ValueError:
+        return JsonResponse({'error': "passengers must be a number."}, status=400)
+    if not 1 <= party_size <= MAX_PARTY:
+        return JsonResponse({'error': f"passengers must be between 1 and {MAX_PARTY}."}, status=400)
+    preference = request.POST.get('preference') or None
+    if preference is not None and preference not in PREFERENCES:
+        return JsonResponse({'error': "preference must be 'window' or 'aisle'."}, status=400)
+
+    if not request.session.session_key:
+        request.session.save()
+    try:
+        seats, expires_at = assign_seats(flight, seat_class, party_size, request.session.session_key, preference)
+    except ledger.SeatsUnavailable:
+        return JsonResponse({'error': "There are not enough free seats left in this class."}, status=409)
+    except ledger.SeatTaken:
+        return JsonResponse({'error': "The seats were taken while assigning them. Please try again."}, status=409)
+
+    return JsonResponse({'seats': seats, 'expires_at': expires_at.isoformat()})
+
+
+def _release_connections():
+    """Closes the database connections of the current request outside of transactions."""
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
+
+
+async def _stream_seat_events(flight_id):
+    """Streams the seat events of a flight without holding a database connection.
+
+    The stream stays open for as long as the page does, so the connections
+    opened for the session and the user are closed before the first event.
+    """
+    await sync_to_async(_release_connections)()
+    async for chunk in event_stream(flight_id):
+        yield chunk
+
+
+@login_required
+async def seat_events(request, flight_id):
+    """Streams the seat claims and releases of a flight as Server-Sent Events.
+
+    The seat selection page listens to this stream to mark seats taken or free
+    without reloading. The response stays open, so it is only served with
+    SEAT_EVENTS_ENABLED and under ASGI. A WSGI server would tie up a thread
+    per open page, so there the view answers 204, which tells the browser
+    not to reconnect.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        flight_id: The unique identifier for the flight.
+
+    Returns:
+        StreamingHttpResponse: The 'text/event-stream' of the flight, or an
+            empty response with status 204 when live seat events are off.
+
+    Raises:
+        Http404: If the flight does not exist.
+    """
+    if not settings.SEAT_EVENTS_ENABLED or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    if not await Flight.objects.filter(flight_number=flight_id).aexists():
+        raise Http404("Flight not found")
+
+    response = StreamingHttpResponse(_stream_seat_events(flight_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
@@ -139,6 +256,19 @@ def passenger_details(request):
             
         flight = get_object_or_404(Flight, flight_number=flight_id)
         seats_list = seats_str.split(',')
+
+        try:
+            seats = seat_map(flight, seat_class)
+        except ValidationError:
+            raise Http404("Invalid seat class")
+        reserved = ledger.reserved_seats(flight, request.session.session_key)
+        unavailable = [
+            seat for seat in seats_list
+            if seats.index(seat) is None or (seats.is_taken(seat) and seat not in reserved)
+        ]
+        if unavailable:
+            messages.error(request, f"Seat(s) {', '.join(unavailable)} cannot be booked. Please choose other seats.")
+            return redirect('seat_selection', flight_id=flight.flight_number, seat_class=seat_class)
         
         if seat_class == 'Business':
             ticket_price = flight.business_price
@@ -159,7 +289,8 @@ def passenger_details(request):
             'forms_list': forms_list, 
             'seats_str': seats_str,
             'seat_class': seat_class, 
-            'total_price': total_price
+            'total_price': total_price,
+            'idempotency_key': idempotency.new_key(),
         }
         return render(request, 'bookings/passenger_details.html', context)
     
@@ -167,11 +298,15 @@ def passenger_details(request):
 
 
 @login_required
+@idempotency.idempotent('create_booking')
 def create_booking(request):
     """Creates a new booking and associated tickets.
 
-    Validates the submitted forms, creates a Booking record, and saves Ticket records
-    for each seat.
+    Validates the submitted forms, then holds the seats with hold_seats, which
+    creates the Booking and all of its Ticket records in one transaction. If a
+    seat was taken in the meantime nothing is saved and the user is sent back
+    to the seat selection. A form submitted twice with the same idempotency
+    key creates one booking (see bookings.idempotency).
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -217,7 +352,8 @@ def create_booking(request):
                 'forms_list': forms_list_for_template, 
                 'seats_str': seats_str,
                 'seat_class': seat_class, 
-                'total_price': total_price
+                'total_price': total_price,
+                'idempotency_key': idempotency.new_key(),
             })
 
         try:
@@ -225,26 +361,108 @@ def create_booking(request):
         except PassengerProfile.DoesNotExist:
             profile = None
 
-        booking = Booking.objects.create(
-            flight=flight,
-            status='Pending',
-            number_of_passengers=len(seats_list),
-            seat_class=seat_class,
-            passenger=profile
-        )
-
+        tickets = []
         for seat, form in valid_forms:
-            ticket = form.save(commit=False) 
-            ticket.booking = booking         
+            ticket = form.save(commit=False)
             ticket.seat_number = seat
-            ticket.save()                    
-            
+            tickets.append(ticket)
+
+        try:
+            booking = hold_seats(flight, seat_class, profile, tickets, holder=request.session.session_key or '')
+        except ledger.SeatTaken as e:
+            messages.error(request, f"Sorry, seat(s) {', '.join(e.seats)} have just been taken. Please choose other seats.")
+            return redirect('seat_selection', flight_id=flight.flight_number, seat_class=seat_class)
+        except ledger.InvalidSeats as e:
+            messages.error(request, f"Seat(s) {', '.join(e.seats)} do not exist on this aircraft. Please choose other seats.")
+            return redirect('seat_selection', flight_id=flight.flight_number, seat_class=seat_class)
+        except ledger.SeatsUnavailable:
+            messages.error(request, "Sorry, there are not enough seats left in this class.")
+            return redirect('seat_selection', flight_id=flight.flight_number, seat_class=seat_class)
+
         messages.success(request, "Booking created! Redirecting to payment...")
         return redirect('process_payment', booking_id=booking.booking_id)
     
     return redirect('passenger_dashboard')
 
 
+@login_required
+@idempotency.idempotent('group_booking')
+def group_booking(request, flight_id, seat_class):
+    """Books a whole group from a JSON or CSV passenger list in one step.
+
+    Expects a POST whose body is the passenger list (see
+    bookings.group_booking). All rows are validated before anything is
+    written; the booking, its seat claims and its tickets are then created
+    in one transaction and held for payment like any other booking. A retry
+    with the same Idempotency-Key header gets the first response back.
+
+    The POST is authenticated by the session, so it is protected against
+    CSRF like any form. A GET returns the 'csrf_token' of the session and
+    sets the csrftoken cookie; clients send the token back in an
+    X-CSRFToken header with the cookie.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        flight_id: The unique identifier for the flight.
+        seat_class: The class of seat to book (e.g., 'Economy').
+
+    Returns:
+        JsonResponse: The 'booking_id', 'seats', 'total_price' and
+            'hold_expires_at' of the new booking with status 201, or an
+            'error' and per-row 'errors' with status 400 for an invalid list
+            or 409 when the seats cannot be booked. A GET gets the
+            'csrf_token' to post with.
+
+    Raises:
+        Http404: If the flight or the seat class does not exist.
+    """
+    if request.method == 'GET':
+        return JsonResponse({'csrf_token': get_token(request)})
+    if request.method != 'POST':
+        return JsonResponse({'error': "Use POST to book a group."}, status=405)
+
+    flight = get_object_or_404(Flight, flight_number=flight_id)
+    seat_class = seat_class.capitalize()
+    if seat_class not in CABIN_ORDER:
+        raise Http404("Invalid seat class")
+
+    try:
+        tickets = validate_passengers(parse_passengers(request.body, request.content_type))
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0], 'errors': []}, status=400)
+    except InvalidPassengers as e:
+        return JsonResponse({'error': "Please correct the passenger rows.", 'errors': e.errors}, status=400)
+
+    try:
+        profile = request.user.passenger_profile
+    except PassengerProfile.DoesNotExist:
+        profile = None
+
+    try:
+        booking = book_group(flight, seat_class, profile, tickets, holder=request.session.session_key or '')
+    except ledger.InvalidSeats as e:
+        return JsonResponse({
+            'error': f"Seat(s) {', '.join(e.seats)} are not in the {seat_class} cabin of this aircraft.",
+            'errors': seat_errors(tickets, e.seats, f"Seat {{seat}} is not in the {seat_class} cabin."),
+        }, status=400)
+    except ledger.SeatTaken as e:
+        return JsonResponse({
+            'error': f"Seat(s) {', '.join(e.seats)} are already taken.",
+            'errors': seat_errors(tickets, e.seats, "Seat {seat} is already taken."),
+        }, status=409)
+    except ledger.SeatsUnavailable:
+        return JsonResponse({'error': "There are not enough free seats left in this class.", 'errors': []},
+                            status=409)
+
+    return JsonResponse({
+        'booking_id': booking.booking_id,
+        'status': booking.status,
+        'seats': [ticket.seat_number for ticket in tickets],
+        'total_price': str(flight.price_for(seat_class) * len(tickets)),
+        'hold_expires_at': booking.hold_expires_at.isoformat() if booking.hold_expires_at else None,
+    }, status=201)
+
+
 @login_required
 def booking_details(request, booking_id):
     """Show details of a specific booking and list its tickets.
@@ -302,11 +520,16 @@ def cancel_ticket(request, ticket_id):
             remaining_count = booking.tickets.count()
             passenger_name = ticket.passenger_name
             
-            ticket.delete()
-            
+            with transaction.atomic():
+                ledger.tickets_removed(booking, [ticket.seat_number])
+                ticket.delete()
+                
+                if remaining_count <= 1:
+                    ledger.status_changed(booking, 'Cancelled')
+                    booking.status = 'Cancelled'
+                    booking.save()
+
             if remaining_count <= 1:
-                booking.status = 'Cancelled'
-                booking.save()
                 messages.success(request, f"Ticket for {passenger_name} cancelled. Booking marked as Cancelled.")
                 return redirect('my_bookings')
             else:
@@ -321,7 +544,11 @@ def cancel_ticket(request, ticket_id):
 
 @login_required
 def download_ticket_pdf(request, booking_id):
-    """Generates and downloads a PDF ticket for a specific booking.
+    """Downloads the PDF e-ticket of a specific booking.
+
+    The PDF is rendered by the PDF worker pool and kept on disk until the
+    booking changes (see bookings.etickets), so most downloads stream a file
+    that is already there.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -330,20 +557,16 @@ def download_ticket_pdf(request, booking_id):
     Returns:
         HttpResponse: A PDF file download or an error message.
     """
-    booking = get_object_or_404(Booking, booking_id=booking_id, passenger__user=request.user)
-    
-    template_path = 'bookings/ticket_pdf.html' 
-    
-    context = {'booking': booking}
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="ticket_{booking.booking_id}.pdf"'
-    
-    template = get_template(template_path)
-    html = template.render(context)
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('We had some errors <pre>' + html + '</pre>')
-        
-    return response
+    booking = get_object_or_404(
+        Booking.objects.select_related('flight__departure_airport', 'flight__arrival_airport', 'flight__aircraft'),
+        booking_id=booking_id, passenger__user=request.user,
+    )
+
+    try:
+        ticket = etickets.open_ticket_pdf(booking)
+    except (PdfRenderError, BrokenExecutor, TimeoutError, FileNotFoundError):
+        return HttpResponse('We had some errors rendering your ticket. Please try again.', status=503)
+
+    return FileResponse(ticket, as_attachment=True, filename=f"ticket_{booking.booking_id}.pdf",
+                        content_type='application/pdf')
 
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from .forms import CabinLayoutFormSet
 from .models import *
 
 
@@ -10,16 +11,33 @@ and flights appear in the Django admin panel.
 
 
 
+class CabinLayoutInline(admin.TabularInline):
+    """Edits the cabin layouts of an aircraft on its admin page.
+
+    Attributes:
+        model: The CabinLayout model.
+        formset: The formset that rejects overlapping row blocks.
+        extra: The number of empty layout forms shown.
+    """
+    model = CabinLayout
+    formset = CabinLayoutFormSet
+    extra = 0
+
+
 @admin.register(Aircraft)
 class AircraftAdmin(admin.ModelAdmin):
     """Settings for the Aircraft model in the admin page.
 
+    Once an aircraft has cabin layouts, its seat counts are set from them.
+
     Attributes:
         list_display: Fields to show in the list view (model, seats by class).
         search_fields: Fields that can be searched (model name).
+        inlines: The cabin layouts of the aircraft.
     """
     list_display = ('model', 'economy_class', 'business_class', 'first_class')
     search_fields = ('model',)
+    inlines = [CabinLayoutInline]
 
 
 @admin.register(Airport)
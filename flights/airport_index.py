@@ -0,0 +1,150 @@
+"""Airport autocomplete over an in-memory prefix index.
+
+AirportIndex keeps the searchable words of every airport (its code, and the
+words and full text of its city, name and country) in one sorted list, so
+the airports whose words start with a prefix are a contiguous slice found by
+binary search. The top matches of every prefix of up to three letters, which
+match too many words to rank on each keystroke, are ranked when the index is
+built.
+
+The index is built once per process on first use. The Airport signals (see
+flights.signals) mark it stale when an airport changes, and it is also
+rebuilt once it is older than REBUILD_SECONDS, which picks up changes that
+other processes made.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from .models import Airport
+
+
+REBUILD_SECONDS = 600
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+PRECOMPUTED_PREFIX_LENGTH = 3
+
+# Matches on earlier fields rank higher.
+FIELD_RANKS = {'airport_code': 0, 'city': 1, 'airport_name': 2, 'country': 3}
+
+
+def normalize(text):
+    """Returns text in lower case without accents, for matching.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def _words(text):
+    """Returns the normalized full text and the separate words of a field."""
+    text = normalize(text)
+    return {text, *text.split()} - {''}
+
+
+class AirportIndex:
+    """An in-memory prefix index of airports by code, city, name and country."""
+
+    def __init__(self, max_age=REBUILD_SECONDS):
+        """Initializes an empty index that is built on first use.
+
+        Args:
+            max_age (int, optional): Seconds after which the index is rebuilt from the database.
+        """
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._airports = []
+        self._words = []
+        self._entries = []
+        self._top = {}
+        self._built_at = None
+
+    def build(self):
+        """Loads all airports from the database and indexes their words."""
+        rows = list(Airport.objects.order_by('city', 'airport_code').values(
+            'airport_code', 'airport_name', 'city', 'country'
+        ))
+        airports = [
+            {'code': row['airport_code'], 'name': row['airport_name'], 'city': row['city'], 'country': row['country']}
+            for row in rows
+        ]
+
+        entries = []
+        for position, row in enumerate(rows):
+            for field, field_rank in FIELD_RANKS.items():
+                for word in _words(row[field]):
+                    # Airports are ordered by city, so the position breaks ties alphabetically.
+                    entries.append((word, (field_rank, position)))
+        entries.sort()
+
+        top = {}
+        for word, rank in sorted(entries, key=lambda entry: entry[1]):
+            for length in range(1, min(len(word), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                best = top.setdefault(word[:length], {})
+                if len(best) < MAX_LIMIT and rank[1] not in best:
+                    best[rank[1]] = rank
+
+        with self._lock:
+            self._airports = airports
+            self._words = [word for word, _ in entries]
+            self._entries = entries
+            self._top = {prefix: list(best) for prefix, best in top.items()}
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        """Marks the index stale so that the next lookup rebuilds it."""
+        self._built_at = None
+
+    def ensure_fresh(self):
+        """Builds the index if it is stale, was never built or is older than max_age."""
+        if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+            self.build()
+
+    def __len__(self):
+        """Returns the number of airports in the index."""
+        return len(self._airports)
+
+    def lookup(self, query, limit=DEFAULT_LIMIT):
+        """Returns the best airports with a word that starts with a query.
+
+        Airports whose code matches come first, then those whose city, name
+        or country matches, each group in city order.
+
+        Args:
+            query (str): The text the user typed.
+            limit (int, optional): The maximum number of airports, up to MAX_LIMIT.
+
+        Returns:
+            list: A dict with the 'code', 'name', 'city' and 'country' of each airport.
+        """
+        prefix = normalize(query)
+        limit = max(1, min(limit, MAX_LIMIT))
+        if not prefix:
+            return []
+        self.ensure_fresh()
+
+        with self._lock:
+            airports, words, entries = self._airports, self._words, self._entries
+            if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+                positions = self._top.get(prefix, [])[:limit]
+            else:
+                best = {}
+                i = bisect_left(words, prefix)
+                while i < len(words) and words[i].startswith(prefix):
+                    field_rank, position = entries[i][1]
+                    if best.get(position, field_rank + 1) > field_rank:
+                        best[position] = field_rank
+                    i += 1
+                positions = [p for _, p in heapq.nsmallest(limit, ((r, p) for p, r in best.items()))]
+
+        return [airports[p] for p in positions]
+
+
+airport_index = AirportIndex()
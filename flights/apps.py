@@ -5,3 +5,7 @@ class FlightsConfig(AppConfig):
     """Configuration for the Flights application."""
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flights'
+
+    def ready(self):
+        """Connects the signal handlers that invalidate cached flight searches."""
+        from . import signals  # noqa: F401
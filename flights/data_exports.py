@@ -0,0 +1,186 @@
+"""Streaming CSV and NDJSON exports of the report rows, the schedule and bookings.
+
+Each dataset is read with one aggregated query through QuerySet.iterator(),
+which uses a server-side cursor where the database has one, and written out
+as it is read. Only CHUNK_SIZE rows are in memory at a time however large
+the export, and the header goes out before the query runs, so the download
+starts at once.
+
+Rows are encoded into blocks of about FLUSH_BYTES before they are handed to
+the server, so a large export is not sent one row per write.
+
+Text cells of the CSV export that a spreadsheet would read as a formula are
+prefixed with a quote. NDJSON is written as stored.
+"""
+import csv
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, Count, DecimalField, F, Value, When
+from django.db.models.functions import Coalesce
+
+from bookings.models import Booking
+from .models import Flight
+from .reports import flight_sales_queryset
+
+
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Echo:
+    """A file-like object that returns what is written to it, for csv.writer."""
+
+    def write(self, value):
+        """Returns the written value instead of storing it."""
+        return value
+
+
+def _occupancy(sold, capacity):
+    """Returns the occupancy percentage, as on the reports page."""
+    return round((sold / capacity) * 100, 1) if capacity > 0 else 0
+
+
+def report_rows(show_financials=False):
+    """Yields the report row of every flight, in departure order.
+
+    Args:
+        show_financials (bool): Whether to include the revenue of each flight.
+
+    Returns:
+        tuple: The column names and an iterator of rows.
+    """
+    columns = ['flight_number', 'departure_airport', 'arrival_airport', 'departure_datetime', 'status',
+               'economy_sold', 'business_sold', 'first_sold', 'sold', 'capacity', 'occupancy']
+    if show_financials:
+        columns.append('revenue')
+
+    flights = flight_sales_queryset(Flight.objects.order_by('departure_datetime', 'flight_number')).values_list(
+        'flight_number', 'departure_airport_id', 'arrival_airport_id', 'departure_datetime', 'status',
+        'eco_sold', 'bus_sold', 'first_sold', 'sales_revenue',
+        'aircraft__economy_class', 'aircraft__business_class', 'aircraft__first_class',
+    )
+
+    def rows():
+        for (number, origin, destination, departure, status, eco, bus, first, revenue,
+             eco_seats, bus_seats, first_seats) in flights.iterator(chunk_size=CHUNK_SIZE):
+            sold = eco + bus + first
+            capacity = eco_seats + bus_seats + first_seats
+            row = [number, origin, destination, departure, status, eco, bus, first, sold, capacity,
+                   _occupancy(sold, capacity)]
+            if show_financials:
+                row.append(revenue)
+            yield row
+
+    return columns, rows()
+
+
+def schedule_rows(show_financials=False):
+    """Yields every flight of the schedule, in departure order.
+
+    Args:
+        show_financials (bool): Unused; the schedule has no revenue.
+
+    Returns:
+        tuple: The column names and an iterator of rows.
+    """
+    columns = ['flight_number', 'departure_airport', 'arrival_airport', 'departure_datetime', 'arrival_datetime',
+               'status', 'aircraft', 'economy_price', 'business_price', 'first_class_price']
+    flights = Flight.objects.order_by('departure_datetime', 'flight_number').values_list(
+        'flight_number', 'departure_airport_id', 'arrival_airport_id', 'departure_datetime', 'arrival_datetime',
+        'status', 'aircraft__model', 'economy_price', 'business_price', 'first_class_price',
+    )
+    return columns, flights.iterator(chunk_size=CHUNK_SIZE)
+
+
+def booking_rows(show_financials=False):
+    """Yields every booking with its ticket count, in booking order.
+
+    Args:
+        show_financials (bool): Whether to include the amount of each booking.
+
+    Returns:
+        tuple: The column names and an iterator of rows.
+    """
+    columns = ['booking_id', 'booking_date', 'status', 'flight_number', 'departure_datetime', 'seat_class',
+               'number_of_passengers', 'tickets', 'passenger']
+    fields = ['booking_id', 'booking_date', 'status', 'flight_id', 'flight__departure_datetime', 'seat_class',
+              'number_of_passengers', 'ticket_count', 'passenger__user__username']
+    bookings = Booking.objects.order_by('booking_id').annotate(ticket_count=Count('tickets'))
+    if show_financials:
+        columns.append('amount')
+        fields.append('amount')
+        bookings = bookings.annotate(amount=Coalesce(Case(
+            When(seat_class='Economy', then=F('flight__economy_price')),
+            When(seat_class='Business', then=F('flight__business_price')),
+            When(seat_class='First', then=F('flight__first_class_price')),
+        ), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2)) * F('number_of_passengers'))
+    return columns, bookings.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+DATASETS = {
+    'reports': report_rows,
+    'schedule': schedule_rows,
+    'bookings': booking_rows,
+}
+
+
+def _csv_value(value):
+    """Returns a value as written to CSV, with text that could run as a formula quoted."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_lines(columns, rows):
+    """Encodes a header and rows as CSV lines."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def _ndjson_lines(columns, rows):
+    """Encodes rows as one JSON object per line."""
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def stream(columns, rows, export_format):
+    """Encodes rows in an export format, in blocks of about FLUSH_BYTES.
+
+    The first line, the CSV header or the first NDJSON row, is sent on its
+    own, so the response starts as soon as there is anything to send.
+
+    Args:
+        columns (list): The column names.
+        rows (iterable): The rows, one value per column.
+        export_format (str): 'csv' or 'ndjson'.
+
+    Yields:
+        bytes: The next block of the export.
+    """
+    lines = _csv_lines(columns, rows) if export_format == 'csv' else _ndjson_lines(columns, rows)
+    block = []
+    size = 0
+    flush_at = 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= flush_at:
+            yield ''.join(block).encode()
+            block = []
+            size = 0
+            flush_at = FLUSH_BYTES
+    if block:
+        yield ''.join(block).encode()
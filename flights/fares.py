@@ -0,0 +1,118 @@
+"""Fare calendars: the lowest fare of a route for each day.
+
+A calendar month is computed with one grouped query and cached under the
+generation number of its route (see flights.search_cache), so saving a flight
+through FlightForm, edit_flight or anywhere else drops the cached months of
+its route. Seat sales do not touch the generation; a month whose last seats
+sell out is corrected when its entry expires after CALENDAR_TIMEOUT.
+"""
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Exists, F, Min, OuterRef
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from bookings.models import SeatInventory
+from .models import Aircraft, Flight
+from .search import departure_window
+from .search_cache import route_generation
+
+
+CALENDAR_TIMEOUT = 600
+CENTS = Decimal('0.01')
+
+
+def lowest_fares(origin, destination, seat_class, date_from, date_to):
+    """Returns the lowest fare of each day that has flights with free seats.
+
+    Args:
+        origin (str): The code of the departure airport.
+        destination (str): The code of the arrival airport.
+        seat_class (str): The seat class (e.g., 'Economy', 'Business', 'First').
+        date_from (date): The first day, in the current timezone.
+        date_to (date): The last day, in the current timezone.
+
+    Returns:
+        dict: The (lowest fare, number of flights) pair of each day that has any.
+
+    Raises:
+        ValidationError: If the seat class is invalid.
+    """
+    if seat_class not in Flight.PRICE_FIELDS:
+        raise ValidationError("Invalid seat class")
+    start, end = departure_window(date_from, date_to)
+    sold_out = SeatInventory.objects.filter(
+        flight=OuterRef('pk'),
+        seat_class=seat_class,
+        capacity__lte=F('held') + F('sold'),
+    )
+
+    days = Flight.objects.filter(
+        departure_airport_id=origin,
+        arrival_airport_id=destination,
+        departure_datetime__gte=start,
+        departure_datetime__lt=end,
+        **{f'aircraft__{Aircraft.CAPACITY_FIELDS[seat_class]}__gt': 0}
+    ).exclude(status='Cancelled').exclude(Exists(sold_out)).annotate(
+        day=TruncDate('departure_datetime', tzinfo=timezone.get_current_timezone())
+    ).values('day').annotate(
+        lowest=Min(Flight.PRICE_FIELDS[seat_class]),
+        flights=Count('pk'),
+    ).order_by('day')
+
+    return {row['day']: (row['lowest'].quantize(CENTS), row['flights']) for row in days}
+
+
+def month_fares(origin, destination, seat_class, year, month):
+    """Returns the lowest fares of a route for a calendar month, from the cache when possible.
+
+    Args:
+        origin (str): The code of the departure airport.
+        destination (str): The code of the arrival airport.
+        seat_class (str): The seat class (e.g., 'Economy', 'Business', 'First').
+        year (int): The year of the month.
+        month (int): The month, from 1 to 12.
+
+    Returns:
+        dict: The (lowest fare, number of flights) pair of each day that has any.
+    """
+    generation = route_generation(origin, destination)
+    key = f"fare-calendar:{origin}:{destination}:{generation}:{seat_class}:{year}-{month:02d}"
+    fares = cache.get(key)
+    if fares is None:
+        last_day = calendar.monthrange(year, month)[1]
+        fares = lowest_fares(origin, destination, seat_class, date(year, month, 1), date(year, month, last_day))
+        cache.set(key, fares, timeout=CALENDAR_TIMEOUT)
+    return fares
+
+
+def fare_calendar(origin, destination, seat_class, date_from, date_to):
+    """Returns one entry per day between two dates with the lowest fare of that day.
+
+    The days are read from the cached calendar months that the range touches.
+
+    Args:
+        origin (str): The code of the departure airport.
+        destination (str): The code of the arrival airport.
+        seat_class (str): The seat class (e.g., 'Economy', 'Business', 'First').
+        date_from (date): The first day, in the current timezone.
+        date_to (date): The last day, in the current timezone.
+
+    Returns:
+        list: A dict per day with the 'date', its 'lowest_fare' (None when no
+            flight has free seats) and the number of 'flights' with free seats.
+    """
+    months = {}
+    days = []
+    day = date_from
+    while day <= date_to:
+        if (day.year, day.month) not in months:
+            months[(day.year, day.month)] = month_fares(origin, destination, seat_class, day.year, day.month)
+        lowest, flights = months[(day.year, day.month)].get(day, (None, 0))
+        days.append({'date': day, 'lowest_fare': lowest, 'flights': flights})
+        day += timedelta(days=1)
+    return days
@@ -113,4 +113,25 @@ class FlightForm(forms.ModelForm):
         if dep_airport and arr_airport and dep_airport == arr_airport:
             raise forms.ValidationError("Departure and Arrival airports cannot be the same.")
             
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+
+class CabinLayoutFormSet(forms.BaseInlineFormSet):
+    """Inline formset of the cabin layouts of an aircraft."""
+
+    def clean(self):
+        """Validates that the submitted row blocks of the aircraft do not overlap each other.
+
+        Raises:
+            ValidationError: If two blocks share a row.
+        """
+        super().clean()
+        blocks = sorted(
+            (form.cleaned_data['first_row'], form.cleaned_data['last_row'])
+            for form in self.forms
+            if not form.cleaned_data.get('DELETE')
+            and 'first_row' in form.cleaned_data and 'last_row' in form.cleaned_data
+        )
+        for (first, last), (next_first, next_last) in zip(blocks, blocks[1:]):
+            if next_first <= last:
+                raise ValidationError(f"Rows {first}-{last} and {next_first}-{next_last} overlap.")
@@ -0,0 +1,272 @@
+"""Connecting itinerary search over an in-memory route graph.
+
+RouteGraph keeps every upcoming flight that is not cancelled, indexed by
+departure airport and sorted by departure time. The graph is built once per
+process and then kept up to date from the Flight signals (see flights.signals).
+It is also rebuilt once it is older than REBUILD_SECONDS, which picks up
+changes that other processes made.
+
+find_itineraries walks the graph from the origin, taking only connections
+whose layover at the transfer airport is between the minimum and maximum
+connection time. It ranks the itineraries by total duration, then price. Seat
+availability is checked against SeatInventory in one query per batch of
+ranked itineraries, because it changes far more often than the schedule.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from bookings.models import SeatInventory
+from .models import Aircraft, Flight
+from .search import departure_window
+
+
+REBUILD_SECONDS = 600
+MIN_CONNECTION = timedelta(minutes=45)
+MAX_CONNECTION = timedelta(hours=6)
+AVAILABILITY_BATCH = 100
+
+Leg = namedtuple('Leg', [
+    'flight_number', 'origin', 'destination', 'departure', 'arrival', 'capacity', 'prices',
+])
+
+LEG_FIELDS = (
+    'flight_number', 'departure_airport_id', 'arrival_airport_id', 'departure_datetime', 'arrival_datetime',
+    'aircraft__economy_class', 'aircraft__business_class', 'aircraft__first_class',
+    'economy_price', 'business_price', 'first_class_price',
+)
+
+
+def _leg(row):
+    """Builds a leg from a row of LEG_FIELDS values."""
+    number, origin, destination, departure, arrival, economy, business, first, eco_p, bus_p, first_p = row
+    return Leg(
+        number, origin, destination, departure, arrival,
+        {'Economy': economy, 'Business': business, 'First': first},
+        {'Economy': eco_p, 'Business': bus_p, 'First': first_p},
+    )
+
+
+class Itinerary:
+    """One way of getting from the origin to the destination on one or more flights.
+
+    Attributes:
+        legs: The flights of the itinerary, in order.
+        stops: The number of connections.
+        departure: The departure time of the first flight.
+        arrival: The arrival time of the last flight.
+        duration: The time from the first departure to the last arrival.
+        price: The price of all flights for all passengers.
+    """
+
+    def __init__(self, legs, seat_class, passengers):
+        """Initializes an itinerary from its legs.
+
+        Args:
+            legs (list): The Leg objects of the itinerary, in order.
+            seat_class (str): The seat class the price is for.
+            passengers (int): The number of passengers the price is for.
+        """
+        self.legs = legs
+        self.stops = len(legs) - 1
+        self.departure = legs[0].departure
+        self.arrival = legs[-1].arrival
+        self.duration = self.arrival - self.departure
+        self.price = sum(leg.prices[seat_class] for leg in legs) * passengers
+
+    def connections(self):
+        """Returns the (airport, layover) pairs of the connections of the itinerary."""
+        return [(leg.destination, nxt.departure - leg.arrival) for leg, nxt in zip(self.legs, self.legs[1:])]
+
+
+class RouteGraph:
+    """An in-memory index of upcoming flights by departure airport and time."""
+
+    def __init__(self, max_age=REBUILD_SECONDS):
+        """Initializes an empty graph that is built on first use.
+
+        Args:
+            max_age (int, optional): Seconds after which the graph is rebuilt from the database.
+        """
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._legs = {}
+        self._departures = {}
+        self._built_at = None
+
+    def build(self):
+        """Loads all upcoming flights that are not cancelled from the database."""
+        since = timezone.now() - timedelta(days=1)
+        rows = Flight.objects.filter(departure_datetime__gte=since).exclude(status='Cancelled')
+        legs = [_leg(row) for row in rows.values_list(*LEG_FIELDS).iterator(chunk_size=5000)]
+
+        departures = {}
+        for leg in sorted(legs, key=lambda leg: leg.departure):
+            times, airport_legs = departures.setdefault(leg.origin, ([], []))
+            times.append(leg.departure)
+            airport_legs.append(leg)
+
+        with self._lock:
+            self._legs = {leg.flight_number: leg for leg in legs}
+            self._departures = departures
+            self._built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Builds the graph if it was never built or is older than max_age."""
+        if self._built_at is None or time.monotonic() - self._built_at > self.max_age:
+            self.build()
+
+    def __len__(self):
+        """Returns the number of flights in the graph."""
+        return len(self._legs)
+
+    def remove(self, flight_number):
+        """Removes a flight from the graph if it is in it.
+
+        Args:
+            flight_number (str): The flight number of the flight.
+        """
+        with self._lock:
+            leg = self._legs.pop(flight_number, None)
+            if leg is None:
+                return
+            times, legs = self._departures[leg.origin]
+            i = bisect_left(times, leg.departure)
+            while legs[i].flight_number != flight_number:
+                i += 1
+            del times[i]
+            del legs[i]
+
+    def update(self, flight):
+        """Adds, moves or removes a flight after it was saved.
+
+        Does nothing until the graph has been built, since building it loads the flight anyway.
+
+        Args:
+            flight (Flight): The saved flight.
+        """
+        if self._built_at is None:
+            return
+        row = Flight.objects.filter(
+            pk=flight.pk, departure_datetime__gte=timezone.now() - timedelta(days=1)
+        ).exclude(status='Cancelled').values_list(*LEG_FIELDS).first()
+
+        with self._lock:
+            self.remove(flight.pk)
+            if row is None:
+                return
+            leg = _leg(row)
+            times, legs = self._departures.setdefault(leg.origin, ([], []))
+            i = bisect_right(times, leg.departure)
+            times.insert(i, leg.departure)
+            legs.insert(i, leg)
+            self._legs[leg.flight_number] = leg
+
+    def departures_between(self, airport, start, end):
+        """Returns the flights leaving an airport in a time range.
+
+        Args:
+            airport (str): The code of the departure airport.
+            start (datetime): The earliest departure, inclusive.
+            end (datetime): The latest departure, exclusive.
+
+        Returns:
+            list: The Leg objects, ordered by departure time.
+        """
+        with self._lock:
+            times, legs = self._departures.get(airport, ((), ()))
+            return legs[bisect_left(times, start):bisect_left(times, end)]
+
+
+route_graph = RouteGraph()
+
+
+def _seats_left(flight_numbers, seat_class, legs):
+    """Returns the available seats of a seat class on some flights, in one query.
+
+    Flights without a SeatInventory row have every seat of the class available.
+    """
+    available = {number: legs[number].capacity[seat_class] for number in flight_numbers}
+    rows = SeatInventory.objects.filter(flight_id__in=flight_numbers, seat_class=seat_class)
+    for flight_id, capacity, held, sold in rows.values_list('flight_id', 'capacity', 'held', 'sold'):
+        available[flight_id] = max(capacity - held - sold, 0)
+    return available
+
+
+def find_itineraries(origin, destination, date_from, date_to, seat_class='Economy', passengers=1, max_stops=2,
+                     min_connection=MIN_CONNECTION, max_connection=MAX_CONNECTION, limit=20, graph=None):
+    """Finds direct and connecting itineraries between two airports.
+
+    Args:
+        origin (str): The code of the departure airport.
+        destination (str): The code of the arrival airport.
+        date_from (date): The first departure date of the first flight, in the current timezone.
+        date_to (date): The last departure date of the first flight, in the current timezone.
+        seat_class (str, optional): The seat class to travel in. Defaults to 'Economy'.
+        passengers (int, optional): The number of seats needed on every flight. Defaults to 1.
+        max_stops (int, optional): The most connections an itinerary may have. Defaults to 2.
+        min_connection (timedelta, optional): The shortest layover at a transfer airport.
+        max_connection (timedelta, optional): The longest layover at a transfer airport.
+        limit (int, optional): The most itineraries to return. Defaults to 20.
+        graph (RouteGraph, optional): The graph to search. Defaults to the graph of this process.
+
+    Returns:
+        list: Itinerary objects with enough seats on every flight, shortest and then cheapest first.
+
+    Raises:
+        ValidationError: If the seat class is invalid.
+    """
+    if seat_class not in Aircraft.CAPACITY_FIELDS:
+        raise ValidationError("Invalid seat class")
+    graph = graph or route_graph
+    graph.ensure_fresh()
+    start, end = departure_window(date_from, date_to)
+    found = []
+
+    def extend(path, visited):
+        last = path[-1]
+        if last.destination == destination:
+            found.append(path)
+            return
+        if len(path) > max_stops:
+            return
+        final_leg = len(path) == max_stops
+        window_start = last.arrival + min_connection
+        window_end = last.arrival + max_connection + timedelta(microseconds=1)
+        for leg in graph.departures_between(last.destination, window_start, window_end):
+            if leg.capacity[seat_class] < passengers or leg.destination in visited:
+                continue
+            if final_leg and leg.destination != destination:
+                continue
+            extend(path + [leg], visited | {leg.destination})
+
+    for leg in graph.departures_between(origin, start, end):
+        if leg.capacity[seat_class] >= passengers and leg.destination != origin:
+            if max_stops == 0 and leg.destination != destination:
+                continue
+            extend([leg], {origin, leg.destination})
+
+    ranked = sorted(
+        (Itinerary(legs, seat_class, passengers) for legs in found),
+        key=lambda itinerary: (itinerary.duration, itinerary.price),
+    )
+
+    results = []
+    seats = {}
+    for i in range(0, len(ranked), AVAILABILITY_BATCH):
+        batch = ranked[i:i + AVAILABILITY_BATCH]
+        legs = {leg.flight_number: leg for itinerary in batch for leg in itinerary.legs}
+        unknown = legs.keys() - seats.keys()
+        if unknown:
+            seats.update(_seats_left(unknown, seat_class, legs))
+        for itinerary in batch:
+            if all(seats[leg.flight_number] >= passengers for leg in itinerary.legs):
+                results.append(itinerary)
+                if len(results) == limit:
+                    return results
+    return results
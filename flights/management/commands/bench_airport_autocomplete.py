@@ -0,0 +1,72 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from flights.airport_index import AirportIndex
+from flights.models import Airport
+
+
+LOOKUPS = 10_000
+SYLLABLES = ['ka', 'ri', 'san', 'to', 'mel', 'bo', 'ur', 'li', 'an', 'de', 'por', 'ville', 'ham', 'ta', 'ne']
+
+
+class Command(BaseCommand):
+    """Benchmark airport autocomplete lookups against a large, temporary airport table."""
+    help = 'Time airport prefix lookups against many airports; everything is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--airports', type=int, default=10_000, help='Number of airports to generate.')
+
+    def handle(self, *args, **options):
+        """Generates the airports, builds the index and prints the lookup timings, then rolls back."""
+        with transaction.atomic():
+            names = self.seed(options['airports'])
+            index = AirportIndex()
+
+            started = time.perf_counter()
+            index.build()
+            self.stdout.write(f"Built the index of {len(index)} airports in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+            for length in range(1, 6):
+                queries = [random.choice(names)[:length] for _ in range(LOOKUPS)]
+                timings = []
+                for query in queries:
+                    started = time.perf_counter()
+                    index.lookup(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f"{length}-letter prefixes: median {timings[len(timings) // 2]:.3f}ms, "
+                    f"p99 {timings[int(len(timings) * 0.99)]:.3f}ms, max {timings[-1]:.3f}ms"
+                )
+
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        """Creates airports with made-up codes, names and cities.
+
+        Args:
+            count (int): The number of airports to create.
+
+        Returns:
+            list: The city names of the airports.
+        """
+        codes = random.sample([a + b + c for a in string.ascii_uppercase
+                               for b in string.ascii_uppercase for c in string.ascii_uppercase], count)
+        airports = []
+        for code in codes:
+            city = ''.join(random.choices(SYLLABLES, k=random.randint(2, 4))).title()
+            airports.append(Airport(
+                airport_code=code, airport_name=f"{city} International", city=city,
+                country=random.choice(['Bench North', 'Bench South', 'Bench East', 'Bench West']),
+            ))
+        Airport.objects.bulk_create(airports, ignore_conflicts=True)
+        return [airport.city for airport in airports]
@@ -0,0 +1,111 @@
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from flights import data_exports
+from flights.models import Aircraft, Airport, Flight
+from flights.reports import build_flight_reports
+
+
+class Command(BaseCommand):
+    """Benchmark the streaming report export at growing schedule sizes."""
+    help = 'Stream the report rows as CSV at several schedule sizes and compare peak memory; everything is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000], help='Schedule sizes to export.')
+        parser.add_argument('--max-growth', type=float, default=2.0,
+                            help='How many times the peak memory of the smallest export the largest may use.')
+
+    def handle(self, *args, **options):
+        """Grows the schedule, streams the export at each size and reports the timings and memory.
+
+        Raises:
+            CommandError: If the peak memory grows more than --max-growth times with the schedule.
+        """
+        sizes = sorted(options['sizes'])
+        peaks = []
+        with transaction.atomic():
+            aircraft, start = self.set_up()
+            created = 0
+            for size in sizes:
+                self.seed(aircraft, start, created, size)
+                created = size
+
+                first_byte, total, peak, length = self.measure_stream()
+                peaks.append(peak)
+                self.stdout.write(f"{size} flights: first block after {first_byte * 1000:.1f}ms, "
+                                  f"{length / 1e6:.1f}MB in {total:.2f}s, peak {peak / 1e6:.2f}MB")
+
+                tracemalloc.start()
+                started = time.perf_counter()
+                rows = build_flight_reports()
+                listed = time.perf_counter() - started
+                list_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                del rows
+                self.stdout.write(f"{size} flights as a list (build_flight_reports): {listed:.2f}s, "
+                                  f"peak {list_peak / 1e6:.2f}MB")
+            transaction.set_rollback(True)
+
+        if peaks[-1] > peaks[0] * options['max_growth']:
+            raise CommandError(f"Peak memory grew from {peaks[0] / 1e6:.2f}MB to {peaks[-1] / 1e6:.2f}MB.")
+        self.stdout.write(self.style.SUCCESS("The export streamed in flat memory."))
+
+    def measure_stream(self):
+        """Streams the report rows as CSV and measures it.
+
+        Returns:
+            tuple: Seconds to the first block, seconds in total, peak traced
+                bytes and the length of the export.
+        """
+        tracemalloc.start()
+        started = time.perf_counter()
+        columns, rows = data_exports.report_rows(show_financials=True)
+        blocks = data_exports.stream(columns, rows, 'csv')
+        length = len(next(blocks))
+        first_byte = time.perf_counter() - started
+        for block in blocks:
+            length += len(block)
+        total = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return first_byte, total, peak, length
+
+    def set_up(self):
+        """Creates the benchmark airports and aircraft.
+
+        Returns:
+            tuple: The aircraft and the first departure of the schedule.
+        """
+        Airport.objects.bulk_create([
+            Airport(airport_code='ZZA', airport_name='Bench Origin', city='Bench', country='Bench'),
+            Airport(airport_code='ZZB', airport_name='Bench Destination', city='Bench', country='Bench'),
+        ], ignore_conflicts=True)
+        aircraft = Aircraft.objects.create(model='Bench Jet')
+        return aircraft, timezone.now() + timedelta(days=1)
+
+    def seed(self, aircraft, start, first, last):
+        """Creates the flights numbered from first up to last.
+
+        Args:
+            aircraft (Aircraft): The aircraft of the flights.
+            start (datetime): The departure of the first flight.
+            first (int): The number of the first flight to create.
+            last (int): The number after the last flight to create.
+        """
+        for offset in range(first, last, 10_000):
+            Flight.objects.bulk_create([
+                Flight(flight_number=f"BX{i:07d}", departure_datetime=start + timedelta(minutes=i),
+                       arrival_datetime=start + timedelta(minutes=i, hours=2),
+                       departure_airport_id='ZZA', arrival_airport_id='ZZB', aircraft=aircraft)
+                for i in range(offset, min(offset + 10_000, last))
+            ])
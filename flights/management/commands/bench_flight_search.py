@@ -0,0 +1,114 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from flights.models import Aircraft, Airport, Flight
+from flights.search import search_flights
+
+
+AIRPORT_COUNT = 40
+SEARCHES = 200
+
+
+class Command(BaseCommand):
+    """Benchmark the flight search query against a large, temporary flight table."""
+    help = 'Explain and time search_flights against many flights; everything is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--flights', type=int, default=1_000_000, help='Number of flights to generate.')
+        parser.add_argument('--days', type=int, default=365, help='Days of schedule to spread the flights over.')
+
+    def handle(self, *args, **options):
+        """Generates the flights, prints the query plans and timings, then rolls back."""
+        with transaction.atomic():
+            routes, first_day = self.seed(options['flights'], options['days'])
+            searches = [
+                (*random.choice(routes), first_day + timedelta(days=offset), first_day + timedelta(days=offset + 2))
+                for offset in random.choices(range(options['days'] - 2), k=SEARCHES)
+            ]
+
+            origin, destination, date_from, date_to = searches[0]
+            legacy = Flight.objects.filter(
+                departure_airport__airport_code=origin,
+                arrival_airport__airport_code=destination,
+                departure_datetime__date__range=[date_from, date_to],
+            ).order_by('departure_datetime')
+
+            self.stdout.write("search_flights plan:")
+            self.stdout.write(search_flights(origin, destination, date_from, date_to).explain())
+            self.stdout.write("__date__range plan:")
+            self.stdout.write(legacy.explain())
+
+            self.time("search_flights", lambda o, d, f, t: list(search_flights(o, d, f, t)), searches)
+            self.time("__date__range", lambda o, d, f, t: list(Flight.objects.filter(
+                departure_airport__airport_code=o, arrival_airport__airport_code=d,
+                departure_datetime__date__range=[f, t],
+            ).order_by('departure_datetime')), searches)
+
+            transaction.set_rollback(True)
+
+    def seed(self, count, days):
+        """Creates airports, an aircraft and flights spread over routes and days.
+
+        Args:
+            count (int): The number of flights to create.
+            days (int): The number of days to spread them over.
+
+        Returns:
+            tuple: The list of (origin, destination) routes and the first day of the schedule.
+        """
+        codes = [f"Q{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(AIRPORT_COUNT)]
+        Airport.objects.bulk_create([
+            Airport(airport_code=code, airport_name=f"Bench {code}", city=code, country='Bench') for code in codes
+        ])
+        aircraft = Aircraft.objects.create(model='Bench Jet')
+        routes = [(a, b) for a in codes for b in codes if a != b]
+
+        first_day = timezone.localdate() + timedelta(days=1)
+        start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+        minutes = days * 24 * 60
+
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            origin, destination = routes[i % len(routes)]
+            departure = start + timedelta(minutes=random.randrange(minutes))
+            batch.append(Flight(
+                flight_number=f"QB{i:07d}", departure_datetime=departure,
+                arrival_datetime=departure + timedelta(hours=3),
+                departure_airport_id=origin, arrival_airport_id=destination, aircraft=aircraft,
+            ))
+            if len(batch) == 10_000:
+                Flight.objects.bulk_create(batch)
+                batch = []
+        Flight.objects.bulk_create(batch)
+        self.stdout.write(f"Created {count} flights on {len(routes)} routes in {time.perf_counter() - started:.1f}s")
+        return routes, first_day
+
+    def time(self, label, search, searches):
+        """Runs a search function over all searches and prints the timings.
+
+        Args:
+            label (str): The name of the search in the output.
+            search (callable): A function of (origin, destination, date_from, date_to).
+            searches (list): The search arguments to run.
+        """
+        timings = []
+        for args in searches:
+            started = time.perf_counter()
+            search(*args)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{label}: median {timings[len(timings) // 2]:.2f}ms, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.2f}ms over {len(timings)} searches"
+        )
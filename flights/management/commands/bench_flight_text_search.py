@@ -0,0 +1,135 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from flights.models import Aircraft, Airport, Flight
+from flights.pagination import ORDERING
+from flights.search_index import matching_flights
+
+
+AIRPORT_COUNT = 60
+AIRCRAFT_MODELS = ['Bench A220', 'Bench A321neo', 'Bench 737 MAX', 'Bench 787-9', 'Bench E195', 'Bench ATR 72']
+CITY_WORDS = ['North', 'South', 'East', 'West', 'Port', 'Lake', 'Mount', 'New', 'Old', 'Bay']
+PAGE_SIZE = 50
+ROUNDS = 20
+
+
+class Command(BaseCommand):
+    """Benchmark the flight list text search against a large, temporary flight table."""
+    help = 'Explain and time the flight list search against many flights; everything is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--flights', type=int, default=500_000, help='Number of flights to generate.')
+
+    def handle(self, *args, **options):
+        """Generates the flights, prints the query plans and timings, then rolls back."""
+        with transaction.atomic():
+            cities = self.seed(options['flights'])
+            queries = [
+                f"QT{random.randrange(options['flights']):07d}"[:7],
+                random.choice(cities),
+                cities[0].split()[-1],
+                'A321neo',
+                'ZZZ-nothing',
+            ]
+
+            base = Flight.objects.select_related('departure_airport', 'arrival_airport', 'aircraft')
+            self.stdout.write("search_document plan:")
+            self.stdout.write(matching_flights(base, queries[0]).order_by(*ORDERING)[:PAGE_SIZE + 1].explain())
+            self.stdout.write("icontains plan:")
+            self.stdout.write(self.legacy(base, queries[0]).order_by(*ORDERING)[:PAGE_SIZE + 1].explain())
+
+            for query in queries:
+                self.stdout.write(f"Query {query!r}: {matching_flights(base, query).count()} matches")
+                self.time("  search_document page", lambda: list(
+                    matching_flights(base, query).order_by(*ORDERING)[:PAGE_SIZE + 1]))
+                self.time("  icontains page", lambda: list(
+                    self.legacy(base, query).order_by(*ORDERING)[:PAGE_SIZE + 1]))
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def legacy(queryset, query):
+        """Returns the flights matched the way the flight list searched before the index.
+
+        Args:
+            queryset (QuerySet): The flights to search.
+            query (str): The text to look for.
+
+        Returns:
+            QuerySet: The matching flights.
+        """
+        return queryset.filter(
+            Q(flight_number__icontains=query) |
+            Q(departure_airport__airport_code__icontains=query) |
+            Q(departure_airport__city__icontains=query) |
+            Q(arrival_airport__airport_code__icontains=query) |
+            Q(arrival_airport__city__icontains=query) |
+            Q(aircraft__model__icontains=query)
+        )
+
+    def seed(self, count):
+        """Creates airports, aircraft and flights with their search documents.
+
+        Args:
+            count (int): The number of flights to create.
+
+        Returns:
+            list: The city names of the airports.
+        """
+        airports = [
+            Airport(
+                airport_code=f"T{chr(65 + i // 26)}{chr(65 + i % 26)}", airport_name=f"Bench {i}",
+                city=f"{CITY_WORDS[i % len(CITY_WORDS)]} Benchton {i}", country='Bench',
+            )
+            for i in range(AIRPORT_COUNT)
+        ]
+        Airport.objects.bulk_create(airports)
+        fleet = [Aircraft.objects.create(model=model) for model in AIRCRAFT_MODELS]
+        routes = [(a, b) for a in airports for b in airports if a is not b]
+
+        start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            origin, destination = routes[i % len(routes)]
+            aircraft = fleet[i % len(fleet)]
+            flight_number = f"QT{i:07d}"
+            departure = start + timedelta(minutes=random.randrange(365 * 24 * 60))
+            batch.append(Flight(
+                flight_number=flight_number, departure_datetime=departure,
+                arrival_datetime=departure + timedelta(hours=3),
+                departure_airport=origin, arrival_airport=destination, aircraft=aircraft,
+                search_document=Flight.build_search_document(flight_number, origin, destination, aircraft),
+            ))
+            if len(batch) == 10_000:
+                Flight.objects.bulk_create(batch)
+                batch = []
+        Flight.objects.bulk_create(batch)
+        self.stdout.write(f"Created {count} flights in {time.perf_counter() - started:.1f}s")
+        return [airport.city for airport in airports]
+
+    def time(self, label, search):
+        """Runs a search function several times and prints the timings.
+
+        Args:
+            label (str): The name of the search in the output.
+            search (callable): A function without arguments that runs the search.
+        """
+        timings = []
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            search()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(f"{label}: median {timings[len(timings) // 2]:.2f}ms, max {timings[-1]:.2f}ms")
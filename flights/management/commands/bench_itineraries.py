@@ -0,0 +1,100 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from flights.itineraries import RouteGraph, find_itineraries
+from flights.models import Aircraft, Airport, Flight
+
+
+AIRPORT_COUNT = 40
+LATENCY_BUDGET_MS = 50
+
+
+class Command(BaseCommand):
+    """Benchmark the connecting itinerary search on a generated schedule."""
+    help = 'Time find_itineraries on a generated schedule; everything is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--flights', type=int, default=100_000, help='Number of flights to generate.')
+        parser.add_argument('--days', type=int, default=90, help='Days of schedule to spread the flights over.')
+        parser.add_argument('--searches', type=int, default=1000, help='Number of searches to time.')
+
+    def handle(self, *args, **options):
+        """Generates the schedule, builds the route graph and times the searches.
+
+        Raises:
+            CommandError: If the p99 latency is over LATENCY_BUDGET_MS.
+        """
+        with transaction.atomic():
+            codes, first_day = self.seed(options['flights'], options['days'])
+
+            graph = RouteGraph()
+            started = time.perf_counter()
+            graph.build()
+            self.stdout.write(f"Built the route graph of {len(graph)} flights in {time.perf_counter() - started:.2f}s")
+
+            timings, found = [], 0
+            for _ in range(options['searches']):
+                origin, destination = random.sample(codes, 2)
+                day = first_day + timedelta(days=random.randrange(options['days'] - 1))
+                started = time.perf_counter()
+                found += len(find_itineraries(origin, destination, day, day, graph=graph))
+                timings.append((time.perf_counter() - started) * 1000)
+
+            transaction.set_rollback(True)
+
+        timings.sort()
+        p99 = timings[int(len(timings) * 0.99)]
+        self.stdout.write(
+            f"{len(timings)} searches, {found / len(timings):.1f} itineraries each: "
+            f"p50 {timings[len(timings) // 2]:.2f}ms, p95 {timings[int(len(timings) * 0.95)]:.2f}ms, "
+            f"p99 {p99:.2f}ms, max {timings[-1]:.2f}ms"
+        )
+        if p99 > LATENCY_BUDGET_MS:
+            raise CommandError(f"p99 latency {p99:.2f}ms is over the {LATENCY_BUDGET_MS}ms budget.")
+        self.stdout.write(self.style.SUCCESS(f"p99 latency is within the {LATENCY_BUDGET_MS}ms budget."))
+
+    def seed(self, count, days):
+        """Creates airports, an aircraft and flights between random airports.
+
+        Args:
+            count (int): The number of flights to create.
+            days (int): The number of days to spread them over.
+
+        Returns:
+            tuple: The airport codes and the first day of the schedule.
+        """
+        codes = [f"Q{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(AIRPORT_COUNT)]
+        Airport.objects.bulk_create([
+            Airport(airport_code=code, airport_name=f"Bench {code}", city=code, country='Bench') for code in codes
+        ])
+        aircraft = Aircraft.objects.create(model='Bench Jet')
+
+        first_day = timezone.localdate() + timedelta(days=1)
+        start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+        minutes = days * 24 * 60
+
+        batch = []
+        for i in range(count):
+            origin, destination = random.sample(codes, 2)
+            departure = start + timedelta(minutes=random.randrange(minutes))
+            batch.append(Flight(
+                flight_number=f"QI{i:07d}", departure_datetime=departure,
+                arrival_datetime=departure + timedelta(minutes=random.randrange(60, 360)),
+                departure_airport_id=origin, arrival_airport_id=destination, aircraft=aircraft,
+                economy_price=random.randrange(100, 900),
+            ))
+            if len(batch) == 10_000:
+                Flight.objects.bulk_create(batch)
+                batch = []
+        Flight.objects.bulk_create(batch)
+        return codes, first_day
@@ -0,0 +1,152 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pypdf import PdfReader
+
+from bookings import pdf_render
+from flights import report_pdf
+from flights.models import Aircraft, Airport, Flight
+from flights.reports import build_flight_reports, export_row
+from flights.views import render_to_pdf
+
+
+RENDERERS = ['render_to_pdf', 'chunked']
+
+
+class Command(BaseCommand):
+    """Benchmark the chunked parallel report PDF against rendering it as one document."""
+    help = 'Render the general report of a large schedule with render_to_pdf and in parallel chunks, and compare'
+
+    def add_arguments(self, parser):
+        """Adds the command line options of the command.
+
+        Args:
+            parser: The argument parser of the command.
+        """
+        parser.add_argument('--flights', type=int, default=20_000, help='Number of flights in the report.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='PDF render worker processes for the chunked renderer. Defaults to the setting.')
+        parser.add_argument('--renderer', choices=RENDERERS, default=None,
+                            help='Time one renderer in this process against the existing benchmark flights.')
+
+    def handle(self, *args, **options):
+        """Creates the flights, times each renderer in a fresh process and reports the results.
+
+        Each renderer runs in its own process, so its peak RSS is not mixed
+        up with the other's.
+
+        Raises:
+            CommandError: If a renderer fails or the chunked renderer is slower.
+        """
+        if options['renderer']:
+            self.stdout.write(json.dumps(self.measure(options['renderer'])))
+            return
+
+        aircraft = self.set_up(options['flights'])
+        env = dict(os.environ)
+        if options['workers'] is not None:
+            env['PDF_RENDER_WORKERS'] = str(options['workers'])
+        try:
+            results = {}
+            for renderer in RENDERERS:
+                run = subprocess.run([sys.executable, sys.argv[0], 'bench_report_pdf', '--renderer', renderer],
+                                     env=env, capture_output=True, text=True)
+                if run.returncode != 0:
+                    raise CommandError(f"{renderer} failed: {run.stderr[-2000:]}")
+                results[renderer] = json.loads(run.stdout.strip().splitlines()[-1])
+        finally:
+            self.tear_down(aircraft)
+
+        for renderer, result in results.items():
+            self.stdout.write(
+                f"{renderer}: {result['seconds']:.1f}s, {result['pages']} pages, {result['bytes'] / 1e6:.1f}MB; "
+                f"peak RSS {result['peak_rss_mb']:.0f}MB in the process"
+                + (f", {result['worker_peak_rss_mb']:.0f}MB in the largest worker" if result['worker_peak_rss_mb'] else "")
+            )
+        if results['chunked']['seconds'] > results['render_to_pdf']['seconds']:
+            raise CommandError("The chunked renderer was slower than render_to_pdf.")
+        speedup = results['render_to_pdf']['seconds'] / results['chunked']['seconds']
+        self.stdout.write(self.style.SUCCESS(f"The chunked renderer was {speedup:.1f}x faster."))
+
+    def measure(self, renderer):
+        """Renders the report of the benchmark flights with one renderer.
+
+        Args:
+            renderer (str): 'render_to_pdf' or 'chunked'.
+
+        Returns:
+            dict: The wall time, page count and size of the PDF, and the peak
+                RSS of this process and of its largest worker process.
+        """
+        flights = Flight.objects.filter(departure_airport='ZZA').order_by('departure_datetime')
+        flight_data = [export_row(report, 'general', False) for report in build_flight_reports(flights)]
+        context = {
+            'report_type': 'general',
+            'generated_at': timezone.now(),
+            'flight_data': flight_data,
+            'total_flights': len(flight_data),
+            'total_tickets': sum(row['sold'] for row in flight_data),
+            'user': None,
+            'show_financials': False,
+        }
+
+        started = time.perf_counter()
+        if renderer == 'chunked':
+            content = report_pdf.render_report(context)
+        else:
+            response = render_to_pdf('flights/report_pdf.html', context)
+            if response['Content-Type'] != 'application/pdf':
+                raise CommandError("render_to_pdf reported errors.")
+            content = response.content
+        seconds = time.perf_counter() - started
+        pdf_render.shutdown()
+
+        return {
+            'seconds': seconds,
+            'pages': len(PdfReader(BytesIO(content)).pages),
+            'bytes': len(content),
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'worker_peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        }
+
+    def set_up(self, count):
+        """Creates the benchmark airports, aircraft and flights.
+
+        Args:
+            count (int): The number of flights to create.
+
+        Returns:
+            Aircraft: The aircraft of the benchmark flights.
+        """
+        Airport.objects.bulk_create([
+            Airport(airport_code='ZZA', airport_name='Bench Origin', city='Bench', country='Bench'),
+            Airport(airport_code='ZZB', airport_name='Bench Destination', city='Bench', country='Bench'),
+        ], ignore_conflicts=True)
+        aircraft = Aircraft.objects.create(model='Bench Jet')
+        start = timezone.now() + timedelta(days=1)
+        for offset in range(0, count, 10_000):
+            Flight.objects.bulk_create([
+                Flight(flight_number=f"BP{i:07d}", departure_datetime=start + timedelta(minutes=30 * i),
+                       arrival_datetime=start + timedelta(minutes=30 * i, hours=2),
+                       departure_airport_id='ZZA', arrival_airport_id='ZZB', aircraft=aircraft)
+                for i in range(offset, min(offset + 10_000, count))
+            ])
+        return aircraft
+
+    def tear_down(self, aircraft):
+        """Deletes everything the benchmark created.
+
+        Args:
+            aircraft (Aircraft): The aircraft of the benchmark flights.
+        """
+        Flight.objects.filter(aircraft=aircraft).delete()
+        aircraft.delete()
+        Airport.objects.filter(airport_code__in=['ZZA', 'ZZB'], departing_flights=None, arriving_flights=None).delete()
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_flight_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_airport', 'arrival_airport', 'departure_datetime'], name='flight_route_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_flight_route_departure_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_datetime', 'flight_number'], name='flight_departure_order_idx'),
+        ),
+    ]
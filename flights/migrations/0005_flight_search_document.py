@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:43
+
+from django.db import migrations, models
+
+
+# The index as of this migration. The DDL is spelled out here rather than
+# imported from flights.search_index, which describes the current index.
+SQLITE_INSTALL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS "FlightSearch" USING fts5(
+        search_document, content='Flight', content_rowid='rowid', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_insert AFTER INSERT ON "Flight" BEGIN
+        INSERT INTO "FlightSearch"(rowid, search_document) VALUES (new.rowid, new.search_document);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_delete AFTER DELETE ON "Flight" BEGIN
+        INSERT INTO "FlightSearch"("FlightSearch", rowid, search_document)
+        VALUES ('delete', old.rowid, old.search_document);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_update AFTER UPDATE ON "Flight" BEGIN
+        INSERT INTO "FlightSearch"("FlightSearch", rowid, search_document)
+        VALUES ('delete', old.rowid, old.search_document);
+        INSERT INTO "FlightSearch"(rowid, search_document) VALUES (new.rowid, new.search_document);
+    END""",
+    """INSERT INTO "FlightSearch"("FlightSearch") VALUES ('rebuild')""",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS flight_search_insert",
+    "DROP TRIGGER IF EXISTS flight_search_delete",
+    "DROP TRIGGER IF EXISTS flight_search_update",
+    'DROP TABLE IF EXISTS "FlightSearch"',
+]
+
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS flight_search_document_trgm ON "Flight" USING gin (search_document gin_trgm_ops)',
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS flight_search_document_trgm",
+]
+
+
+def fill_search_documents(apps, schema_editor):
+    """Computes the search document of every existing flight."""
+    Flight = apps.get_model('flights', 'Flight')
+    flights = Flight.objects.select_related('departure_airport', 'arrival_airport', 'aircraft')
+    batch = []
+    for flight in flights.iterator():
+        flight.search_document = ' '.join([
+            flight.flight_number,
+            flight.departure_airport.airport_code, flight.departure_airport.city,
+            flight.arrival_airport.airport_code, flight.arrival_airport.city,
+            flight.aircraft.model,
+        ]).lower()
+        batch.append(flight)
+    Flight.objects.bulk_update(batch, ['search_document'], batch_size=500)
+
+
+def install_search_index(apps, schema_editor):
+    """Creates the full-text or trigram index of the search documents."""
+    statements = {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor):
+    """Drops the full-text or trigram index of the search documents."""
+    statements = {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_flight_departure_order_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_flight_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aircraft',
+            name='layout_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='CabinLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(choices=[('Economy', 'Economy'), ('Business', 'Business'), ('First', 'First')], max_length=20)),
+                ('first_row', models.PositiveIntegerField()),
+                ('last_row', models.PositiveIntegerField()),
+                ('letters', models.CharField(default='ABC DEF', max_length=20)),
+                ('skipped_rows', models.CharField(blank=True, default='', max_length=100)),
+                ('exit_rows', models.CharField(blank=True, default='', max_length=100)),
+                ('aircraft', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cabin_layouts', to='flights.aircraft')),
+            ],
+            options={
+                'db_table': 'CabinLayout',
+                'ordering': ['first_row'],
+                'constraints': [models.UniqueConstraint(fields=('aircraft', 'first_row'), name='unique_cabin_layout_first_row')],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:40
+
+from django.db import migrations
+
+
+# Keys the SQLite FTS table on the INTEGER PRIMARY KEY of FlightSearchKey
+# instead of the implicit rowid of Flight, which VACUUM may renumber because
+# Flight has a text primary key. The index of PostgreSQL is unchanged.
+
+DROP_ROWID_INDEX = [
+    "DROP TRIGGER IF EXISTS flight_search_insert",
+    "DROP TRIGGER IF EXISTS flight_search_delete",
+    "DROP TRIGGER IF EXISTS flight_search_update",
+    'DROP TABLE IF EXISTS "FlightSearch"',
+]
+
+CREATE_ROWID_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS "FlightSearch" USING fts5(
+        search_document, content='Flight', content_rowid='rowid', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_insert AFTER INSERT ON "Flight" BEGIN
+        INSERT INTO "FlightSearch"(rowid, search_document) VALUES (new.rowid, new.search_document);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_delete AFTER DELETE ON "Flight" BEGIN
+        INSERT INTO "FlightSearch"("FlightSearch", rowid, search_document)
+        VALUES ('delete', old.rowid, old.search_document);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_update AFTER UPDATE ON "Flight" BEGIN
+        INSERT INTO "FlightSearch"("FlightSearch", rowid, search_document)
+        VALUES ('delete', old.rowid, old.search_document);
+        INSERT INTO "FlightSearch"(rowid, search_document) VALUES (new.rowid, new.search_document);
+    END""",
+    """INSERT INTO "FlightSearch"("FlightSearch") VALUES ('rebuild')""",
+]
+
+CREATE_KEYED_INDEX = [
+    """CREATE TABLE IF NOT EXISTS "FlightSearchKey" (
+        id INTEGER PRIMARY KEY, flight_number varchar(10) NOT NULL UNIQUE
+    )""",
+    'INSERT OR IGNORE INTO "FlightSearchKey"(flight_number) SELECT flight_number FROM "Flight"',
+    """CREATE VIEW IF NOT EXISTS "FlightSearchContent" AS
+        SELECT "FlightSearchKey".id, "Flight".search_document FROM "FlightSearchKey"
+        JOIN "Flight" ON "Flight".flight_number = "FlightSearchKey".flight_number""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS "FlightSearch" USING fts5(
+        search_document, content='FlightSearchContent', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_insert AFTER INSERT ON "Flight" BEGIN
+        INSERT INTO "FlightSearchKey"(flight_number) VALUES (new.flight_number);
+        INSERT INTO "FlightSearch"(rowid, search_document)
+        VALUES ((SELECT id FROM "FlightSearchKey" WHERE flight_number = new.flight_number), new.search_document);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_delete AFTER DELETE ON "Flight" BEGIN
+        INSERT INTO "FlightSearch"("FlightSearch", rowid, search_document)
+        VALUES ('delete', (SELECT id FROM "FlightSearchKey" WHERE flight_number = old.flight_number),
+                old.search_document);
+        DELETE FROM "FlightSearchKey" WHERE flight_number = old.flight_number;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flight_search_update AFTER UPDATE ON "Flight"
+    WHEN old.search_document IS NOT new.search_document OR old.flight_number IS NOT new.flight_number BEGIN
+        INSERT INTO "FlightSearch"("FlightSearch", rowid, search_document)
+        VALUES ('delete', (SELECT id FROM "FlightSearchKey" WHERE flight_number = old.flight_number),
+                old.search_document);
+        UPDATE "FlightSearchKey" SET flight_number = new.flight_number WHERE flight_number = old.flight_number;
+        INSERT INTO "FlightSearch"(rowid, search_document)
+        VALUES ((SELECT id FROM "FlightSearchKey" WHERE flight_number = new.flight_number), new.search_document);
+    END""",
+    """INSERT INTO "FlightSearch"("FlightSearch") VALUES ('rebuild')""",
+]
+
+DROP_KEYED_INDEX = DROP_ROWID_INDEX + [
+    'DROP VIEW IF EXISTS "FlightSearchContent"',
+    'DROP TABLE IF EXISTS "FlightSearchKey"',
+]
+
+
+def key_search_index(apps, schema_editor):
+    """Rebuilds the FTS table of SQLite on its own key column."""
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_ROWID_INDEX + CREATE_KEYED_INDEX:
+            schema_editor.execute(statement)
+
+
+def unkey_search_index(apps, schema_editor):
+    """Rebuilds the FTS table of SQLite on the rowid of Flight."""
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_KEYED_INDEX + CREATE_ROWID_INDEX:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0007_reportexport'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_search_index, unkey_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fail_duplicate_exports(apps, schema_editor):
+    """Fails all but the latest running export of each set of parameters."""
+    ReportExport = apps.get_model('flights', 'ReportExport')
+    active = ReportExport.objects.filter(status__in=['Queued', 'Running', 'Rendering'])
+    latest = {}
+    for export_id, params_hash in active.order_by('created_at', 'pk').values_list('pk', 'params_hash'):
+        latest[params_hash] = export_id
+    active.exclude(pk__in=latest.values()).update(status='Failed', error="Superseded by a newer export.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0008_flight_search_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_exports, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reportexport',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['Queued', 'Running', 'Rendering'])), fields=('params_hash',), name='unique_active_report_export'),
+        ),
+    ]
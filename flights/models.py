@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.core.exceptions import ValidationError
-from bookings.models import Booking
+from bookings.models import Booking, SeatInventory
 
 
 class Airport(models.Model):
@@ -38,12 +41,40 @@ class Aircraft(models.Model):
         economy_class: The number of economy class seats.
         business_class: The number of business class seats.
         first_class: The number of first class seats.
+        layout_version: Incremented whenever the cabin layouts of the aircraft change.
+
+    When an aircraft has cabin layouts, its seat counts are kept equal to the
+    seats of the layouts (see flights.seat_grid).
     """
     aircraft_id = models.AutoField(primary_key=True)
     model = models.CharField(max_length=50, null=False)
     economy_class = models.PositiveIntegerField(default=150)
     business_class = models.PositiveIntegerField(default=16)
     first_class = models.PositiveIntegerField(default=8)
+    layout_version = models.PositiveIntegerField(default=0, editable=False)
+
+    CAPACITY_FIELDS = {
+        'Economy': 'economy_class',
+        'Business': 'business_class',
+        'First': 'first_class',
+    }
+
+    def capacity_for(self, seat_class):
+        """Returns the number of seats of a seat class on this aircraft.
+
+        Args:
+            seat_class: The seat class (e.g., 'Economy', 'Business', 'First').
+
+        Returns:
+            int: The number of seats in the seat class.
+
+        Raises:
+            ValidationError: If the seat class is invalid.
+        """
+        field = self.CAPACITY_FIELDS.get(seat_class)
+        if field is None:
+            raise ValidationError("Invalid seat class")
+        return getattr(self, field)
 
     def __str__(self):
         """Returns the model name of the aircraft.
@@ -57,6 +88,125 @@ class Aircraft(models.Model):
         db_table = 'Aircraft'
 
 
+def _row_numbers(text):
+    """Parses a comma separated list of row numbers such as '13, 14'.
+
+    Raises:
+        ValidationError: If an entry is not a number.
+    """
+    rows = [part.strip() for part in text.split(',') if part.strip()]
+    if not all(row.isdigit() for row in rows):
+        raise ValidationError("Rows must be comma separated numbers.")
+    return {int(row) for row in rows}
+
+
+class CabinLayout(models.Model):
+    """Describes a block of rows of one cabin of an aircraft.
+
+    A cabin can be made of several blocks, e.g. when its rows change width
+    over a wing. The blocks of an aircraft are compiled into its seat grid by
+    flights.seat_grid.
+
+    Attributes:
+        aircraft: The aircraft the block belongs to.
+        seat_class: The seat class of the block (e.g., 'Economy').
+        first_row: The number of the first row of the block.
+        last_row: The number of the last row of the block.
+        letters: The seat letters of each row, with a space for each aisle
+            (e.g., 'ABC DEFG HJK' for a 3-4-3 layout).
+        skipped_rows: Comma separated row numbers that do not exist (e.g., '13').
+        exit_rows: Comma separated row numbers at emergency exits.
+    """
+    aircraft = models.ForeignKey(Aircraft, on_delete=models.CASCADE, related_name='cabin_layouts')
+    seat_class = models.CharField(max_length=20, choices=Booking.SEAT_CLASS_CHOICES)
+    first_row = models.PositiveIntegerField()
+    last_row = models.PositiveIntegerField()
+    letters = models.CharField(max_length=20, default='ABC DEF')
+    skipped_rows = models.CharField(max_length=100, blank=True, default='')
+    exit_rows = models.CharField(max_length=100, blank=True, default='')
+
+    def skipped_row_numbers(self):
+        """Returns the numbers of the rows that do not exist.
+
+        Returns:
+            set: The skipped row numbers.
+        """
+        return _row_numbers(self.skipped_rows)
+
+    def exit_row_numbers(self):
+        """Returns the numbers of the exit rows.
+
+        Returns:
+            set: The exit row numbers.
+        """
+        return _row_numbers(self.exit_rows)
+
+    def clean(self):
+        """Validates the rows and seat letters of the block.
+
+        Raises:
+            ValidationError: If the rows are reversed or overlap another block
+                of the aircraft, the letters are not distinct upper case
+                letters, or a row list is malformed.
+        """
+        if self.first_row < 1 or self.last_row < self.first_row:
+            raise ValidationError("The last row must not come before the first row.")
+        if self.aircraft_id is not None:
+            overlapping = CabinLayout.objects.filter(
+                aircraft_id=self.aircraft_id, first_row__lte=self.last_row, last_row__gte=self.first_row
+            ).exclude(pk=self.pk).first()
+            if overlapping is not None:
+                raise ValidationError(
+                    f"Rows {self.first_row}-{self.last_row} overlap rows {overlapping.first_row}-"
+                    f"{overlapping.last_row} of the {overlapping.seat_class} cabin."
+                )
+        seats = self.letters.replace(' ', '')
+        if not seats or not seats.isalpha() or not seats.isupper() or len(set(seats)) != len(seats):
+            raise ValidationError("Seat letters must be distinct upper case letters separated by aisles.")
+        self.skipped_row_numbers()
+        self.exit_row_numbers()
+
+    def __str__(self):
+        """Returns the string representation of the block.
+
+        Returns:
+            str: The aircraft, seat class and rows of the block.
+        """
+        return f"{self.aircraft} {self.seat_class} rows {self.first_row}-{self.last_row}"
+
+    class Meta:
+        db_table = 'CabinLayout'
+        ordering = ['first_row']
+        constraints = [
+            models.UniqueConstraint(fields=['aircraft', 'first_row'], name='unique_cabin_layout_first_row'),
+        ]
+
+
+class FlightQuerySet(models.QuerySet):
+    """QuerySet of flights with seat availability helpers."""
+
+    def with_availability(self):
+        """Annotates each flight with its available seats per seat class.
+
+        The figures come from the SeatInventory rows of the flights in the same
+        query. Flights without inventory rows report the full aircraft capacity.
+
+        Returns:
+            QuerySet: The flights annotated with 'economy_available',
+                'business_available' and 'first_available'.
+        """
+        annotations = {}
+        for seat_class, name in Flight.AVAILABILITY_ANNOTATIONS.items():
+            annotations[name] = Greatest(Coalesce(
+                Sum(
+                    F('seat_inventory__capacity') - F('seat_inventory__held') - F('seat_inventory__sold'),
+                    filter=Q(seat_inventory__seat_class=seat_class),
+                ),
+                F(f'aircraft__{Aircraft.CAPACITY_FIELDS[seat_class]}'),
+            ), Value(0), output_field=models.IntegerField())
+        return self.annotate(**annotations)
+
+
 class Flight(models.Model):
     """Represents a scheduled flight.
 
@@ -71,6 +221,8 @@ class Flight(models.Model):
         arrival_airport: The airport at which the flight arrives.
         aircraft: The aircraft assigned to the flight.
         status: The current status of the flight.
+        search_document: The lowercased flight number, airport codes and cities and
+            aircraft model, kept up to date on save and indexed for the flight list search.
     """
 
     flight_number = models.CharField(primary_key=True, max_length=10)
@@ -88,7 +240,98 @@ class Flight(models.Model):
         ('Cancelled', 'Cancelled'),
         ('Landed', 'Landed'),
     ])
+    search_document = models.TextField(blank=True, default='', editable=False)
+
+    objects = FlightQuerySet.as_manager()
+
+    PRICE_FIELDS = {
+        'Economy': 'economy_price',
+        'Business': 'business_price',
+        'First': 'first_class_price',
+    }
+
+    @staticmethod
+    def build_search_document(flight_number, departure_airport, arrival_airport, aircraft):
+        """Returns the search document of a flight.
+
+        Args:
+            flight_number (str): The flight number.
+            departure_airport (Airport): The departure airport.
+            arrival_airport (Airport): The arrival airport.
+            aircraft (Aircraft): The aircraft.
+
+        Returns:
+            str: The searchable text of the flight, in lower case.
+        """
+        return ' '.join([
+            flight_number,
+            departure_airport.airport_code, departure_airport.city,
+            arrival_airport.airport_code, arrival_airport.city,
+            aircraft.model,
+        ]).lower()
+
+    def save(self, *args, **kwargs):
+        """Saves the flight with an up to date search document."""
+        self.search_document = self.build_search_document(
+            self.flight_number, self.departure_airport, self.arrival_airport, self.aircraft
+        )
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'search_document' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'search_document']
+        super().save(*args, **kwargs)
+
+    def price_for(self, seat_class):
+        """Returns the ticket price of a seat class on this flight.
+
+        Args:
+            seat_class: The seat class (e.g., 'Economy', 'Business', 'First').
+
+        Returns:
+            Decimal: The price of one ticket in the seat class.
+
+        Raises:
+            ValidationError: If the seat class is invalid.
+        """
+        field = self.PRICE_FIELDS.get(seat_class)
+        if field is None:
+            raise ValidationError("Invalid seat class")
+        return getattr(self, field)
+
+    AVAILABILITY_ANNOTATIONS = {
+        'Economy': 'economy_available',
+        'Business': 'business_available',
+        'First': 'first_available',
+    }
+
+    def seats_available(self, seat_class=None):
+        """Returns the number of seats that can still be booked on the flight.
+
+        Reads the SeatInventory counters of the flight with a single query, or
+        none at all when the flight was loaded through with_availability().
+
+        Args:
+            seat_class (optional): The seat class to check. Defaults to all classes.
+
+        Returns:
+            int: The number of unbooked seats in the seat class, or in total.
+        """
+        seat_classes = [seat_class] if seat_class else list(self.AVAILABILITY_ANNOTATIONS)
+
+        if all(hasattr(self, self.AVAILABILITY_ANNOTATIONS[c]) for c in seat_classes):
+            return sum(getattr(self, self.AVAILABILITY_ANNOTATIONS[c]) for c in seat_classes)
 
+        inventory = {
+            row.seat_class: row
+            for row in SeatInventory.objects.filter(flight=self, seat_class__in=seat_classes)
+        }
+        available = 0
+        for c in seat_classes:
+            row = inventory.get(c)
+            if row is None:
+                available += self.aircraft.capacity_for(c)
+            else:
+                available += row.available()
+        return available
 
     def available_seats_dynamic(self):
         """Calculates the number of available seats on the flight.
@@ -96,13 +339,7 @@ class Flight(models.Model):
         Returns:
             int: The total number of unbooked seats across all classes.
         """
-
-        booked_economy = Booking.objects.filter(flight=self, seat_class='Economy').count()
-        booked_business = Booking.objects.filter(flight=self, seat_class='Business').count()
-        booked_first_class = Booking.objects.filter(flight=self, seat_class='First').count()
-        total_seats = self.aircraft.economy_class + self.aircraft.business_class + self.aircraft.first_class
-        booked_seats = booked_economy + booked_business + booked_first_class
-        return total_seats - booked_seats
+        return self.seats_available()
 
     def flight_time(self):
         """Calculates the duration of the flight.
@@ -143,3 +380,91 @@ class Flight(models.Model):
 
     class Meta:
         db_table = 'Flight'
+        indexes = [
+            models.Index(fields=['departure_airport', 'arrival_airport', 'departure_datetime'],
+                         name='flight_route_departure_idx'),
+            models.Index(fields=['departure_datetime', 'flight_number'], name='flight_departure_order_idx'),
+        ]
+
+
+class ReportExport(models.Model):
+    """A PDF export of the flight reports, built in the background.
+
+    Exports are built by flights.report_exports. An export with the same
+    parameters is reused until it expires, and at most one export of some
+    parameters is in ACTIVE_STATUSES at a time.
+
+    Attributes:
+        requested_by: The admin who requested the export.
+        report_type: The kind of report (e.g., 'financial').
+        show_financials: Whether the report includes revenue.
+        params_hash: The hash of the parameters the export was built from.
+        status: The state of the export (e.g., 'Running').
+        processed: The number of flights gathered so far.
+        total: The number of flights in the report.
+        file_path: Where the finished PDF is stored.
+        error: Why the export failed, if it did.
+        created_at: When the export was requested.
+        updated_at: When the export last made progress.
+        expires_at: When the finished PDF is deleted.
+    """
+    STATUS_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Rendering', 'Rendering'),
+        ('Done', 'Done'),
+        ('Failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ('Queued', 'Running', 'Rendering')
+    REPORT_TYPE_CHOICES = [
+        ('general', 'General Overview'),
+        ('occupancy', 'Seat Occupancy'),
+        ('financial', 'Financial Revenue'),
+    ]
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='report_exports')
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPE_CHOICES)
+    show_financials = models.BooleanField(default=False)
+    params_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Queued')
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True, default='')
+    error = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    @property
+    def progress(self):
+        """Returns how far the export is, in percent.
+
+        Gathering the flights counts for the first 90 percent; rendering the
+        PDF cannot be measured and counts for the rest.
+
+        Returns:
+            int: The progress of the export.
+        """
+        if self.status == 'Done':
+            return 100
+        if self.status == 'Rendering':
+            return 90
+        if not self.total:
+            return 0
+        return self.processed * 90 // self.total
+
+    def __str__(self):
+        """Returns the string representation of the export.
+
+        Returns:
+            str: The report type and status of the export.
+        """
+        return f"{self.report_type} report export {self.pk} ({self.status})"
+
+    class Meta:
+        db_table = 'ReportExport'
+        constraints = [
+            models.UniqueConstraint(fields=['params_hash'], condition=Q(status__in=['Queued', 'Running', 'Rendering']),
+                                    name='unique_active_report_export'),
+        ]
@@ -0,0 +1,161 @@
+"""Version stamps for conditional GETs of flight pages.
+
+Pages that show flights carry an ETag and a Last-Modified date worked out from
+version stamps kept in the cache, so a browser revalidating a page it already
+has gets 304 Not Modified from one cache lookup, without any query or
+template rendering.
+
+- The catalog stamp changes whenever a flight, airport, aircraft or cabin
+  layout is saved or deleted (see flights.signals). It covers the flight list
+  and every page that shows a flight.
+- The stamp of a flight changes whenever seats of the flight are claimed or
+  released (see bookings.seat_map). It covers the seat map.
+
+Stamps are nanosecond timestamps of the last change. A stamp that is missing
+starts again from the current time, so eviction only costs a re-render. The
+stamp of a flight also lapses after FLIGHT_VERSION_TIMEOUT, since seat
+reservations run out without any write.
+
+Every process that serves pages must see the same stamps, so a deployment
+with several processes needs a shared cache (CACHE_URL). With the default
+per-process locmem cache, a change made through one process is only seen by
+the others once their stamps lapse, so the catalog stamp also lapses, after
+CATALOG_VERSION_TIMEOUT.
+
+The ETag also covers the session, because pages show the user, their seat
+reservations and a CSRF token. Requests with pending messages are never
+answered with 304, so the messages are shown.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+CATALOG_KEY = 'page-version:catalog'
+CATALOG_VERSION_TIMEOUT = 600
+FLIGHT_VERSION_TIMEOUT = 300
+
+
+def _flight_key(flight_number):
+    """Returns the cache key of the version stamp of a flight."""
+    return f"page-version:flight:{flight_number}"
+
+
+def _timeout(key):
+    """Returns how long the stamp under a cache key lives."""
+    return CATALOG_VERSION_TIMEOUT if key == CATALOG_KEY else FLIGHT_VERSION_TIMEOUT
+
+
+def versions(flight_number=None):
+    """Returns the current version stamps of the catalog and of a flight.
+
+    Args:
+        flight_number (str, optional): The flight number.
+
+    Returns:
+        list: The stamps, the catalog first, creating those that are missing.
+    """
+    keys = [CATALOG_KEY] if flight_number is None else [CATALOG_KEY, _flight_key(flight_number)]
+    stamps = cache.get_many(keys)
+    missing = [key for key in keys if key not in stamps]
+    for key in missing:
+        cache.add(key, time.time_ns(), timeout=_timeout(key))
+    if missing:
+        stamps.update(cache.get_many(missing))
+    return [stamps.get(key, 0) for key in keys]
+
+
+def catalog_changed():
+    """Marks every flight page as changed."""
+    cache.set(CATALOG_KEY, time.time_ns(), timeout=CATALOG_VERSION_TIMEOUT)
+
+
+def flight_changed(flight_number):
+    """Marks the pages of one flight as changed.
+
+    Args:
+        flight_number (str): The flight number.
+    """
+    cache.set(_flight_key(flight_number), time.time_ns(), timeout=FLIGHT_VERSION_TIMEOUT)
+
+
+def validators(request, flight_number=None):
+    """Returns the ETag and Last-Modified date of a flight page for a request.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        flight_number (str, optional): The flight the page shows, if it
+            depends on the seats of one flight.
+
+    Returns:
+        dict: The 'etag' and 'last_modified' (a Unix timestamp) of the page,
+            or None if the page must be rendered in any case.
+    """
+    if len(get_messages(request)):
+        return None
+    stamps = versions(flight_number)
+    session_key = request.session.session_key or ''
+    digest = hashlib.sha256(f"{session_key}:{':'.join(map(str, stamps))}".encode()).hexdigest()[:32]
+    return {'etag': f'W/"{digest}"', 'last_modified': max(stamps) // 10 ** 9}
+
+
+def not_modified(request, page_validators):
+    """Returns the 304 response for a request whose copy of a page is current, or None.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        page_validators (dict): The validators returned by validators().
+
+    Returns:
+        HttpResponse: The 304 Not Modified response, or None to render the page.
+    """
+    if page_validators is None or request.method not in ('GET', 'HEAD'):
+        return None
+    return get_conditional_response(request, **page_validators)
+
+
+def add_validators(response, page_validators):
+    """Sets the ETag and Last-Modified headers of a rendered page.
+
+    Args:
+        response (HttpResponse): The rendered page.
+        page_validators (dict): The validators returned by validators().
+
+    Returns:
+        HttpResponse: The response.
+    """
+    if page_validators is not None and response.status_code == 200:
+        response.headers.setdefault('ETag', page_validators['etag'])
+        response.headers.setdefault('Last-Modified', http_date(page_validators['last_modified']))
+    return response
+
+
+def conditional_page(flight_arg=None):
+    """Makes a view answer revalidations of an unchanged page with 304.
+
+    The version stamps are read before the view runs, so a change committed
+    while the page renders gives it a stale ETag and the next request
+    re-renders it.
+
+    Args:
+        flight_arg (str, optional): The view argument holding the flight
+            number, for pages that show the seats of one flight.
+
+    Returns:
+        function: The view decorator.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _view(request, *args, **kwargs):
+            page_validators = validators(request, kwargs.get(flight_arg) if flight_arg else None)
+            response = not_modified(request, page_validators)
+            if response is None:
+                response = add_validators(view_func(request, *args, **kwargs), page_validators)
+            return response
+        return _view
+    return decorator
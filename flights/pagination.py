@@ -0,0 +1,117 @@
+"""Keyset (cursor) pagination of flights.
+
+Pages are ordered by (departure_datetime, flight_number) and located by the
+key of the row next to them instead of an OFFSET, so every page is a range
+scan of the (departure_datetime, flight_number) index of Flight, however
+deep it is. Cursors are the opaque, URL-safe encoding of such a key.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+ORDERING = ('departure_datetime', 'flight_number')
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded."""
+
+
+def encode_cursor(flight):
+    """Returns the cursor pointing at a flight.
+
+    Args:
+        flight (Flight): The flight.
+
+    Returns:
+        str: The URL-safe cursor.
+    """
+    key = json.dumps([flight.departure_datetime.isoformat(), flight.flight_number])
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the (departure_datetime, flight_number) key of a cursor.
+
+    Args:
+        cursor (str): A cursor made by encode_cursor.
+
+    Returns:
+        tuple: The departure time and flight number the cursor points at.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        departure, flight_number = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(departure), str(flight_number)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+class KeysetPage:
+    """One page of flights and the cursors of its neighbours.
+
+    Attributes:
+        flights: The flights on the page, in order.
+        next_cursor: The cursor of the next page, or None on the last page.
+        previous_cursor: The cursor of the previous page, or None on the first page.
+    """
+
+    def __init__(self, flights, next_cursor, previous_cursor):
+        """Initializes a page.
+
+        Args:
+            flights (list): The flights on the page.
+            next_cursor (str): The cursor of the next page, or None.
+            previous_cursor (str): The cursor of the previous page, or None.
+        """
+        self.flights = flights
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+
+def keyset_page(queryset, page_size, after=None, before=None):
+    """Returns the page of a flight queryset that follows or precedes a cursor.
+
+    Args:
+        queryset (QuerySet): The flights to page through. Its ordering is replaced.
+        page_size (int): The number of flights per page.
+        after (str, optional): Return the page right after this cursor.
+        before (str, optional): Return the page right before this cursor.
+
+    Returns:
+        KeysetPage: The page. Without a cursor it is the first page.
+
+    Raises:
+        InvalidCursor: If a cursor is malformed.
+    """
+    if before:
+        departure, flight_number = decode_cursor(before)
+        rows = list(queryset.filter(
+            Q(departure_datetime__lte=departure),
+            Q(departure_datetime__lt=departure) | Q(flight_number__lt=flight_number),
+        ).order_by('-departure_datetime', '-flight_number')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        flights = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if after:
+            departure, flight_number = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(departure_datetime__gte=departure),
+                Q(departure_datetime__gt=departure) | Q(flight_number__gt=flight_number),
+            )
+        rows = list(queryset.order_by(*ORDERING)[:page_size + 1])
+        has_next = len(rows) > page_size
+        flights = rows[:page_size]
+        has_previous = bool(after)
+
+    return KeysetPage(
+        flights,
+        encode_cursor(flights[-1]) if flights and has_next else None,
+        encode_cursor(flights[0]) if flights and has_previous else None,
+    )
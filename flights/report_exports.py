@@ -0,0 +1,253 @@
+"""PDF exports of the flight reports, built in the background.
+
+Reporting on a large schedule takes longer than a request may run, so admins
+submit an export and poll its ReportExport row for progress. A pool of
+REPORT_EXPORT_WORKERS threads gathers the report rows CHUNK_SIZE flights at a
+time, recording the progress after each chunk, and renders the PDF into
+REPORT_EXPORT_DIR with flights.report_pdf, which spreads it over the
+bookings.pdf_render worker processes. With REPORT_EXPORT_WORKERS set to 0 exports are built in
+the request thread, which suits tests and development.
+
+A finished export is kept for REPORT_EXPORT_TTL_MINUTES. Submitting the same
+parameters in that time returns the export that is running or done instead
+of building another one. An export that stops making progress, e.g. because
+its process was restarted, is built again after STALE_AFTER, or after
+RENDER_STALE_AFTER while its PDF is rendering, and is marked as failed when
+the expired exports are deleted.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from bookings import pdf_render
+from .models import Flight, ReportExport
+from .report_pdf import render_report
+from .reports import build_flight_reports, export_row
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+STALE_AFTER = timedelta(minutes=10)
+RENDER_STALE_AFTER = timedelta(minutes=30)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def parameters_hash(report_type, show_financials):
+    """Returns the hash that identifies exports built from the same parameters.
+
+    Args:
+        report_type (str): The kind of report (e.g., 'financial').
+        show_financials (bool): Whether the report includes revenue.
+
+    Returns:
+        str: The SHA-256 of the parameters.
+    """
+    parameters = json.dumps({'report_type': report_type, 'show_financials': show_financials}, sort_keys=True)
+    return hashlib.sha256(parameters.encode()).hexdigest()
+
+
+def reusable_export(params_hash, now=None):
+    """Returns the export of some parameters that is still running or kept.
+
+    Args:
+        params_hash (str): The hash of the parameters (see parameters_hash).
+        now (datetime, optional): The current time. Defaults to now.
+
+    Returns:
+        ReportExport: The latest such export, or None.
+    """
+    now = now or timezone.now()
+    candidates = ReportExport.objects.filter(params_hash=params_hash).filter(
+        Q(status='Done', expires_at__gt=now)
+        | Q(status__in=['Queued', 'Running'], updated_at__gte=now - STALE_AFTER)
+        | Q(status='Rendering', updated_at__gte=now - RENDER_STALE_AFTER)
+    ).order_by('-created_at')
+    for export in candidates[:1]:
+        if export.status != 'Done' or os.path.exists(export.file_path):
+            return export
+    return None
+
+
+def submit(report_type, user):
+    """Starts an export of the flight reports, or reuses one with the same parameters.
+
+    Stalled exports of the same parameters are marked as failed first, so
+    that the one export each set of parameters may have running is free.
+
+    Args:
+        report_type (str): The kind of report (e.g., 'financial').
+        user (User): The admin requesting the export. Revenue is included for superusers.
+
+    Returns:
+        tuple: The export and whether it was created by this call.
+    """
+    show_financials = user.is_superuser
+    params_hash = parameters_hash(report_type, show_financials)
+    with transaction.atomic():
+        fail_stale_exports(params_hash=params_hash)
+        export = reusable_export(params_hash)
+        if export is not None:
+            return export, False
+        try:
+            with transaction.atomic():
+                export = ReportExport.objects.create(requested_by=user, report_type=report_type,
+                                                     show_financials=show_financials, params_hash=params_hash)
+        except IntegrityError:
+            # Another admin started the same export since reusable_export ran.
+            return ReportExport.objects.get(params_hash=params_hash, status__in=ReportExport.ACTIVE_STATUSES), False
+        export_id = export.pk
+        transaction.on_commit(lambda: _start(export_id))
+    export.refresh_from_db()
+    return export, True
+
+
+def _get_executor():
+    """Returns the thread pool of this process, creating it on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.REPORT_EXPORT_WORKERS,
+                                           thread_name_prefix='report-export')
+        return _executor
+
+
+def _start(export_id):
+    """Builds an export in the thread pool, or right away without one."""
+    if settings.REPORT_EXPORT_WORKERS > 0:
+        _get_executor().submit(_build_in_thread, export_id)
+    else:
+        build(export_id)
+
+
+def _build_in_thread(export_id):
+    """Builds an export in a pool thread and closes the connection of the thread."""
+    try:
+        build(export_id)
+    finally:
+        connection.close()
+
+
+def _flight_chunks():
+    """Yields the flights in departure order, CHUNK_SIZE at a time."""
+    flights = Flight.objects.order_by('departure_datetime', 'flight_number')
+    last = None
+    while True:
+        chunk = flights
+        if last is not None:
+            chunk = flights.filter(
+                Q(departure_datetime__gt=last.departure_datetime)
+                | Q(departure_datetime=last.departure_datetime, flight_number__gt=last.flight_number)
+            )
+        chunk = list(chunk[:CHUNK_SIZE].values_list('flight_number', 'departure_datetime', named=True))
+        if not chunk:
+            return
+        yield [flight.flight_number for flight in chunk]
+        last = chunk[-1]
+
+
+def _progress(export_id, **fields):
+    """Records the state of an export."""
+    ReportExport.objects.filter(pk=export_id).update(updated_at=timezone.now(), **fields)
+
+
+def build(export_id):
+    """Gathers the rows of an export and renders its PDF.
+
+    Failures are logged and recorded on the export.
+
+    Args:
+        export_id (int): The export to build.
+    """
+    try:
+        _build(export_id)
+    except Exception as e:
+        logger.exception("Could not build report export %s", export_id)
+        _progress(export_id, status='Failed', error=str(e)[:255] or type(e).__name__)
+
+
+def _build(export_id):
+    """Builds an export; see build."""
+    export = ReportExport.objects.select_related('requested_by').get(pk=export_id)
+    _progress(export_id, status='Running', total=Flight.objects.count())
+
+    flight_data = []
+    for flight_numbers in _flight_chunks():
+        flights = Flight.objects.filter(flight_number__in=flight_numbers).order_by('departure_datetime', 'flight_number')
+        flight_data.extend(
+            export_row(report, export.report_type, export.show_financials)
+            for report in build_flight_reports(flights, include_revenue=export.show_financials)
+        )
+        _progress(export_id, processed=len(flight_data))
+
+    _progress(export_id, status='Rendering', processed=len(flight_data), total=len(flight_data))
+    content = render_report({
+        'report_type': export.report_type,
+        'generated_at': timezone.localtime(),
+        'flight_data': flight_data,
+        'total_flights': len(flight_data),
+        'total_tickets': sum(row['sold'] for row in flight_data),
+        'user': export.requested_by,
+        'show_financials': export.show_financials,
+    })
+
+    path = os.path.join(settings.REPORT_EXPORT_DIR, f"report-{export_id}-{export.report_type}.pdf")
+    pdf_render.write_file(content, path)
+    ttl = timedelta(minutes=settings.REPORT_EXPORT_TTL_MINUTES)
+    _progress(export_id, status='Done', file_path=path, expires_at=timezone.now() + ttl)
+
+
+def fail_stale_exports(now=None, params_hash=None):
+    """Marks the exports that stopped making progress as failed.
+
+    Args:
+        now (datetime, optional): The current time. Defaults to now.
+        params_hash (str, optional): Only marks the exports of these parameters.
+
+    Returns:
+        int: The number of exports marked.
+    """
+    now = now or timezone.now()
+    stale = ReportExport.objects.filter(
+        Q(status__in=['Queued', 'Running'], updated_at__lt=now - STALE_AFTER)
+        | Q(status='Rendering', updated_at__lt=now - RENDER_STALE_AFTER)
+    )
+    if params_hash is not None:
+        stale = stale.filter(params_hash=params_hash)
+    return stale.update(status='Failed', error="Stopped making progress.", updated_at=now)
+
+
+def delete_expired_exports(now=None):
+    """Deletes the exports past their TTL and their PDFs.
+
+    Exports that stopped making progress are marked as failed first, and
+    failed exports are deleted once they are older than the TTL.
+
+    Args:
+        now (datetime, optional): The current time. Defaults to now.
+
+    Returns:
+        int: The number of exports deleted.
+    """
+    now = now or timezone.now()
+    fail_stale_exports(now)
+    ttl = timedelta(minutes=settings.REPORT_EXPORT_TTL_MINUTES)
+    expired = ReportExport.objects.filter(Q(expires_at__lte=now) | Q(status='Failed', updated_at__lt=now - ttl))
+    for path in expired.exclude(file_path='').values_list('file_path', flat=True):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    deleted, _ = expired.delete()
+    return deleted
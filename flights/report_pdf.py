@@ -0,0 +1,104 @@
+"""Parallel PDF rendering of large flight reports.
+
+xhtml2pdf renders one document in one thread, and its time grows faster
+than the number of pages, so a report of a year-long schedule takes minutes.
+render_report splits the report rows into chunks of PAGES_PER_CHUNK pages,
+renders the chunks in parallel with bookings.pdf_render.render_many and
+joins the parts with pypdf. render_many leaves a worker of the pool free for
+e-tickets while the chunks render.
+
+The chunks are cut at page boundaries: the first page of the report holds
+FIRST_PAGE_ROWS rows under the summary and every other page ROWS_PER_PAGE,
+as laid out by report_pdf.html. Only the first chunk carries the summary;
+every page repeats the column headers. The page numbers are stamped onto
+the joined document, so they run through the whole report.
+"""
+from io import BytesIO
+
+from django.template.loader import get_template
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.colors import HexColor
+from reportlab.pdfgen import canvas
+
+from bookings import pdf_render
+
+
+TEMPLATE = 'flights/report_pdf.html'
+FIRST_PAGE_ROWS = 21
+ROWS_PER_PAGE = 29
+PAGES_PER_CHUNK = 10
+FOOTER_BASELINE = 22.6
+FOOTER = "Confidential Report | Generated by Flight Management System | Page {page} of {pages}"
+
+
+def chunk_rows(flight_data):
+    """Splits the report rows into chunks that end on page boundaries.
+
+    Args:
+        flight_data (list): The report rows.
+
+    Returns:
+        list: The chunks of rows, at least one.
+    """
+    first = FIRST_PAGE_ROWS + (PAGES_PER_CHUNK - 1) * ROWS_PER_PAGE
+    size = PAGES_PER_CHUNK * ROWS_PER_PAGE
+    chunks = [flight_data[:first]]
+    for start in range(first, len(flight_data), size):
+        chunks.append(flight_data[start:start + size])
+    return chunks
+
+
+def _page_numbers(pages):
+    """Draws the footer with the page number of each page into a PDF of the same page sizes."""
+    output = BytesIO()
+    footer = canvas.Canvas(output)
+    for number, page in enumerate(pages, start=1):
+        width, height = float(page.mediabox.width), float(page.mediabox.height)
+        footer.setPageSize((width, height))
+        footer.setFont('Helvetica', 8)
+        footer.setFillColor(HexColor('#999999'))
+        footer.drawCentredString(width / 2, FOOTER_BASELINE, FOOTER.format(page=number, pages=len(pages)))
+        footer.showPage()
+    footer.save()
+    return PdfReader(output).pages
+
+
+def join(parts):
+    """Joins PDF documents and numbers their pages.
+
+    Args:
+        parts (list): The PDF documents as bytes, in order.
+
+    Returns:
+        bytes: The joined PDF document.
+    """
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(BytesIO(part)))
+    for page, footer in zip(writer.pages, _page_numbers(writer.pages)):
+        page.merge_page(footer)
+        page.compress_content_streams()
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def render_report(context):
+    """Renders a flight report to PDF in parallel chunks.
+
+    Args:
+        context (dict): The context of report_pdf.html, with the report rows
+            in 'flight_data'.
+
+    Returns:
+        bytes: The PDF document.
+
+    Raises:
+        PdfRenderError: If a chunk cannot be rendered.
+    """
+    template = get_template(TEMPLATE)
+    htmls = [
+        template.render({**context, 'flight_data': rows, 'continued': index > 0, 'stamp_page_numbers': True})
+        for index, rows in enumerate(chunk_rows(context['flight_data']))
+    ]
+    return join(pdf_render.render_many(htmls))
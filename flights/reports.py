@@ -0,0 +1,124 @@
+"""Report engine for the flights app.
+
+This module builds the per-flight sales, occupancy and revenue rows used by
+the admin reports page and the PDF export. The figures of every flight are
+read from its FlightSalesRollup rows (maintained by bookings.ledger) in a
+single grouped query with conditional aggregation, instead of counting
+tickets with several queries per flight.
+"""
+from django.db.models import DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Flight
+
+
+def _sold_in(seat_class):
+    """Builds a Sum of the tickets sold in one seat class.
+
+    Args:
+        seat_class: The seat class to sum (e.g., 'Economy').
+
+    Returns:
+        Coalesce: The conditional aggregate for the seat class, 0 without rollups.
+    """
+    return Coalesce(Sum('sales_rollups__sold', filter=Q(sales_rollups__seat_class=seat_class)), 0)
+
+
+def flight_sales_queryset(flights=None):
+    """Annotates flights with their ticket sales per seat class.
+
+    Args:
+        flights (QuerySet, optional): The flights to report on. Defaults to all flights.
+
+    Returns:
+        QuerySet: The flights annotated with 'eco_sold', 'bus_sold', 'first_sold'
+            and 'sales_revenue'.
+    """
+    if flights is None:
+        flights = Flight.objects.all()
+
+    return flights.select_related('aircraft', 'departure_airport', 'arrival_airport').annotate(
+        eco_sold=_sold_in('Economy'),
+        bus_sold=_sold_in('Business'),
+        first_sold=_sold_in('First'),
+        sales_revenue=Coalesce(
+            Sum('sales_rollups__revenue'), Value(0),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+
+
+def report_row(flight, include_revenue=True):
+    """Builds the report row for an annotated flight.
+
+    Args:
+        flight (Flight): A flight annotated by flight_sales_queryset.
+        include_revenue (bool): Whether to calculate the flight revenue.
+
+    Returns:
+        dict: The sales, capacity, occupancy and revenue figures of the flight.
+    """
+    aircraft = flight.aircraft
+    total_sold = flight.eco_sold + flight.bus_sold + flight.first_sold
+    total_capacity = aircraft.economy_class + aircraft.business_class + aircraft.first_class
+
+    occupancy_rate = 0
+    if total_capacity > 0:
+        occupancy_rate = round((total_sold / total_capacity) * 100, 1)
+
+    revenue = flight.sales_revenue if include_revenue else 0
+
+    return {
+        'flight_obj': flight,
+        'revenue': revenue,
+        'sold': total_sold,
+        'eco_sold': flight.eco_sold,
+        'bus_sold': flight.bus_sold,
+        'first_sold': flight.first_sold,
+        'capacity': total_capacity,
+        'occupancy': occupancy_rate,
+        'status': flight.status,
+    }
+
+
+def build_flight_reports(flights=None, include_revenue=True):
+    """Builds the report rows for a set of flights with one database query.
+
+    Args:
+        flights (QuerySet, optional): The flights to report on. Defaults to all flights.
+        include_revenue (bool): Whether to calculate the flight revenue.
+
+    Returns:
+        list: One report row (see report_row) per flight, in queryset order.
+    """
+    return [report_row(flight, include_revenue) for flight in flight_sales_queryset(flights)]
+
+
+def export_row(report, report_type, show_financials):
+    """Builds the row of the PDF export for a report row.
+
+    Args:
+        report (dict): A report row built by report_row.
+        report_type (str): The kind of report ('general', 'occupancy' or 'financial').
+        show_financials (bool): Whether the report includes revenue.
+
+    Returns:
+        dict: The figures of the flight shown by the report type.
+    """
+    data_row = {
+        'flight': report['flight_obj'],
+        'sold': report['sold'],
+        'capacity': report['capacity'],
+        'occupancy': report['occupancy'],
+        'status': report['status'],
+    }
+    if report_type == 'financial':
+        data_row.update({
+            'revenue': report['revenue'],
+            'eco_sold': report['eco_sold'],
+            'bus_sold': report['bus_sold'],
+            'first_sold': report['first_sold'],
+        })
+    elif show_financials:
+        data_row['revenue'] = report['revenue']
+    return data_row
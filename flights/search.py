@@ -0,0 +1,98 @@
+"""Flight search queries.
+
+Searches filter on the route and on a half-open departure_datetime range
+instead of the `__date` transform, so the database can answer them with a
+range scan of the (departure_airport, arrival_airport, departure_datetime)
+index on Flight.
+
+Results carry the seats left in each cabin (see FlightQuerySet.with_availability),
+read from the SeatInventory counters in the same query, so a search can drop
+the flights that cannot seat the whole party.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Aircraft, Flight
+
+
+def departure_window(date_from, date_to, tz=None):
+    """Turns an inclusive range of local dates into a half-open datetime range.
+
+    Args:
+        date_from (date): The first departure date.
+        date_to (date): The last departure date.
+        tz (tzinfo, optional): The timezone of the dates. Defaults to the current timezone.
+
+    Returns:
+        tuple: The aware datetimes (start, end), where start is midnight at the
+            beginning of date_from and end is midnight after date_to.
+    """
+    tz = tz or timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def search_flights(origin, destination, date_from, date_to, cabin_class='economy', min_price=None, max_price=None,
+                   passengers=1):
+    """Returns the flights of a route departing between two dates with room for a party.
+
+    Args:
+        origin (str): The code of the departure airport.
+        destination (str): The code of the arrival airport.
+        date_from (date): The first departure date, in the current timezone.
+        date_to (date): The last departure date, in the current timezone.
+        cabin_class (str, optional): 'economy', 'business' or 'first'. Other values mean economy.
+        min_price (optional): The lowest ticket price of the cabin class.
+        max_price (optional): The highest ticket price of the cabin class.
+        passengers (int, optional): The party size the cabin class must still have seats for.
+            Zero keeps sold-out flights.
+
+    Returns:
+        QuerySet: The matching flights with their airports and seats left per cabin, ordered by departure time.
+    """
+    seat_class = cabin_class.capitalize()
+    if seat_class not in Flight.PRICE_FIELDS:
+        seat_class = 'Economy'
+    price_field = Flight.PRICE_FIELDS[seat_class]
+    start, end = departure_window(date_from, date_to)
+
+    flights = Flight.objects.filter(
+        departure_airport_id=origin,
+        arrival_airport_id=destination,
+        departure_datetime__gte=start,
+        departure_datetime__lt=end,
+        **{f'aircraft__{Aircraft.CAPACITY_FIELDS[seat_class]}__gt': 0}
+    )
+
+    if min_price:
+        flights = flights.filter(**{f'{price_field}__gte': min_price})
+    if max_price:
+        flights = flights.filter(**{f'{price_field}__lte': max_price})
+
+    flights = flights.with_availability()
+    if passengers > 0:
+        flights = flights.filter(**{f'{Flight.AVAILABILITY_ANNOTATIONS[seat_class]}__gte': passengers})
+
+    return flights.select_related('departure_airport', 'arrival_airport').order_by('departure_datetime')
+
+
+def refresh_availability(flights):
+    """Reloads the seats left per cabin of already loaded flights, e.g. ones read from a cache.
+
+    Args:
+        flights (list): The flights, which get fresh availability annotations.
+
+    Returns:
+        list: The same flights.
+    """
+    if not flights:
+        return flights
+    names = list(Flight.AVAILABILITY_ANNOTATIONS.values())
+    rows = Flight.objects.filter(pk__in=[flight.pk for flight in flights]).with_availability().values_list('pk', *names)
+    availability = {row[0]: row[1:] for row in rows}
+    for flight in flights:
+        for name, available in zip(names, availability.get(flight.pk, (0,) * len(names))):
+            setattr(flight, name, available)
+    return flights
@@ -0,0 +1,173 @@
+"""Cached flight search results.
+
+Results are cached under the normalized search (route, dates, cabin and price
+band) together with a generation number of the route. Saving or deleting a
+flight bumps the generation of its route (see flights.signals), so every
+cached search of that route is missed from then on and expires by itself.
+
+A cold key is recomputed by one request only: the first one takes a short
+lock with cache.add, the others wait briefly for its result.
+
+Seat sales do not bump the generation, so the cache holds every flight of the
+search, sold out or not. The seats left are reloaded for the cached flights
+in one query on every hit, and the party size is applied to them afterwards.
+"""
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+
+from .models import Flight
+from .search import refresh_availability, search_flights
+
+
+RESULT_TIMEOUT = 300
+LOCK_TIMEOUT = 10
+WAIT_SECONDS = 2
+WAIT_STEP = 0.05
+
+_stats = {'hits': 0, 'misses': 0, 'waits': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    """Adds one to a statistics counter of this process."""
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """Returns the search cache statistics of this process.
+
+    Returns:
+        dict: The 'hits', 'misses' and 'waits' counts and the 'hit_ratio'
+            (hits over all lookups, or None before the first lookup).
+    """
+    with _stats_lock:
+        result = dict(_stats)
+    lookups = result['hits'] + result['misses']
+    result['hit_ratio'] = result['hits'] / lookups if lookups else None
+    return result
+
+
+def reset_stats():
+    """Sets all search cache statistics of this process back to zero."""
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _route_key(origin, destination):
+    """Returns the cache key of the generation number of a route."""
+    return f"flight-search:route:{origin}:{destination}"
+
+
+def route_generation(origin, destination):
+    """Returns the current generation number of a route, creating it if needed.
+
+    A new generation starts from the current time rather than zero, so a route
+    whose generation was evicted never reuses the keys of older results.
+
+    Args:
+        origin (str): The code of the departure airport.
+        destination (str): The code of the arrival airport.
+
+    Returns:
+        int: The generation number.
+    """
+    key = _route_key(origin, destination)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def invalidate_route(origin, destination):
+    """Makes every cached search of a route stale.
+
+    Args:
+        origin (str): The code of the departure airport.
+        destination (str): The code of the arrival airport.
+    """
+    key = _route_key(origin, destination)
+    cache.add(key, time.time_ns(), timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def _price(value):
+    """Normalizes a price bound to a string, or '' when it is empty or invalid."""
+    try:
+        return str(Decimal(value).normalize()) if value else ''
+    except InvalidOperation:
+        return ''
+
+
+def search_key(origin, destination, date_from, date_to, cabin_class='economy', min_price=None, max_price=None):
+    """Returns the cache key of a search in the current generation of its route.
+
+    Searches that search_flights treats the same map to the same key.
+
+    Returns:
+        str: The cache key.
+    """
+    seat_class = cabin_class.capitalize()
+    if seat_class not in Flight.PRICE_FIELDS:
+        seat_class = 'Economy'
+    generation = route_generation(origin, destination)
+    return (
+        f"flight-search:{origin}:{destination}:{generation}:{date_from.isoformat()}:{date_to.isoformat()}:"
+        f"{seat_class}:{_price(min_price)}:{_price(max_price)}"
+    )
+
+
+def cached_search_flights(origin, destination, date_from, date_to, cabin_class='economy', min_price=None,
+                          max_price=None, passengers=1):
+    """Returns the results of search_flights, from the cache when possible.
+
+    Takes the same arguments as flights.search.search_flights.
+
+    Returns:
+        list: The matching flights with their airports and current seats left per cabin, ordered by departure time.
+    """
+    origin, destination = origin.strip().upper(), destination.strip().upper()
+    key = search_key(origin, destination, date_from, date_to, cabin_class, min_price, max_price)
+
+    flights = cache.get(key)
+    if flights is not None:
+        _count('hits')
+        return _with_room(refresh_availability(flights), cabin_class, passengers)
+    _count('misses')
+
+    lock_key = f"{key}:lock"
+    owns_lock = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+    if not owns_lock:
+        _count('waits')
+        deadline = time.monotonic() + WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP)
+            flights = cache.get(key)
+            if flights is not None:
+                return _with_room(refresh_availability(flights), cabin_class, passengers)
+
+    try:
+        flights = list(search_flights(
+            origin, destination, date_from, date_to, cabin_class, min_price, max_price, passengers=0
+        ))
+        cache.set(key, flights, timeout=RESULT_TIMEOUT)
+    finally:
+        if owns_lock:
+            cache.delete(lock_key)
+    return _with_room(flights, cabin_class, passengers)
+
+
+def _with_room(flights, cabin_class, passengers):
+    """Returns the flights whose cabin class still has seats for a party."""
+    seat_class = cabin_class.capitalize()
+    if seat_class not in Flight.PRICE_FIELDS:
+        seat_class = 'Economy'
+    return [flight for flight in flights if flight.seats_available(seat_class) >= passengers]
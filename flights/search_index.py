@@ -0,0 +1,176 @@
+"""Text search index of the flight list.
+
+Every flight keeps a lowercased search_document (see Flight.save). It is
+indexed by the database, so the flight list search reads one index instead
+of scanning flights, airports and aircraft:
+
+* On SQLite, the FlightSearch FTS5 table with the trigram tokenizer indexes
+  the documents. Triggers on Flight keep it in sync with every write,
+  including bulk and raw ones. Its rows are keyed on the INTEGER PRIMARY
+  KEY of FlightSearchKey, which maps them to flight numbers, and not on
+  the implicit rowid of Flight: Flight has a text primary key, so VACUUM
+  may renumber its rowids.
+* On PostgreSQL, a pg_trgm GIN index on search_document serves the
+  substring (LIKE) query.
+
+Queries shorter than a trigram, and databases without either index, fall
+back to a LIKE over the search_document column alone. So do SQLite queries
+that match more than SELECTIVE_MATCHES flights: a page of such common terms
+(a city, an aircraft model) is found sooner by walking the flights in list
+order than by collecting and sorting every match.
+"""
+from django.db import connection
+
+from .models import Flight
+
+
+FTS_TABLE = 'FlightSearch'
+KEY_TABLE = 'FlightSearchKey'
+CONTENT_VIEW = 'FlightSearchContent'
+
+SQLITE_INSTALL = [
+    f"""CREATE TABLE IF NOT EXISTS "{KEY_TABLE}" (
+        id INTEGER PRIMARY KEY, flight_number varchar(10) NOT NULL UNIQUE
+    )""",
+    f'DELETE FROM "{KEY_TABLE}" WHERE flight_number NOT IN (SELECT flight_number FROM "Flight")',
+    f'INSERT OR IGNORE INTO "{KEY_TABLE}"(flight_number) SELECT flight_number FROM "Flight"',
+    f"""CREATE VIEW IF NOT EXISTS "{CONTENT_VIEW}" AS
+        SELECT "{KEY_TABLE}".id, "Flight".search_document FROM "{KEY_TABLE}"
+        JOIN "Flight" ON "Flight".flight_number = "{KEY_TABLE}".flight_number""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5(
+        search_document, content='{CONTENT_VIEW}', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS flight_search_insert AFTER INSERT ON "Flight" BEGIN
+        INSERT INTO "{KEY_TABLE}"(flight_number) VALUES (new.flight_number);
+        INSERT INTO "{FTS_TABLE}"(rowid, search_document)
+        VALUES ((SELECT id FROM "{KEY_TABLE}" WHERE flight_number = new.flight_number), new.search_document);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flight_search_delete AFTER DELETE ON "Flight" BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, search_document)
+        VALUES ('delete', (SELECT id FROM "{KEY_TABLE}" WHERE flight_number = old.flight_number), old.search_document);
+        DELETE FROM "{KEY_TABLE}" WHERE flight_number = old.flight_number;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flight_search_update AFTER UPDATE ON "Flight"
+    WHEN old.search_document IS NOT new.search_document OR old.flight_number IS NOT new.flight_number BEGIN
+        INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, search_document)
+        VALUES ('delete', (SELECT id FROM "{KEY_TABLE}" WHERE flight_number = old.flight_number), old.search_document);
+        UPDATE "{KEY_TABLE}" SET flight_number = new.flight_number WHERE flight_number = old.flight_number;
+        INSERT INTO "{FTS_TABLE}"(rowid, search_document)
+        VALUES ((SELECT id FROM "{KEY_TABLE}" WHERE flight_number = new.flight_number), new.search_document);
+    END""",
+    f"""INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES ('rebuild')""",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS flight_search_insert",
+    "DROP TRIGGER IF EXISTS flight_search_delete",
+    "DROP TRIGGER IF EXISTS flight_search_update",
+    f'DROP TABLE IF EXISTS "{FTS_TABLE}"',
+    f'DROP VIEW IF EXISTS "{CONTENT_VIEW}"',
+    f'DROP TABLE IF EXISTS "{KEY_TABLE}"',
+]
+
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS flight_search_document_trgm ON "Flight" USING gin (search_document gin_trgm_ops)',
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS flight_search_document_trgm",
+]
+
+MIN_INDEXED_LENGTH = 3
+SELECTIVE_MATCHES = 1000
+
+_fts_ready = {}
+
+
+def install(schema_editor):
+    """Creates the search index of the database and fills it from the flights.
+
+    It is safe to run again, e.g. after a migration rebuilt the Flight table
+    and dropped its triggers on SQLite.
+
+    Args:
+        schema_editor: The schema editor of the migration, or any object with `connection` and `execute`.
+    """
+    statements = {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+    _fts_ready.clear()
+
+
+def uninstall(schema_editor):
+    """Drops the search index of the database.
+
+    Args:
+        schema_editor: The schema editor of the migration.
+    """
+    statements = {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+    _fts_ready.clear()
+
+
+def _has_fts_table():
+    """Returns whether the FTS table exists in the SQLite database, checking once per database."""
+    name = connection.settings_dict['NAME']
+    if name not in _fts_ready:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts_ready[name] = cursor.fetchone() is not None
+    return _fts_ready[name]
+
+
+def matching_flights(queryset, query):
+    """Narrows a flight queryset to the flights whose search document contains a text.
+
+    On SQLite the FTS table is queried right away, and a selective query
+    narrows the queryset to the flight numbers it found.
+
+    Args:
+        queryset (QuerySet): The flights to search.
+        query (str): The text to look for, in any case.
+
+    Returns:
+        QuerySet: The matching flights.
+    """
+    text = query.strip().lower()
+    if not text:
+        return queryset
+
+    if connection.vendor == 'sqlite' and len(text) >= MIN_INDEXED_LENGTH and _has_fts_table():
+        phrase = '"' + text.replace('"', '""') + '"'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT "{KEY_TABLE}".flight_number FROM "{FTS_TABLE}" '
+                f'JOIN "{KEY_TABLE}" ON "{KEY_TABLE}".id = "{FTS_TABLE}".rowid '
+                f'WHERE "{FTS_TABLE}" MATCH %s LIMIT %s',
+                [phrase, SELECTIVE_MATCHES + 1],
+            )
+            flight_numbers = [row[0] for row in cursor.fetchall()]
+        if len(flight_numbers) <= SELECTIVE_MATCHES:
+            return queryset.filter(pk__in=flight_numbers)
+
+    return queryset.filter(search_document__contains=text)
+
+
+def refresh_search_documents(flights):
+    """Recomputes the search documents of some flights, e.g. after an airport or aircraft changed.
+
+    Args:
+        flights (QuerySet): The flights to refresh.
+
+    Returns:
+        int: The number of flights refreshed.
+    """
+    changed = []
+    for flight in flights.select_related('departure_airport', 'arrival_airport', 'aircraft').iterator():
+        document = Flight.build_search_document(
+            flight.flight_number, flight.departure_airport, flight.arrival_airport, flight.aircraft
+        )
+        if document != flight.search_document:
+            flight.search_document = document
+            changed.append(flight)
+    Flight.objects.bulk_update(changed, ['search_document'], batch_size=500)
+    return len(changed)
@@ -0,0 +1,231 @@
+"""Seat grids: the compiled, read-only seat plan of an aircraft.
+
+The cabin layouts of an aircraft (CabinLayout) are compiled once into a
+SeatGrid. It holds a table of rows, the seats of each row in order with
+aisles between them, and a lookup from seat number to seat. Every seat knows
+its cabin, its position in the aircraft and in its cabin, and whether it is at
+a window, an aisle or an exit. Aircraft without layouts get the default plan
+of rows of six ('ABC DEF') per cabin, sized from their seat counts.
+
+Grids are cached per process under the aircraft, its layout_version and its
+seat counts. Editing a layout bumps the version (see flights.signals), so no
+process keeps using an outdated grid. The same edit sets the seat counts of
+the aircraft, and through bookings.ledger the capacities of its flights, to
+the seats of the grid.
+"""
+import math
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+
+CABIN_ORDER = ('First', 'Business', 'Economy')
+DEFAULT_LETTERS = 'ABC DEF'
+
+Seat = namedtuple('Seat', [
+    'number', 'row', 'letter', 'seat_class', 'index', 'cabin_index', 'window', 'aisle', 'exit_row',
+])
+
+GridRow = namedtuple('GridRow', ['number', 'seat_class', 'cells', 'exit_row'])
+
+Block = namedtuple('Block', ['seat_class', 'first_row', 'last_row', 'letters', 'skipped_rows', 'exit_rows'])
+
+_grids = {}
+_grids_lock = threading.Lock()
+
+
+class SeatGrid:
+    """The seats of an aircraft, row by row.
+
+    Attributes:
+        key: The cache key of the grid.
+        rows: The GridRow of every row, front to back. The cells of a row are
+            its Seats, with None for each aisle.
+        seats: Every Seat, front to back and left to right.
+    """
+
+    def __init__(self, key, blocks):
+        """Compiles blocks of rows into a grid.
+
+        Args:
+            key (tuple): The cache key of the grid.
+            blocks (list): The Block of every block of rows, front to back.
+        """
+        rows, seats, cabins = [], [], {seat_class: [] for seat_class in CABIN_ORDER}
+        for block in sorted(blocks, key=lambda block: block.first_row):
+            groups = block.letters.split()
+            for number in range(block.first_row, block.last_row + 1):
+                if number in block.skipped_rows:
+                    continue
+                exit_row = number in block.exit_rows
+                cells = []
+                for g, group in enumerate(groups):
+                    if g:
+                        cells.append(None)
+                    for i, letter in enumerate(group):
+                        seat = Seat(
+                            number=f"{number}{letter}", row=number, letter=letter, seat_class=block.seat_class,
+                            index=len(seats), cabin_index=len(cabins[block.seat_class]),
+                            window=(g == 0 and i == 0) or (g == len(groups) - 1 and i == len(group) - 1),
+                            aisle=(g > 0 and i == 0) or (g < len(groups) - 1 and i == len(group) - 1),
+                            exit_row=exit_row,
+                        )
+                        cells.append(seat)
+                        seats.append(seat)
+                        cabins[block.seat_class].append(seat)
+                rows.append(GridRow(number, block.seat_class, tuple(cells), exit_row))
+
+        self.key = key
+        self.rows = tuple(rows)
+        self.seats = tuple(seats)
+        self._by_number = MappingProxyType({seat.number: seat for seat in seats})
+        self._cabins = MappingProxyType({seat_class: tuple(cabin) for seat_class, cabin in cabins.items()})
+
+    def seat(self, seat_number):
+        """Returns a seat by its number.
+
+        Args:
+            seat_number (str): A seat number such as '12C'.
+
+        Returns:
+            Seat: The seat, or None if the aircraft has no such seat.
+        """
+        return self._by_number.get(seat_number.strip().upper())
+
+    def cabin(self, seat_class):
+        """Returns the seats of a cabin, front to back.
+
+        Args:
+            seat_class (str): The seat class (e.g., 'Economy', 'Business', 'First').
+
+        Returns:
+            tuple: The seats of the cabin, empty for an unknown class.
+        """
+        return self._cabins.get(seat_class, ())
+
+    def capacity(self, seat_class=None):
+        """Returns the number of seats of a cabin, or of the whole aircraft.
+
+        Args:
+            seat_class (str, optional): The seat class. Defaults to all classes.
+
+        Returns:
+            int: The number of seats.
+        """
+        return len(self.cabin(seat_class)) if seat_class else len(self.seats)
+
+    def cabin_rows(self, seat_class):
+        """Returns the rows of a cabin.
+
+        Args:
+            seat_class (str): The seat class.
+
+        Returns:
+            list: The GridRows of the cabin, front to back.
+        """
+        return [row for row in self.rows if row.seat_class == seat_class]
+
+    def sort_key(self, seat_number):
+        """Returns a key that orders seat numbers front to back and left to right.
+
+        Seats that are not on the aircraft come last, by their number.
+
+        Args:
+            seat_number (str): A seat number.
+
+        Returns:
+            tuple: The sort key.
+        """
+        seat = self.seat(seat_number)
+        return (0, seat.index, '') if seat else (1, 0, seat_number)
+
+
+def default_blocks(aircraft):
+    """Returns the default rows of six for each cabin of an aircraft without layouts.
+
+    Args:
+        aircraft (Aircraft): The aircraft.
+
+    Returns:
+        list: One Block per cabin that has seats.
+    """
+    blocks = []
+    next_row = 1
+    seats_per_row = len(DEFAULT_LETTERS.replace(' ', ''))
+    for seat_class in CABIN_ORDER:
+        rows = math.ceil(aircraft.capacity_for(seat_class) / seats_per_row)
+        if rows:
+            blocks.append(Block(seat_class, next_row, next_row + rows - 1, DEFAULT_LETTERS, frozenset(), frozenset()))
+        next_row += rows
+    return blocks
+
+
+def layout_blocks(aircraft):
+    """Returns the blocks of the cabin layouts of an aircraft.
+
+    Args:
+        aircraft (Aircraft): The aircraft.
+
+    Returns:
+        list: One Block per CabinLayout, or the default blocks if there are none.
+    """
+    blocks = [
+        Block(layout.seat_class, layout.first_row, layout.last_row, layout.letters,
+              frozenset(layout.skipped_row_numbers()), frozenset(layout.exit_row_numbers()))
+        for layout in aircraft.cabin_layouts.all()
+    ]
+    return blocks or default_blocks(aircraft)
+
+
+def grid_key(aircraft):
+    """Returns the cache key of the grid of an aircraft in its current state."""
+    return (aircraft.pk, aircraft.layout_version, aircraft.first_class, aircraft.business_class, aircraft.economy_class)
+
+
+def cached_grid(key):
+    """Returns a grid this process already compiled, or None.
+
+    Args:
+        key (tuple): The key returned by grid_key.
+
+    Returns:
+        SeatGrid: The grid, or None.
+    """
+    return _grids.get(key)
+
+
+def seat_grid(aircraft):
+    """Returns the seat grid of an aircraft, compiling it on first use.
+
+    Args:
+        aircraft (Aircraft): The aircraft.
+
+    Returns:
+        SeatGrid: The grid of the aircraft.
+    """
+    key = grid_key(aircraft)
+    grid = _grids.get(key)
+    if grid is None:
+        grid = SeatGrid(key, layout_blocks(aircraft))
+        with _grids_lock:
+            for old in [k for k in _grids if k[0] == aircraft.pk]:
+                del _grids[old]
+            _grids[key] = grid
+    return grid
+
+
+def layouts_changed(aircraft):
+    """Brings an aircraft in line with its edited cabin layouts.
+
+    Bumps the layout version of the aircraft and sets its seat counts to the
+    seats of the new grid. The caller refreshes the capacities of its flights.
+
+    Args:
+        aircraft (Aircraft): The aircraft whose layouts were saved or deleted.
+    """
+    aircraft.layout_version += 1
+    grid = SeatGrid(None, layout_blocks(aircraft))
+    if aircraft.cabin_layouts.exists():
+        for seat_class, field in aircraft.CAPACITY_FIELDS.items():
+            setattr(aircraft, field, grid.capacity(seat_class))
+    aircraft.save(update_fields=['layout_version', *aircraft.CAPACITY_FIELDS.values()])
@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .airport_index import airport_index
+from .itineraries import route_graph
+from bookings import ledger
+from .models import Aircraft, Airport, CabinLayout, Flight
+from .page_versions import catalog_changed
+from .seat_grid import layouts_changed
+from .search_cache import invalidate_route
+from .search_index import refresh_search_documents
+
+
+def _invalidate(route):
+    """Invalidates the cached searches of a route now and again once the transaction commits.
+
+    The second bump drops results that a concurrent search cached from the
+    rows as they were before the commit.
+    """
+    invalidate_route(*route)
+    transaction.on_commit(lambda: invalidate_route(*route))
+
+
+@receiver(pre_save, sender=Flight)
+def remember_previous_route(sender, instance, raw, **kwargs):
+    """Stores the route a flight had before it is saved, in case the save moves it."""
+    if raw or instance._state.adding:
+        return
+    instance._previous_route = Flight.objects.filter(pk=instance.pk).values_list(
+        'departure_airport_id', 'arrival_airport_id'
+    ).first()
+
+
+@receiver(post_save, sender=Flight)
+def invalidate_saved_flight_route(sender, instance, **kwargs):
+    """Invalidates the cached searches of the route of a saved flight, and of its previous route."""
+    route = (instance.departure_airport_id, instance.arrival_airport_id)
+    _invalidate(route)
+
+    previous = getattr(instance, '_previous_route', None)
+    if previous and previous != route:
+        _invalidate(previous)
+
+
+@receiver(post_save, sender=Flight)
+def update_route_graph(sender, instance, **kwargs):
+    """Moves a saved flight to its new place in the route graph once the transaction commits."""
+    transaction.on_commit(lambda: route_graph.update(instance))
+
+
+@receiver(post_delete, sender=Flight)
+def invalidate_deleted_flight_route(sender, instance, **kwargs):
+    """Invalidates the cached searches of the route of a deleted flight and drops it from the route graph."""
+    _invalidate((instance.departure_airport_id, instance.arrival_airport_id))
+    flight_number = instance.pk
+    transaction.on_commit(lambda: route_graph.remove(flight_number))
+
+
+@receiver(post_save, sender=Airport)
+def refresh_airport_flight_documents(sender, instance, created, raw, **kwargs):
+    """Refreshes the search documents of the flights of an airport whose name or city changed."""
+    if not created and not raw:
+        refresh_search_documents(Flight.objects.filter(Q(departure_airport=instance) | Q(arrival_airport=instance)))
+
+
+@receiver(post_save, sender=Aircraft)
+def refresh_aircraft_flight_documents(sender, instance, created, raw, **kwargs):
+    """Refreshes the search documents of the flights of an aircraft whose model changed."""
+    if not created and not raw:
+        refresh_search_documents(Flight.objects.filter(aircraft=instance))
+
+
+@receiver(post_save, sender=Aircraft)
+def resize_aircraft_flight_cabins(sender, instance, created, raw, **kwargs):
+    """Refreshes the seat capacities of the flights of an aircraft whose seat counts were edited."""
+    if not created and not raw:
+        ledger.aircraft_updated(instance)
+
+
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+def invalidate_airport_index(sender, instance, **kwargs):
+    """Marks the airport autocomplete index stale once the transaction commits."""
+    transaction.on_commit(airport_index.invalidate)
+
+
+@receiver(post_save, sender=CabinLayout)
+@receiver(post_delete, sender=CabinLayout)
+def recompile_aircraft_seat_grid(sender, instance, raw=False, **kwargs):
+    """Retires the seat grid of an aircraft whose layouts changed and resizes its flights' cabins."""
+    if raw:
+        return
+    try:
+        aircraft = Aircraft.objects.get(pk=instance.aircraft_id)
+    except Aircraft.DoesNotExist:
+        return
+    layouts_changed(aircraft)
+    ledger.aircraft_updated(aircraft)
+
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+@receiver(post_save, sender=Airport)
+@receiver(post_delete, sender=Airport)
+@receiver(post_save, sender=Aircraft)
+@receiver(post_delete, sender=Aircraft)
+@receiver(post_save, sender=CabinLayout)
+@receiver(post_delete, sender=CabinLayout)
+def bump_catalog_version(sender, instance, **kwargs):
+    """Marks the cached copies of every flight page stale once the transaction commits."""
+    transaction.on_commit(catalog_changed)
@@ -1,11 +1,42 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.forms import inlineformset_factory
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO
+from zoneinfo import ZoneInfo
 from unittest.mock import patch
-from .models import Flight, Airport, Aircraft
-from bookings.models import Booking, Ticket
+from pypdf import PdfReader
+import csv
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from .forms import CabinLayoutFormSet
+from .models import Flight, Airport, Aircraft, CabinLayout, ReportExport
+from .reports import build_flight_reports, export_row
+from . import search_cache
+from .fares import fare_calendar
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .airport_index import AirportIndex, airport_index
+from .itineraries import RouteGraph, find_itineraries, route_graph
+from .search import departure_window, search_flights
+from . import search_index
+from . import data_exports, page_versions, report_exports, report_pdf
+from .seat_grid import seat_grid
+from bookings import pdf_render
+from bookings import ledger
+from bookings.ledger import find_drift, rebuild_rollups
+from bookings.models import Booking, FlightSalesRollup, SeatInventory, Ticket
+from bookings.testing import FlightTestCase
 from users.models import PassengerProfile
 
 class FlightTests(TestCase):
@@ -114,6 +145,21 @@ class FlightTests(TestCase):
         response = self.client.get(reverse('search_flight'), data)
         self.assertEqual(len(response.context['flights']), 0)
 
+    def test_search_flight_fits_adults_and_children(self):
+        """Tests that the search lists the seats left and hides flights too full for the party."""
+        self.client.login(username='user', password='password')
+        cache.clear()
+        SeatInventory.objects.create(flight=self.flight, seat_class="Economy", capacity=100, sold=97)
+        date_str = timezone.localtime(self.flight.departure_datetime).strftime('%Y-%m-%d')
+        data = {'origin': 'JFK', 'destination': 'LHR', 'date_from': date_str, 'date_to': date_str}
+
+        response = self.client.get(reverse('search_flight'), {**data, 'adults': 2, 'children': 1})
+        self.assertEqual([f.flight_number for f in response.context['flights']], ['SV2020'])
+        self.assertRegex(response.content.decode(), r'3\s+seats left')
+
+        response = self.client.get(reverse('search_flight'), {**data, 'adults': 2, 'children': 2})
+        self.assertEqual(len(response.context['flights']), 0)
+
     def test_flight_details_view(self):
         """Tests that the flight details view loads and contains flight info."""
         self.client.login(username='user', password='password')
@@ -169,9 +215,1294 @@ class FlightTests(TestCase):
         bk.refresh_from_db()
         self.assertEqual(bk.status, 'Cancelled')
 
+    def test_editing_aircraft_seat_counts_resizes_flight_inventory(self):
+        """Tests that changing the seat counts of an aircraft without layouts updates its flights' capacity."""
+        rebuild_rollups(Flight.objects.filter(pk=self.flight.pk))
+
+        self.aircraft.economy_class = 50
+        self.aircraft.save()
+
+        self.assertEqual(SeatInventory.objects.get(flight=self.flight, seat_class='Economy').capacity, 50)
+        self.assertEqual(self.flight.seats_available('Economy'), 50)
+
+    def test_remove_last_passenger_releases_the_seat_once(self):
+        """Tests that cancelling a booking by removing its last passenger leaves other bookings' counters intact."""
+        self.client.login(username='admin', password='password')
+        prof = PassengerProfile.objects.create(user=self.user)
+        with transaction.atomic():
+            others = Booking.objects.create(flight=self.flight, passenger=prof, status='Confirmed')
+            ledger.tickets_added(others, ['10A', '10B', '10C'])
+            Ticket.objects.bulk_create([
+                Ticket(booking=others, seat_number=seat, passenger_name='T', passport='P',
+                       passenger_dob='2000-01-01', nationality='N')
+                for seat in ['10A', '10B', '10C']
+            ])
+            bk = Booking.objects.create(flight=self.flight, passenger=prof, status='Confirmed')
+            ledger.tickets_added(bk, ['11A'])
+            tk = Ticket.objects.create(booking=bk, seat_number='11A', passenger_name='T', passport='P',
+                                       passenger_dob='2000-01-01', nationality='N')
+
+        self.client.post(reverse('remove_passenger', args=[tk.ticket_id]))
+
+        inventory = SeatInventory.objects.get(flight=self.flight, seat_class='Economy')
+        rollup = FlightSalesRollup.objects.get(flight=self.flight, seat_class='Economy')
+        self.assertEqual((inventory.held, inventory.sold), (0, 3))
+        self.assertEqual(rollup.sold, 3)
+        self.assertEqual(rollup.revenue, 300)
+        self.assertEqual(find_drift(Flight.objects.filter(pk=self.flight.pk)), [])
+
     def test_admin_reports_view_loads(self):
         """Tests that the admin reports view loads successfully."""
         self.client.login(username='admin', password='password')
         response = self.client.get(reverse('admin_view_reports'))
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'flights/reports.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'flights/reports.html')
+
+class FlightReportEngineTests(TestCase):
+    """Tests for the grouped report engine behind the admin reports."""
+
+    def setUp(self):
+        """Sets up airports, an aircraft, a passenger and an admin."""
+        self.client = Client()
+        self.admin = get_user_model().objects.create_user(username='admin', password='password', is_staff=True, is_superuser=True)
+        self.profile = PassengerProfile.objects.create(user=get_user_model().objects.create_user(username='user', password='password'))
+
+        self.airport1 = Airport.objects.create(airport_code="JFK", airport_name="JFK", city="NYC", country="USA")
+        self.airport2 = Airport.objects.create(airport_code="LHR", airport_name="LHR", city="London", country="UK")
+        self.aircraft = Aircraft.objects.create(model="B777", economy_class=100, business_class=16, first_class=8)
+
+    def create_flights(self, count):
+        """Bulk creates a number of flights on the same route.
+
+        Args:
+            count (int): The number of flights to create.
+
+        Returns:
+            list: The created flights.
+        """
+        departure = timezone.now() + timedelta(days=1)
+        return Flight.objects.bulk_create([
+            Flight(
+                flight_number=f"FL{i}",
+                departure_datetime=departure + timedelta(minutes=i),
+                arrival_datetime=departure + timedelta(minutes=i, hours=8),
+                economy_price=100, business_price=200, first_class_price=300,
+                departure_airport=self.airport1, arrival_airport=self.airport2, aircraft=self.aircraft,
+            )
+            for i in range(count)
+        ])
+
+    def sell(self, flight, seat_class, seats, status='Confirmed'):
+        """Creates a booking with one ticket per seat on a flight.
+
+        The tickets bypass the booking ledger, so tests rebuild the rollups afterwards.
+        """
+        booking = Booking.objects.create(flight=flight, passenger=self.profile, seat_class=seat_class,
+                                         number_of_passengers=seats, status=status)
+        Ticket.objects.bulk_create([
+            Ticket(booking=booking, seat_number=f'{i + 1}A', passenger_name='T', passport='P',
+                   passenger_dob='2000-01-01', nationality='N')
+            for i in range(seats)
+        ])
+
+    def test_report_rows_match_ticket_sales(self):
+        """Tests that sales, revenue and occupancy are counted per class, ignoring cancelled bookings."""
+        flight_a, flight_b = self.create_flights(2)
+        self.sell(flight_a, 'Economy', 3)
+        self.sell(flight_a, 'First', 1, status='Pending')
+        self.sell(flight_a, 'Business', 5, status='Cancelled')
+        self.sell(flight_b, 'Business', 2)
+        rebuild_rollups()
+
+        rows = {row['flight_obj'].flight_number: row for row in build_flight_reports()}
+
+        self.assertEqual(rows['FL0']['sold'], 4)
+        self.assertEqual((rows['FL0']['eco_sold'], rows['FL0']['bus_sold'], rows['FL0']['first_sold']), (3, 0, 1))
+        self.assertEqual(rows['FL0']['revenue'], 600)
+        self.assertEqual(rows['FL0']['capacity'], 124)
+        self.assertEqual(rows['FL0']['occupancy'], 3.2)
+        self.assertEqual(rows['FL1']['revenue'], 400)
+
+    def test_reports_view_sorted_by_revenue(self):
+        """Tests that the reports page lists flights by revenue for superusers."""
+        flight_a, flight_b = self.create_flights(2)
+        self.sell(flight_a, 'Economy', 1)
+        self.sell(flight_b, 'First', 1)
+        rebuild_rollups()
+
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('admin_view_reports'))
+
+        reports = response.context['flight_reports']
+        self.assertEqual([r['flight_obj'].flight_number for r in reports], ['FL1', 'FL0'])
+        self.assertEqual(response.context['total_tickets'], 2)
+        self.assertEqual(response.context['total_flights'], 2)
+
+    def test_report_query_count_at_10k_flights(self):
+        """Tests that building reports for 10k flights costs a single query."""
+        flights = self.create_flights(10000)
+        for flight in flights[::500]:
+            self.sell(flight, 'Economy', 2)
+        rebuild_rollups()
+
+        with self.assertNumQueries(1):
+            rows = build_flight_reports()
+
+        self.assertEqual(len(rows), 10000)
+        self.assertEqual(sum(row['sold'] for row in rows), 40)
+
+
+class FlightSearchTests(TestCase):
+    """Tests for the sargable flight search query."""
+
+    def setUp(self):
+        """Sets up a route with flights around midnight in Riyadh."""
+        self.origin = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        self.dest = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai", country="UAE")
+        self.aircraft = Aircraft.objects.create(model="Airbus A320", first_class=0, business_class=12, economy_class=60)
+        self.riyadh = ZoneInfo("Asia/Riyadh")
+
+    def create_flight(self, flight_number, departure):
+        """Creates a flight on the test route departing at a Riyadh local time."""
+        departure = departure.replace(tzinfo=self.riyadh)
+        return Flight.objects.create(
+            flight_number=flight_number, aircraft=self.aircraft,
+            departure_datetime=departure, arrival_datetime=departure + timedelta(hours=2),
+            departure_airport=self.origin, arrival_airport=self.dest
+        )
+
+    def test_departure_window_is_half_open_in_local_time(self):
+        """Tests that a date range becomes local midnight to the midnight after it."""
+        start, end = departure_window(date(2026, 5, 10), date(2026, 5, 11), tz=self.riyadh)
+        self.assertEqual(start, datetime(2026, 5, 10, tzinfo=self.riyadh))
+        self.assertEqual(end, datetime(2026, 5, 12, tzinfo=self.riyadh))
+
+    def test_search_includes_whole_local_days_only(self):
+        """Tests the flights just inside and just outside the searched days."""
+        self.create_flight("SV1", datetime(2026, 5, 9, 23, 59))
+        self.create_flight("SV2", datetime(2026, 5, 10, 0, 0))
+        self.create_flight("SV3", datetime(2026, 5, 10, 23, 59))
+        self.create_flight("SV4", datetime(2026, 5, 11, 0, 0))
+
+        flights = search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 10))
+        self.assertEqual([f.flight_number for f in flights], ["SV2", "SV3"])
+
+    def test_search_filters_cabin_and_price(self):
+        """Tests that the cabin class picks both the capacity and the price to filter on."""
+        self.create_flight("SV1", datetime(2026, 5, 10, 9, 0))
+
+        self.assertFalse(search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 10), cabin_class='first'))
+        self.assertTrue(search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 10),
+                                       cabin_class='business', min_price=700, max_price=900))
+        self.assertFalse(search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 10),
+                                        cabin_class='business', max_price=700))
+
+    def test_search_annotates_seats_left_and_fits_the_party(self):
+        """Tests that flights are annotated with seats left and dropped when the party does not fit."""
+        self.create_flight("SV1", datetime(2026, 5, 10, 9, 0))
+        self.create_flight("SV2", datetime(2026, 5, 10, 12, 0))
+        self.create_flight("SV3", datetime(2026, 5, 10, 15, 0))
+        SeatInventory.objects.create(flight_id="SV1", seat_class="Economy", capacity=60, held=2, sold=55)
+        SeatInventory.objects.create(flight_id="SV2", seat_class="Economy", capacity=60, held=10, sold=50)
+
+        with self.assertNumQueries(1):
+            flights = list(search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 10)))
+        self.assertEqual([(f.flight_number, f.economy_available) for f in flights], [("SV1", 3), ("SV3", 60)])
+
+        flights = search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 10), passengers=4)
+        self.assertEqual([f.flight_number for f in flights], ["SV3"])
+
+        flights = search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 10), passengers=0)
+        self.assertEqual([f.flight_number for f in flights], ["SV1", "SV2", "SV3"])
+
+    def test_search_query_can_use_the_route_index(self):
+        """Tests that the query compares the raw column and is planned on the route index."""
+        flights = search_flights("RUH", "DXB", date(2026, 5, 10), date(2026, 5, 12))
+
+        self.assertNotIn('django_datetime_cast_date', str(flights.query))
+        self.assertIn('flight_route_departure_idx', flights.explain())
+
+
+class FlightSearchCacheTests(TestCase):
+    """Tests for the cached flight search and its route-scoped invalidation."""
+
+    def setUp(self):
+        """Sets up two routes with one flight each and an empty cache."""
+        cache.clear()
+        search_cache.reset_stats()
+        self.riyadh = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        self.dubai = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai", country="UAE")
+        self.jeddah = Airport.objects.create(airport_code="JED", airport_name="Jeddah", city="Jeddah", country="KSA")
+        self.aircraft = Aircraft.objects.create(model="Airbus A320", first_class=0, business_class=12, economy_class=60)
+        self.day = date(2026, 5, 10)
+        self.flight = self.create_flight("SV1", self.dubai)
+        self.other = self.create_flight("SV2", self.jeddah)
+
+    def create_flight(self, flight_number, destination):
+        """Creates a morning flight from Riyadh on the test day."""
+        departure = datetime(2026, 5, 10, 9, 0, tzinfo=ZoneInfo("Asia/Riyadh"))
+        return Flight.objects.create(
+            flight_number=flight_number, aircraft=self.aircraft,
+            departure_datetime=departure, arrival_datetime=departure + timedelta(hours=2),
+            departure_airport=self.riyadh, arrival_airport=destination
+        )
+
+    def search(self, origin="RUH", destination="DXB", **kwargs):
+        """Runs a cached search of one day."""
+        return search_cache.cached_search_flights(origin, destination, self.day, self.day, **kwargs)
+
+    def test_repeated_search_is_served_from_cache(self):
+        """Tests that the second identical search only reloads the seats left."""
+        self.search()
+        with self.assertNumQueries(1):
+            flights = self.search()
+
+        self.assertEqual([f.departure_airport.city for f in flights], ["Riyadh"])
+        self.assertEqual(search_cache.stats(), {'hits': 1, 'misses': 1, 'waits': 0, 'hit_ratio': 0.5})
+
+    def test_cached_search_reflects_seats_sold_since(self):
+        """Tests that a cache hit reports the current seats left and fits the party to them."""
+        self.assertEqual([f.economy_available for f in self.search(passengers=3)], [60])
+
+        SeatInventory.objects.create(flight=self.flight, seat_class="Economy", capacity=60, held=1, sold=57)
+
+        self.assertEqual([f.economy_available for f in self.search(passengers=2)], [2])
+        self.assertEqual(self.search(passengers=3), [])
+        self.assertEqual(search_cache.stats()['hits'], 2)
+
+    def test_equivalent_searches_share_a_key(self):
+        """Tests that differently written but equal searches map to one entry."""
+        self.search(min_price='100')
+        with self.assertNumQueries(1):
+            self.search(origin=" ruh", destination="dxb", min_price='100.00', cabin_class='ECONOMY')
+
+    def test_saving_a_flight_invalidates_only_its_route(self):
+        """Tests that a flight change drops the searches of its route and keeps the others."""
+        self.search()
+        self.search(destination="JED")
+
+        self.flight.status = 'Cancelled'
+        self.flight.save()
+
+        with self.assertNumQueries(1):
+            self.search(destination="JED")
+        self.assertEqual(search_cache.stats()['hits'], 1)
+        self.search()
+        self.assertEqual(search_cache.stats()['misses'], 3)
+
+    def test_moving_or_deleting_a_flight_invalidates_its_routes(self):
+        """Tests that a flight moved to another route leaves neither route stale."""
+        self.assertEqual(len(self.search()), 1)
+        self.assertEqual(len(self.search(destination="JED")), 1)
+
+        self.flight.arrival_airport = self.jeddah
+        self.flight.save()
+        self.assertEqual(len(self.search()), 0)
+        self.assertEqual(len(self.search(destination="JED")), 2)
+
+        self.other.delete()
+        self.assertEqual(len(self.search(destination="JED")), 1)
+
+    def test_cold_key_waits_for_the_request_computing_it(self):
+        """Tests that a request finding the recompute lock taken waits for its result."""
+        key = search_cache.search_key("RUH", "DXB", self.day, self.day)
+        cache.add(f"{key}:lock", 1)
+        threading.Timer(0.1, cache.set, args=(key, [self.other])).start()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.search(), [self.other])
+        self.assertEqual(search_cache.stats()['waits'], 1)
+
+
+class ItinerarySearchTests(TestCase):
+    """Tests for the connecting itinerary search over the route graph."""
+
+    def setUp(self):
+        """Sets up four airports and a schedule of direct and connecting flights."""
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username='user', password='password')
+        for code, city in [("RUH", "Riyadh"), ("JED", "Jeddah"), ("CAI", "Cairo"), ("DXB", "Dubai")]:
+            Airport.objects.create(airport_code=code, airport_name=city, city=city, country="Test")
+        self.aircraft = Aircraft.objects.create(model="Airbus A320", first_class=0, business_class=12, economy_class=60)
+        self.day = timezone.localdate() + timedelta(days=10)
+
+        self.create_flight("DIRECT", "RUH", "DXB", 7, 0, 8, 0, price=900)
+        self.create_flight("RJ1", "RUH", "JED", 8, 0, 2, 0, price=200)
+        self.create_flight("JD1", "JED", "DXB", 11, 0, 2, 0, price=300)
+        self.create_flight("JD-SHORT", "JED", "DXB", 10, 15, 2, 0, price=100)
+        self.create_flight("JD-LATE", "JED", "DXB", 18, 30, 2, 0, price=100)
+        self.create_flight("RC1", "RUH", "CAI", 6, 0, 3, 0, price=150)
+        self.create_flight("CJ1", "CAI", "JED", 10, 0, 2, 0, price=150)
+        self.create_flight("JD2", "JED", "DXB", 13, 30, 2, 0, price=150)
+
+    def create_flight(self, flight_number, origin, destination, hour, minute, hours, minutes, price):
+        """Creates a flight departing on the test day at a Riyadh local time."""
+        departure = datetime.combine(self.day, time(hour, minute), tzinfo=ZoneInfo("Asia/Riyadh"))
+        return Flight.objects.create(
+            flight_number=flight_number, aircraft=self.aircraft, economy_price=price,
+            departure_datetime=departure, arrival_datetime=departure + timedelta(hours=hours, minutes=minutes),
+            departure_airport_id=origin, arrival_airport_id=destination
+        )
+
+    def search(self, **kwargs):
+        """Searches RUH to DXB on the test day over a freshly built graph."""
+        graph = RouteGraph()
+        graph.build()
+        return find_itineraries("RUH", "DXB", self.day, self.day, graph=graph, **kwargs)
+
+    def flight_numbers(self, itineraries):
+        """Returns the flight numbers of each itinerary."""
+        return [[leg.flight_number for leg in itinerary.legs] for itinerary in itineraries]
+
+    def test_connections_respect_layover_limits(self):
+        """Tests that connections shorter or longer than allowed are skipped."""
+        found = self.flight_numbers(self.search(max_stops=1))
+
+        self.assertIn(["RJ1", "JD1"], found)
+        self.assertNotIn(["RJ1", "JD-SHORT"], found)
+        self.assertNotIn(["RJ1", "JD-LATE"], found)
+
+    def test_itineraries_ranked_by_duration_then_price(self):
+        """Tests the order of direct, one-stop and two-stop itineraries."""
+        itineraries = self.search()
+
+        self.assertEqual(self.flight_numbers(itineraries), [
+            ["RJ1", "JD1"], ["RJ1", "JD2"], ["DIRECT"], ["RC1", "CJ1", "JD2"],
+        ])
+        self.assertEqual([i.stops for i in itineraries], [1, 1, 0, 2])
+        self.assertEqual(itineraries[0].price, 500)
+        self.assertEqual(itineraries[0].connections(), [("JED", timedelta(hours=1))])
+
+    def test_max_stops_limits_connections(self):
+        """Tests that two-stop itineraries need max_stops=2."""
+        self.assertNotIn(["RC1", "CJ1", "JD2"], self.flight_numbers(self.search(max_stops=1)))
+        self.assertEqual(self.flight_numbers(self.search(max_stops=0)), [["DIRECT"]])
+
+    def test_full_legs_are_skipped(self):
+        """Tests that an itinerary is dropped when one of its flights has too few seats."""
+        SeatInventory.objects.create(flight_id="JD1", seat_class="Economy", capacity=60, sold=59)
+
+        self.assertNotIn(["RJ1", "JD1"], self.flight_numbers(self.search(passengers=2)))
+        self.assertIn(["RJ1", "JD1"], self.flight_numbers(self.search(passengers=1)))
+        self.assertEqual(self.search(seat_class='First'), [])
+
+    def test_graph_follows_flight_changes(self):
+        """Tests that saved, cancelled and deleted flights update the built graph."""
+        route_graph.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_flight("NEW", "RUH", "DXB", 9, 0, 1, 0, price=50)
+        self.assertEqual(route_graph.departures_between(
+            "RUH", *departure_window(self.day, self.day))[-1].flight_number, "NEW")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Flight.objects.filter(pk="DIRECT").update(status='Cancelled')
+            flight = Flight.objects.get(pk="DIRECT")
+            flight.save()
+            Flight.objects.get(pk="NEW").delete()
+
+        found = self.flight_numbers(find_itineraries("RUH", "DXB", self.day, self.day))
+        self.assertNotIn(["DIRECT"], found)
+        self.assertNotIn(["NEW"], found)
+
+    def test_search_itineraries_view(self):
+        """Tests that the itinerary page lists connecting flights."""
+        route_graph.build()
+        self.client.login(username='user', password='password')
+        response = self.client.get(reverse('search_itineraries'), {
+            'origin': 'ruh', 'destination': 'DXB', 'date_from': self.day.isoformat(), 'date_to': self.day.isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['itineraries']), 4)
+        self.assertContains(response, "JD2")
+
+
+class FareCalendarTests(TestCase):
+    """Tests for the fare calendar and its caching."""
+
+    def setUp(self):
+        """Sets up a route with flights on two days of a month."""
+        cache.clear()
+        self.client = Client()
+        self.admin = get_user_model().objects.create_user(
+            username='admin', password='password', is_staff=True, is_superuser=True)
+        self.client.login(username='admin', password='password')
+        self.origin = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        self.dest = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai", country="UAE")
+        self.aircraft = Aircraft.objects.create(model="Airbus A320", first_class=0, business_class=12, economy_class=60)
+
+        self.cheap = self.create_flight("SV1", 3, 8, price=250)
+        self.create_flight("SV2", 3, 23, price=400)
+        self.create_flight("SV3", 5, 9, price=300)
+        self.sold_out = self.create_flight("SV4", 5, 10, price=100)
+        SeatInventory.objects.create(flight=self.sold_out, seat_class="Economy", capacity=60, held=10, sold=50)
+        cancelled = self.create_flight("SV5", 5, 11, price=90)
+        cancelled.status = 'Cancelled'
+        cancelled.save()
+
+    def create_flight(self, flight_number, day, hour, price):
+        """Creates a flight on the test route on a day of November 2030, at a Riyadh local hour."""
+        departure = datetime(2030, 11, day, hour, 0, tzinfo=ZoneInfo("Asia/Riyadh"))
+        return Flight.objects.create(
+            flight_number=flight_number, aircraft=self.aircraft, economy_price=price,
+            departure_datetime=departure, arrival_datetime=departure + timedelta(hours=2),
+            departure_airport=self.origin, arrival_airport=self.dest
+        )
+
+    def calendar(self, **params):
+        """Requests the economy fare calendar of the test route."""
+        return self.client.get(reverse('flight_fare_calendar'), {
+            'origin': 'RUH', 'destination': 'DXB', 'cabin_class': 'economy', **params,
+        }).json()
+
+    def test_month_has_lowest_bookable_fare_per_day(self):
+        """Tests that sold out and cancelled flights are ignored and empty days are null."""
+        days = self.calendar(month='2030-11')['days']
+
+        self.assertEqual(len(days), 30)
+        self.assertEqual(days[2], {'date': '2030-11-03', 'lowest_fare': '250.00', 'flights': 2})
+        self.assertEqual(days[3], {'date': '2030-11-04', 'lowest_fare': None, 'flights': 0})
+        self.assertEqual(days[4], {'date': '2030-11-05', 'lowest_fare': '300.00', 'flights': 1})
+
+    def test_month_is_one_query_then_cached(self):
+        """Tests that a month is computed with one grouped query and then served from cache."""
+        with self.assertNumQueries(1):
+            days = fare_calendar("RUH", "DXB", "Economy", date(2030, 11, 1), date(2030, 11, 30))
+        with self.assertNumQueries(0):
+            self.assertEqual(fare_calendar("RUH", "DXB", "Economy", date(2030, 11, 1), date(2030, 11, 30)), days)
+
+    def test_window_around_a_date(self):
+        """Tests the days of a window that spans two months."""
+        days = self.calendar(date='2030-12-01', window=2)['days']
+
+        self.assertEqual([day['date'] for day in days],
+                         ['2030-11-29', '2030-11-30', '2030-12-01', '2030-12-02', '2030-12-03'])
+
+    def test_invalid_requests_are_rejected(self):
+        """Tests the errors of missing routes, bad classes and bad dates."""
+        self.assertEqual(self.client.get(reverse('flight_fare_calendar'), {'month': '2030-11'}).status_code, 400)
+        self.assertIn('error', self.calendar(month='2030-11', cabin_class='premium'))
+        self.assertIn('error', self.calendar(date='tomorrow'))
+
+    def test_dates_at_the_ends_of_the_calendar_are_rejected(self):
+        """Tests that windows running past the first or last representable day are a 400, not a crash."""
+        for params in ({'date': '0001-01-01'}, {'date': '9999-12-31'}, {'date': '9999-12-30', 'window': 5},
+                       {'month': '9999-12'}, {'month': '0001-01'}):
+            response = self.client.get(reverse('flight_fare_calendar'), {'origin': 'RUH', 'destination': 'DXB', **params})
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_edit_flight_invalidates_the_month(self):
+        """Tests that a price change made through edit_flight shows up at once."""
+        self.calendar(month='2030-11')
+
+        self.client.post(reverse('edit_flight', args=['SV1']), {
+            'flight_number': 'SV1', 'aircraft': self.aircraft.aircraft_id,
+            'departure_airport': 'RUH', 'arrival_airport': 'DXB',
+            'departure_datetime': '2030-11-03T08:00', 'arrival_datetime': '2030-11-03T10:00',
+            'economy_price': 150, 'business_price': 800, 'first_class_price': 1500, 'status': 'Scheduled',
+        })
+
+        self.assertEqual(self.calendar(month='2030-11')['days'][2]['lowest_fare'], '150.00')
+
+
+class FlightListPaginationTests(TestCase):
+    """Tests for the keyset-paginated flight management list."""
+
+    def setUp(self):
+        """Sets up seven flights, two of them departing at the same time."""
+        self.client = Client()
+        get_user_model().objects.create_user(username='admin', password='password', is_staff=True)
+        self.client.login(username='admin', password='password')
+        origin = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        dest = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai", country="UAE")
+        aircraft = Aircraft.objects.create(model="Airbus A320")
+        start = timezone.now() + timedelta(days=1)
+        departures = {"SV7": 0, "SV6": 1, "SV5": 2, "SV4": 2, "SV3": 3, "SV2": 4, "SV1": 5}
+        for flight_number, hours in departures.items():
+            Flight.objects.create(
+                flight_number=flight_number, aircraft=aircraft,
+                departure_datetime=start + timedelta(hours=hours),
+                arrival_datetime=start + timedelta(hours=hours + 2),
+                departure_airport=origin, arrival_airport=dest
+            )
+        self.expected = ["SV7", "SV6", "SV4", "SV5", "SV3", "SV2", "SV1"]
+
+    def get_page(self, **params):
+        """Requests one JSON page of the flight list."""
+        return self.client.get(reverse('view_flights'), {'format': 'json', 'page_size': 3, **params}).json()
+
+    def test_pages_walk_every_flight_once_in_order(self):
+        """Tests that following next cursors visits all flights in departure order."""
+        seen, page = [], self.get_page()
+        while True:
+            seen += [flight['flight_number'] for flight in page['flights']]
+            if not page['next_cursor']:
+                break
+            page = self.get_page(after=page['next_cursor'])
+
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_cursor_returns_to_the_earlier_page(self):
+        """Tests that a before cursor gives back the page before."""
+        second = self.get_page(after=self.get_page()['next_cursor'])
+        first = self.get_page(before=second['previous_cursor'])
+
+        self.assertEqual([f['flight_number'] for f in first['flights']], self.expected[:3])
+        self.assertIsNone(first['previous_cursor'])
+
+    def test_page_queries_do_not_grow_with_page_size_or_depth(self):
+        """Tests that airports and aircraft are loaded with the page itself."""
+        def count_queries(**params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('view_flights'), params)
+            return len(queries), response
+
+        small, _ = count_queries(page_size=2)
+        large, response = count_queries(page_size=7)
+        deep_cursor = self.get_page(after=self.get_page()['next_cursor'])['next_cursor']
+        deep, _ = count_queries(page_size=3, after=deep_cursor)
+
+        self.assertEqual(small, large)
+        self.assertEqual(deep, large)
+        self.assertEqual(len(response.context['flights']), 7)
+
+    @override_settings(FLIGHTS_PAGE_SIZE=4)
+    def test_page_size_setting_and_bad_cursor(self):
+        """Tests the default page size and that a bad cursor shows the first page or a JSON error."""
+        response = self.client.get(reverse('view_flights'), {'after': 'not-a-cursor'})
+        self.assertEqual([f.flight_number for f in response.context['flights']], self.expected[:4])
+
+        response = self.client.get(reverse('view_flights'), {'format': 'json', 'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_deep_page_uses_the_departure_index(self):
+        """Tests that a page after a cursor is planned on the (departure_datetime, flight_number) index."""
+        flight = Flight.objects.get(pk="SV5")
+        queryset = Flight.objects.all()
+        departure, flight_number = decode_cursor(encode_cursor(flight))
+        self.assertEqual((departure, flight_number), (flight.departure_datetime, "SV5"))
+
+        page = keyset_page(queryset, 2, after=encode_cursor(flight))
+        self.assertEqual([f.flight_number for f in page.flights], ["SV3", "SV2"])
+        plan = queryset.filter(departure_datetime__gte=departure).order_by('departure_datetime', 'flight_number')
+        self.assertIn('flight_departure_order_idx', plan.explain())
+
+
+class FlightTextSearchTests(TestCase):
+    """Tests for the indexed text search of the flight list."""
+
+    def setUp(self):
+        """Sets up three flights between three airports on two aircraft."""
+        self.client = Client()
+        get_user_model().objects.create_user(username='admin', password='password', is_staff=True)
+        self.client.login(username='admin', password='password')
+        self.riyadh = Airport.objects.create(airport_code="RUH", airport_name="King Khalid", city="Riyadh", country="KSA")
+        dubai = Airport.objects.create(airport_code="DXB", airport_name="Dubai Intl", city="Dubai", country="UAE")
+        cairo = Airport.objects.create(airport_code="CAI", airport_name="Cairo Intl", city="Cairo", country="Egypt")
+        airbus = Aircraft.objects.create(model="Airbus A320")
+        self.boeing = Aircraft.objects.create(model="Boeing 787")
+        start = timezone.now() + timedelta(days=1)
+        for flight_number, origin, dest, aircraft in [
+            ("SV1001", self.riyadh, dubai, airbus),
+            ("EK2002", dubai, cairo, self.boeing),
+            ("MS3003", cairo, self.riyadh, airbus),
+        ]:
+            Flight.objects.create(
+                flight_number=flight_number, aircraft=aircraft,
+                departure_datetime=start, arrival_datetime=start + timedelta(hours=3),
+                departure_airport=origin, arrival_airport=dest
+            )
+
+    def search(self, query):
+        """Returns the flight numbers the flight list finds for a query."""
+        response = self.client.get(reverse('view_flights'), {'format': 'json', 'search': query})
+        return sorted(flight['flight_number'] for flight in response.json()['flights'])
+
+    def test_search_document_is_kept_on_save(self):
+        """Tests that saving a flight writes its lowercased search document."""
+        flight = Flight.objects.get(flight_number="SV1001")
+        self.assertEqual(flight.search_document, "sv1001 ruh riyadh dxb dubai airbus a320")
+
+        flight.arrival_airport_id = "CAI"
+        flight.save(update_fields=['arrival_airport'])
+
+        self.assertIn("cairo", Flight.objects.get(flight_number="SV1001").search_document)
+
+    def test_search_matches_every_searchable_field(self):
+        """Tests that cities, codes, aircraft models and flight number fragments are found in any case."""
+        self.assertEqual(self.search("riyadh"), ["MS3003", "SV1001"])
+        self.assertEqual(self.search("CAI"), ["EK2002", "MS3003"])
+        self.assertEqual(self.search("boeing 7"), ["EK2002"])
+        self.assertEqual(self.search("1001"), ["SV1001"])
+        self.assertEqual(self.search("oslo"), [])
+
+    def test_search_reads_the_full_text_index(self):
+        """Tests that a query of a trigram or more is answered from the FTS table on SQLite."""
+        if connection.vendor != 'sqlite':
+            self.skipTest("The FTS table only exists on SQLite")
+        with CaptureQueriesContext(connection) as queries:
+            list(search_index.matching_flights(Flight.objects.all(), "Dubai"))
+
+        self.assertIn(search_index.FTS_TABLE, queries.captured_queries[0]['sql'])
+
+    def test_search_survives_renumbered_flight_rowids(self):
+        """Tests that the FTS table does not depend on the rowids of Flight, which VACUUM may renumber."""
+        if connection.vendor != 'sqlite':
+            self.skipTest("The FTS table only exists on SQLite")
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE "Flight" SET rowid = rowid + 1000')
+
+        self.assertEqual(self.search("riyadh"), ["MS3003", "SV1001"])
+        Flight.objects.filter(flight_number="EK2002").delete()
+        self.assertEqual(self.search("CAI"), ["MS3003"])
+
+    def test_short_and_common_queries_fall_back_to_the_document_column(self):
+        """Tests that queries too short for trigrams or matching many flights scan the document column."""
+        with patch.object(search_index, 'SELECTIVE_MATCHES', 1):
+            common = search_index.matching_flights(Flight.objects.all(), "airbus")
+            self.assertIn('search_document', str(common.query))
+            self.assertEqual(sorted(common.values_list('flight_number', flat=True)), ["MS3003", "SV1001"])
+
+        self.assertEqual(self.search("ek"), ["EK2002"])
+
+    def test_renaming_an_airport_or_aircraft_refreshes_its_flights(self):
+        """Tests that changing a city or aircraft model updates the documents of its flights."""
+        self.riyadh.city = "Ar Riyad"
+        self.riyadh.save()
+        self.boeing.model = "Dreamliner"
+        self.boeing.save()
+
+        self.assertEqual(self.search("ar riyad"), ["MS3003", "SV1001"])
+        self.assertEqual(self.search("dreamliner"), ["EK2002"])
+        self.assertEqual(self.search("boeing"), [])
+
+    def test_deleted_flights_leave_the_index(self):
+        """Tests that a deleted flight is no longer found."""
+        Flight.objects.filter(flight_number="EK2002").delete()
+
+        self.assertEqual(self.search("dubai"), ["SV1001"])
+
+
+class AirportAutocompleteTests(TestCase):
+    """Tests for the airport prefix index and its autocomplete endpoint."""
+
+    def setUp(self):
+        """Sets up a handful of airports and a fresh index."""
+        self.client = Client()
+        get_user_model().objects.create_user(username='passenger', password='password')
+        self.client.login(username='passenger', password='password')
+        for code, name, city, country in [
+            ("RUH", "King Khalid International", "Riyadh", "Saudi Arabia"),
+            ("JED", "King Abdulaziz International", "Jeddah", "Saudi Arabia"),
+            ("DXB", "Dubai International", "Dubai", "United Arab Emirates"),
+            ("DWC", "Al Maktoum International", "Dubai", "United Arab Emirates"),
+            ("SAO", "Sao Paulo Intl", "São Paulo", "Brazil"),
+            ("RIX", "Riga International", "Riga", "Latvia"),
+        ]:
+            Airport.objects.create(airport_code=code, airport_name=name, city=city, country=country)
+        self.index = AirportIndex()
+        airport_index.invalidate()
+
+    def codes(self, query, limit=10):
+        """Returns the codes the index suggests for a query."""
+        return [airport['code'] for airport in self.index.lookup(query, limit)]
+
+    def test_lookup_matches_any_word_of_any_field(self):
+        """Tests that code, city, name and country prefixes all match, in any case."""
+        self.assertEqual(self.codes("dxb"), ["DXB"])
+        self.assertEqual(self.codes("Jedd"), ["JED"])
+        self.assertEqual(self.codes("abdul"), ["JED"])
+        self.assertEqual(self.codes("saudi ar"), ["JED", "RUH"])
+        self.assertEqual(self.codes("latv"), ["RIX"])
+        self.assertEqual(self.codes("xyz"), [])
+        self.assertEqual(self.codes("  "), [])
+
+    def test_lookup_ignores_accents(self):
+        """Tests that a city with accents matches a query without them and the other way round."""
+        self.assertEqual(self.codes("sao p"), ["SAO"])
+        self.assertEqual(self.codes("são"), ["SAO"])
+
+    def test_code_matches_rank_before_other_fields(self):
+        """Tests that airports whose code matches come before those whose city or name matches."""
+        self.assertEqual(self.codes("ri"), ["RIX", "RUH"])
+        self.assertEqual(self.codes("r"), ["RIX", "RUH"])
+        self.assertEqual(self.codes("riy"), ["RUH"])
+        self.assertEqual(self.codes("d"), ["DWC", "DXB"])
+        self.assertEqual(self.codes("sa"), ["SAO", "JED", "RUH"])
+
+    def test_short_prefixes_match_a_full_scan(self):
+        """Tests that the precomputed short prefixes rank like the scan of longer ones."""
+        with patch('flights.airport_index.PRECOMPUTED_PREFIX_LENGTH', 0):
+            scanned = {query: self.codes(query) for query in ["s", "sa", "int", "k", "dub"]}
+        self.index.invalidate()
+
+        self.assertEqual({query: self.codes(query) for query in scanned}, scanned)
+
+    def test_limit_is_applied_and_capped(self):
+        """Tests that only the best 'limit' airports are returned, and never more than MAX_LIMIT."""
+        self.assertEqual(self.codes("i", limit=2), ["DWC", "DXB"])
+        self.assertEqual(len(self.index.lookup("i", limit=500)), 6)
+
+    def test_endpoint_returns_airports_as_json(self):
+        """Tests that the endpoint returns the suggestions of the shared index."""
+        response = self.client.get(reverse('airport_autocomplete'), {'q': 'dub', 'limit': 'x'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['airports'], [
+            {'code': "DWC", 'name': "Al Maktoum International", 'city': "Dubai", 'country': "United Arab Emirates"},
+            {'code': "DXB", 'name': "Dubai International", 'city': "Dubai", 'country': "United Arab Emirates"},
+        ])
+
+    def test_endpoint_requires_login(self):
+        """Tests that anonymous users are redirected to the login page."""
+        self.client.logout()
+        response = self.client.get(reverse('airport_autocomplete'), {'q': 'dub'})
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_changed_airports_rebuild_the_index(self):
+        """Tests that saving or deleting an airport is picked up by the next lookup."""
+        self.assertEqual([a['code'] for a in airport_index.lookup("riga")], ["RIX"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.filter(airport_code="RIX").delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            Airport.objects.create(airport_code="RGN", airport_name="Yangon", city="Rangoon", country="Myanmar")
+
+        self.assertEqual([a['code'] for a in airport_index.lookup("r")], ["RGN", "RUH"])
+        self.assertEqual(airport_index.lookup("riga"), [])
+
+
+class SeatGridTests(TestCase):
+    """Tests for cabin layouts and the seat grids compiled from them."""
+
+    def setUp(self):
+        """Sets up a wide-body aircraft with two cabins and a flight on it."""
+        self.aircraft = Aircraft.objects.create(model="Boeing 787", first_class=0, business_class=12, economy_class=60)
+        self.business = CabinLayout.objects.create(aircraft=self.aircraft, seat_class='Business',
+                                                   first_row=1, last_row=3, letters='AC DG HK')
+        self.economy = CabinLayout.objects.create(aircraft=self.aircraft, seat_class='Economy', first_row=10,
+                                                  last_row=14, letters='ABC DEFG HJK', skipped_rows='13',
+                                                  exit_rows='10')
+        self.aircraft.refresh_from_db()
+        airport = Airport.objects.create(airport_code="RUH", airport_name="Riyadh", city="Riyadh", country="KSA")
+        self.flight = Flight.objects.create(
+            flight_number="SV787", aircraft=self.aircraft,
+            departure_datetime=timezone.now() + timedelta(days=3),
+            arrival_datetime=timezone.now() + timedelta(days=3, hours=2),
+            departure_airport=airport, arrival_airport=airport
+        )
+
+    def test_layouts_compile_to_rows_and_seats(self):
+        """Tests the rows, aisles and seat attributes of a compiled grid."""
+        grid = seat_grid(self.aircraft)
+
+        self.assertEqual([row.number for row in grid.rows], [1, 2, 3, 10, 11, 12, 14])
+        self.assertEqual([cell.letter if cell else None for cell in grid.rows[3].cells],
+                         ['A', 'B', 'C', None, 'D', 'E', 'F', 'G', None, 'H', 'J', 'K'])
+        self.assertTrue(grid.rows[3].exit_row)
+        self.assertFalse(grid.rows[4].exit_row)
+
+        window, aisle, middle = grid.seat('11A'), grid.seat('11C'), grid.seat('11E')
+        self.assertEqual((window.window, window.aisle), (True, False))
+        self.assertEqual((aisle.window, aisle.aisle), (False, True))
+        self.assertEqual((middle.window, middle.aisle), (False, False))
+        self.assertEqual(grid.seat('14a').cabin_index, 30)
+        self.assertEqual(grid.seat('1A').index, 0)
+        self.assertEqual(grid.seat('10A').index, 18)
+        self.assertIsNone(grid.seat('13A'))
+        self.assertIsNone(grid.seat('1B'))
+
+    def test_layouts_set_seat_counts_and_inventory(self):
+        """Tests that editing layouts resizes the aircraft and the seat inventory of its flights."""
+        self.assertEqual((self.aircraft.business_class, self.aircraft.economy_class), (18, 40))
+        self.assertEqual(self.flight.seats_available('Economy'), 40)
+        rebuild_rollups(Flight.objects.filter(pk=self.flight.pk))
+
+        self.economy.skipped_rows = '13, 14'
+        self.economy.save()
+        self.aircraft.refresh_from_db()
+
+        self.assertEqual(self.aircraft.economy_class, 30)
+        self.assertEqual(SeatInventory.objects.get(flight=self.flight, seat_class='Economy').capacity, 30)
+        self.assertEqual(seat_grid(self.aircraft).capacity('Economy'), 30)
+
+    def test_grid_is_compiled_once_per_layout_version(self):
+        """Tests that a grid is reused until its layouts change."""
+        grid = seat_grid(self.aircraft)
+        with self.assertNumQueries(0):
+            self.assertIs(seat_grid(self.aircraft), grid)
+
+        self.business.delete()
+        self.aircraft.refresh_from_db()
+
+        self.assertIsNot(seat_grid(self.aircraft), grid)
+        self.assertIsNone(seat_grid(self.aircraft).seat('1A'))
+        self.assertEqual(self.aircraft.business_class, 0)
+
+    def test_invalid_layout_is_rejected(self):
+        """Tests that malformed rows and letters fail validation."""
+        for fields in [{'last_row': 0}, {'letters': 'AB BC'}, {'letters': 'ab cd'}, {'exit_rows': '12, x'}]:
+            layout = CabinLayout(**{'aircraft': self.aircraft, 'seat_class': 'First', 'first_row': 20, 'last_row': 21,
+                                    **fields})
+            with self.assertRaises(ValidationError):
+                layout.full_clean()
+
+    def test_overlapping_row_blocks_are_rejected(self):
+        """Tests that a block may not share rows with another block of the aircraft."""
+        overlapping = CabinLayout(aircraft=self.aircraft, seat_class='First', first_row=3, last_row=8)
+        with self.assertRaises(ValidationError):
+            overlapping.full_clean()
+
+        self.business.full_clean()
+        CabinLayout(aircraft=self.aircraft, seat_class='First', first_row=4, last_row=9).full_clean()
+
+    def test_admin_formset_rejects_overlapping_row_blocks(self):
+        """Tests that the aircraft admin rejects blocks that overlap each other in one submission."""
+        LayoutFormSet = inlineformset_factory(Aircraft, CabinLayout, formset=CabinLayoutFormSet,
+                                              fields=['seat_class', 'first_row', 'last_row', 'letters'], extra=0)
+        data = {
+            'cabin_layouts-TOTAL_FORMS': '3', 'cabin_layouts-INITIAL_FORMS': '2',
+            'cabin_layouts-0-id': self.business.pk, 'cabin_layouts-0-seat_class': 'Business',
+            'cabin_layouts-0-first_row': '1', 'cabin_layouts-0-last_row': '3', 'cabin_layouts-0-letters': 'AC DG HK',
+            'cabin_layouts-1-id': self.economy.pk, 'cabin_layouts-1-seat_class': 'Economy',
+            'cabin_layouts-1-first_row': '10', 'cabin_layouts-1-last_row': '14',
+            'cabin_layouts-1-letters': 'ABC DEFG HJK',
+            'cabin_layouts-2-seat_class': 'First', 'cabin_layouts-2-first_row': '20', 'cabin_layouts-2-last_row': '22',
+            'cabin_layouts-2-letters': 'A K',
+        }
+        self.assertTrue(LayoutFormSet(data, instance=self.aircraft).is_valid())
+
+        formset = LayoutFormSet({**data, 'cabin_layouts-2-first_row': '12'}, instance=self.aircraft)
+        self.assertFalse(formset.is_valid())
+
+        new_aircraft = Aircraft(model="Airbus A350")
+        formset = LayoutFormSet({**data, 'cabin_layouts-INITIAL_FORMS': '0', 'cabin_layouts-0-id': '',
+                                 'cabin_layouts-1-id': '', 'cabin_layouts-1-first_row': '2'}, instance=new_aircraft)
+        self.assertFalse(formset.is_valid())
+        self.assertIn("overlap", str(formset.non_form_errors()))
+
+    def test_manifest_is_sorted_by_seat_position(self):
+        """Tests that the manifest lists seats front to back and left to right."""
+        staff = get_user_model().objects.create_user(username='staff', password='password', is_staff=True)
+        passenger = PassengerProfile.objects.create(user=get_user_model().objects.create_user(username='flyer'))
+        booking = Booking.objects.create(flight=self.flight, passenger=passenger, seat_class='Economy',
+                                         number_of_passengers=4, status='Confirmed')
+        for seat in ('14A', '10K', '2C', '10A'):
+            Ticket.objects.create(booking=booking, seat_number=seat, passenger_name='Test Passenger',
+                                  passport='P12345678', nationality='1010101010', passenger_dob=date(1990, 1, 1))
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse('flight_manifest', args=[self.flight.flight_number]))
+
+        self.assertEqual([t.seat_number for t in response.context['tickets']], ['2C', '10A', '10K', '14A'])
+        self.assertEqual(response.context['total_seats'], 58)
+
+
+class FlightPageVersionTests(FlightTestCase):
+    """Tests for the ETags and 304 responses of flight pages."""
+
+    flight_number = 'SV304'
+    username = 'revisitor'
+
+    def setUp(self):
+        """Sets up a flight, a logged in passenger and an empty cache."""
+        cache.clear()
+        super().setUp()
+        self.client.force_login(self.profile.user)
+
+    def revalidate(self, url):
+        """Fetches a page, then fetches it again with its ETag.
+
+        Returns:
+            tuple: The first and second responses.
+        """
+        first = self.client.get(url)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_unchanged_flight_page_is_not_rendered_again(self):
+        """Tests that a revalidated flight page costs only the session and user lookups."""
+        url = reverse('flight_details', args=[self.flight.flight_number])
+        first = self.client.get(url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(2):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.templates, [])
+
+    def test_flight_edit_changes_the_etag(self):
+        """Tests that saving a flight re-renders the flight list and flight pages."""
+        details = reverse('flight_details', args=[self.flight.flight_number])
+        listing = reverse('view_flights')
+        tags = [self.client.get(url)['ETag'] for url in (details, listing)]
+
+        self.flight.status = 'Delayed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flight.save()
+
+        for url, tag in zip((details, listing), tags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], tag)
+
+    def test_seat_changes_re_render_the_seat_map(self):
+        """Tests that held seats invalidate the seat selection page of their flight only."""
+        seats = reverse('seat_selection', args=[self.flight.flight_number, 'Economy'])
+        details = reverse('flight_details', args=[self.flight.flight_number])
+        self.assertEqual(self.revalidate(seats)[1].status_code, 304)
+        details_tag = self.client.get(details)['ETag']
+        tag = self.client.get(seats)['ETag']
+
+        self.hold('3C')
+
+        response = self.client.get(seats, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['seat_map']['bitmap'])
+        self.assertEqual(self.client.get(details, HTTP_IF_NONE_MATCH=details_tag).status_code, 304)
+
+    def test_revalidation_still_records_the_party(self):
+        """Tests that the party size is stored in the session even when the page is not re-rendered."""
+        url = reverse('seat_selection', args=[self.flight.flight_number, 'Economy'])
+        tag = self.client.get(url, {'adults': 2})['ETag']
+        self.client.get(url, {'adults': 1})
+
+        response = self.client.get(url, {'adults': 2}, HTTP_IF_NONE_MATCH=tag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.session['adults'], 2)
+
+    def test_pending_messages_force_a_render(self):
+        """Tests that a page is rendered when it has messages to show."""
+        url = reverse('flight_details', args=[self.flight.flight_number])
+        tag = self.client.get(url)['ETag']
+
+        with patch('flights.page_versions.get_messages', return_value=['Booking cancelled.']):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_catalog_stamp_lapses(self):
+        """Tests that the catalog stamp runs out, so a process that missed a change stops answering 304."""
+        url = reverse('flight_details', args=[self.flight.flight_number])
+        tag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=tag).status_code, 304)
+
+        later = timezone.now().timestamp() + page_versions.CATALOG_VERSION_TIMEOUT + 1
+        with patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=tag).status_code, 200)
+
+
+class ReportExportTests(FlightTestCase):
+    """Tests for the report PDF exports built in the background."""
+
+    flight_number = None
+    username = None
+
+    def setUp(self):
+        """Sets up a few flights, a superuser, a staff member and an empty export directory."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(REPORT_EXPORT_DIR=self.directory, REPORT_EXPORT_WORKERS=0, PDF_RENDER_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.admin = get_user_model().objects.create_user(username='admin', password='password', is_staff=True, is_superuser=True)
+        self.staff = get_user_model().objects.create_user(username='staff', password='password', is_staff=True)
+        super().setUp()
+        self.create_flights(700, 5)
+
+    def submit(self, report_type='general'):
+        """Submits an export and runs it to completion.
+
+        Returns:
+            HttpResponse: The response of the submit endpoint.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('submit_report_export'), {'report_type': report_type})
+
+    def test_export_is_built_in_chunks_and_downloadable(self):
+        """Tests that an export reports its progress per chunk and serves the finished PDF."""
+        self.client.force_login(self.admin)
+        with patch.object(report_exports, 'CHUNK_SIZE', 2), \
+                patch.object(report_exports, '_progress', wraps=report_exports._progress) as progress:
+            response = self.submit('financial')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'Queued')
+        processed = [call.kwargs['processed'] for call in progress.call_args_list if 'status' not in call.kwargs]
+        self.assertEqual(processed, [2, 4, 5])
+
+        status = self.client.get(response['Location']).json()
+        self.assertEqual((status['status'], status['progress'], status['processed'], status['total']), ('Done', 100, 5, 5))
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+    def test_identical_parameters_reuse_the_export_until_it_expires(self):
+        """Tests that the same report is built once per TTL."""
+        self.client.force_login(self.admin)
+        first = self.submit().json()
+        second = self.submit()
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['id'], first['id'])
+        self.assertEqual(ReportExport.objects.count(), 1)
+
+        ReportExport.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotEqual(self.submit().json()['id'], first['id'])
+        self.assertEqual(ReportExport.objects.count(), 2)
+
+    def test_concurrent_submits_share_one_export(self):
+        """Tests that a submit racing another one for the same parameters returns the running export."""
+        params_hash = report_exports.parameters_hash('general', True)
+        running = ReportExport.objects.create(report_type='general', show_financials=True, params_hash=params_hash,
+                                              status='Running')
+
+        with patch.object(report_exports, 'reusable_export', return_value=None), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            export, created = report_exports.submit('general', self.admin)
+
+        self.assertEqual((export.pk, created), (running.pk, False))
+        self.assertEqual(callbacks, [])
+        self.assertEqual(ReportExport.objects.count(), 1)
+
+    def test_stalled_export_is_replaced_on_submit(self):
+        """Tests that submitting fails a stalled export of the same parameters and builds a new one."""
+        params_hash = report_exports.parameters_hash('general', True)
+        stalled = ReportExport.objects.create(report_type='general', show_financials=True, params_hash=params_hash,
+                                              status='Running')
+        ReportExport.objects.filter(pk=stalled.pk).update(
+            updated_at=timezone.now() - report_exports.STALE_AFTER - timedelta(minutes=1))
+        self.client.force_login(self.admin)
+
+        export = self.submit().json()
+
+        self.assertNotEqual(export['id'], stalled.pk)
+        self.assertEqual(ReportExport.objects.get(pk=export['id']).status, 'Done')
+        stalled.refresh_from_db()
+        self.assertEqual(stalled.status, 'Failed')
+
+    def test_financial_exports_are_for_superusers_only(self):
+        """Tests that staff can neither export revenue nor see an export that includes it."""
+        self.client.force_login(self.admin)
+        export_id = self.submit('financial').json()['id']
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.submit('financial').status_code, 403)
+        self.assertEqual(self.client.get(reverse('report_export_status', args=[export_id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('download_report_export', args=[export_id])).status_code, 404)
+
+        general = self.submit('general').json()
+        self.assertFalse(ReportExport.objects.get(pk=general['id']).show_financials)
+
+    def test_failed_export_is_reported_and_not_reused(self):
+        """Tests that a rendering failure marks the export failed and a new submit retries it."""
+        self.client.force_login(self.admin)
+        with patch('bookings.pdf_render.render_pdf', side_effect=pdf_render.PdfRenderError("broken")), \
+                self.assertLogs('flights.report_exports', 'ERROR'):
+            failed = self.submit().json()
+
+        status = self.client.get(failed['status_url']).json()
+        self.assertEqual(status['status'], 'Failed')
+        self.assertIn('error', status)
+        self.assertEqual(self.client.get(reverse('download_report_export', args=[failed['id']])).status_code, 404)
+        self.assertNotEqual(self.submit().json()['id'], failed['id'])
+
+    def test_expired_exports_are_deleted_with_their_files(self):
+        """Tests that purging removes the expired exports and their PDFs only."""
+        self.client.force_login(self.admin)
+        old = ReportExport.objects.get(pk=self.submit('general').json()['id'])
+        kept = ReportExport.objects.get(pk=self.submit('occupancy').json()['id'])
+        ReportExport.objects.filter(pk=old.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(report_exports.delete_expired_exports(), 1)
+        self.assertFalse(os.path.exists(old.file_path))
+        self.assertTrue(os.path.exists(kept.file_path))
+        self.assertEqual(list(ReportExport.objects.values_list('pk', flat=True)), [kept.pk])
+
+    def test_stalled_exports_are_failed_and_deleted(self):
+        """Tests that purging fails an export that stopped running and deletes it after the TTL."""
+        now = timezone.now()
+        stalled = ReportExport.objects.create(report_type='general', params_hash='stalled', status='Running')
+        running = ReportExport.objects.create(report_type='general', params_hash='running', status='Running')
+        ReportExport.objects.filter(pk=stalled.pk).update(
+            updated_at=now - report_exports.STALE_AFTER - timedelta(minutes=1))
+
+        self.assertEqual(report_exports.delete_expired_exports(now), 0)
+        stalled.refresh_from_db()
+        self.assertEqual((stalled.status, stalled.error), ('Failed', "Stopped making progress."))
+        running.refresh_from_db()
+        self.assertEqual(running.status, 'Running')
+
+        later = now + timedelta(minutes=settings.REPORT_EXPORT_TTL_MINUTES, seconds=1)
+        ReportExport.objects.filter(pk=running.pk).update(updated_at=later)
+        self.assertEqual(report_exports.delete_expired_exports(later), 1)
+        self.assertEqual(list(ReportExport.objects.values_list('pk', flat=True)), [running.pk])
+
+
+class DataExportTests(FlightTestCase):
+    """Tests for the streaming CSV and NDJSON exports."""
+
+    flight_number = None
+    username = 'traveller'
+
+    def setUp(self):
+        """Sets up two flights, bookings with tickets, a superuser and a staff member."""
+        self.admin = get_user_model().objects.create_user(username='admin', password='password', is_staff=True, is_superuser=True)
+        self.staff = get_user_model().objects.create_user(username='staff', password='password', is_staff=True)
+        super().setUp()
+        self.flights = self.create_flights(800, 2, economy_price=100, business_price=250, first_class_price=500)
+        self.sell(self.flights[0], 'Economy', 3)
+        self.sell(self.flights[1], 'First', 2)
+        rebuild_rollups()
+
+    def sell(self, flight, seat_class, seats):
+        """Creates a confirmed booking with one ticket per seat on a flight."""
+        booking = Booking.objects.create(flight=flight, passenger=self.profile, seat_class=seat_class,
+                                         number_of_passengers=seats, status='Confirmed')
+        Ticket.objects.bulk_create([
+            Ticket(booking=booking, seat_number=f'{20 + i}A', passenger_name='T', passport='P',
+                   passenger_dob='2000-01-01', nationality='N')
+            for i in range(seats)
+        ])
+
+    def export(self, dataset, export_format='csv'):
+        """Downloads an export and returns its content as text."""
+        response = self.client.get(reverse('export_data', args=[dataset]), {'format': export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_report_csv_matches_the_report_engine(self):
+        """Tests that the streamed report rows carry the figures of the reports page."""
+        self.client.force_login(self.admin)
+        rows = list(csv.DictReader(self.export('reports').splitlines()))
+
+        expected = build_flight_reports(Flight.objects.order_by('departure_datetime'))
+        self.assertEqual([row['flight_number'] for row in rows], ['SV800', 'SV801'])
+        for row, report in zip(rows, expected):
+            self.assertEqual(int(row['sold']), report['sold'])
+            self.assertEqual(int(row['capacity']), report['capacity'])
+            self.assertEqual(float(row['occupancy']), report['occupancy'])
+            self.assertEqual(float(row['revenue']), float(report['revenue']))
+
+    def test_bookings_ndjson_counts_tickets_and_amounts(self):
+        """Tests that each booking is one JSON line with its ticket count and amount."""
+        self.client.force_login(self.admin)
+        lines = [json.loads(line) for line in self.export('bookings', 'ndjson').splitlines()]
+
+        self.assertEqual([(line['flight_number'], line['tickets'], Decimal(line['amount'])) for line in lines],
+                         [('SV800', 3, Decimal('300')), ('SV801', 2, Decimal('1000'))])
+        self.assertEqual(lines[0]['passenger'], 'traveller')
+
+    def test_csv_cells_cannot_run_as_formulas(self):
+        """Tests that text starting like a formula is quoted in CSV but not in NDJSON."""
+        self.profile.user.username = '=HYPERLINK("http://example.com")'
+        self.profile.user.save()
+        self.client.force_login(self.admin)
+
+        rows = list(csv.DictReader(self.export('bookings').splitlines()))
+        self.assertEqual(rows[0]['passenger'], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(rows[0]['amount'], '300')
+        line = json.loads(self.export('bookings', 'ndjson').splitlines()[0])
+        self.assertEqual(line['passenger'], '=HYPERLINK("http://example.com")')
+
+    def test_staff_exports_leave_out_money(self):
+        """Tests that revenue and amounts are only exported for superusers."""
+        self.client.force_login(self.staff)
+
+        self.assertNotIn('revenue', self.export('reports').splitlines()[0])
+        self.assertNotIn('amount', self.export('bookings').splitlines()[0])
+        self.assertEqual(len(self.export('schedule').splitlines()), 3)
+
+    def test_header_is_sent_before_the_rows_are_read(self):
+        """Tests that the first block is the header alone and the rows follow in blocks."""
+        self.client.force_login(self.admin)
+        with patch.object(data_exports, 'FLUSH_BYTES', 1):
+            response = self.client.get(reverse('export_data', args=['schedule']))
+            with self.assertNumQueries(0):
+                header = next(iter(response.streaming_content))
+            blocks = list(response.streaming_content)
+
+        self.assertTrue(header.startswith(b'flight_number,'))
+        self.assertEqual(header.count(b'\n'), 1)
+        self.assertEqual(len(blocks), 2)
+
+    def test_export_requires_staff_and_a_known_format(self):
+        """Tests that passengers are turned away and unknown datasets or formats are rejected."""
+        self.client.force_login(self.profile.user)
+        self.assertEqual(self.client.get(reverse('export_data', args=['bookings'])).status_code, 302)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('export_data', args=['tickets'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export_data', args=['bookings']), {'format': 'xml'}).status_code, 400)
+
+
+@override_settings(PDF_RENDER_WORKERS=0)
+class ReportPdfTests(FlightTestCase):
+    """Tests for the report PDF rendered in parallel chunks."""
+
+    flight_number = None
+    username = None
+
+    def setUp(self):
+        """Sets up sixty flights on one route."""
+        super().setUp()
+        self.create_flights(1000, 60)
+
+    def test_ticket_is_not_queued_behind_a_long_report(self):
+        """Tests that report chunks leave a worker free, so a ticket renders while a report is rendering."""
+        started, release = threading.Event(), threading.Event()
+
+        def render_pdf(html):
+            if html.startswith('chunk'):
+                started.set()
+                release.wait(timeout=30)
+            return b'%PDF'
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(pdf_render.shutdown)
+        with override_settings(PDF_RENDER_WORKERS=2), \
+                patch.object(pdf_render, 'ProcessPoolExecutor', lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)), \
+                patch.object(pdf_render, 'render_pdf', side_effect=render_pdf):
+            with ThreadPoolExecutor(max_workers=1) as report:
+                parts = report.submit(pdf_render.render_many, [f'chunk {i}' for i in range(10)])
+                self.assertTrue(started.wait(timeout=5))
+                ticket = pdf_render.submit('ticket', os.path.join(directory.name, 'ticket.pdf'))
+                self.assertEqual(ticket.result(timeout=5), os.path.join(directory.name, 'ticket.pdf'))
+                self.assertFalse(parts.done())
+
+                release.set()
+                self.assertEqual(len(parts.result(timeout=30)), 10)
+
+    def test_chunks_end_on_page_boundaries(self):
+        """Tests that the first chunk leaves room for the summary and the others are whole pages."""
+        chunks = report_pdf.chunk_rows(list(range(1000)))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [282, 290, 290, 138])
+        self.assertEqual([row for chunk in chunks for row in chunk], list(range(1000)))
+        self.assertEqual(report_pdf.chunk_rows([]), [[]])
+
+    def test_chunked_report_reads_as_one_document(self):
+        """Tests that the joined PDF keeps the page layout, the summary and the page numbers of one report."""
+        flight_data = [export_row(report, 'general', True)
+                       for report in build_flight_reports(Flight.objects.order_by('departure_datetime'))]
+        with patch.object(report_pdf, 'PAGES_PER_CHUNK', 1), \
+                patch('bookings.pdf_render.render_pdf', wraps=pdf_render.render_pdf) as render:
+            content = report_pdf.render_report({
+                'report_type': 'general', 'generated_at': timezone.now(), 'flight_data': flight_data,
+                'total_flights': 60, 'total_tickets': 0, 'show_financials': True,
+            })
+
+        self.assertEqual(render.call_count, 3)
+        pages = [page.extract_text() for page in PdfReader(BytesIO(content)).pages]
+        self.assertEqual([text.count('SV1') for text in pages], [21, 29, 10])
+        self.assertEqual(['Detailed Breakdown' in text for text in pages], [True, False, False])
+        self.assertTrue(all('Flight No' in text for text in pages))
+        for number, text in enumerate(pages, start=1):
+            self.assertIn(f"Page {number} of 3", text)
@@ -14,9 +14,16 @@ urlpatterns = [
     path('reports/', views.admin_view_reports, name='admin_view_reports'),
     path('add-new-flight/', views.add_new_flight, name='add_new_flight'),
     path('generate-report/', views.generate_report_pdf, name='generate_report_pdf'),
+    path('report-exports/', views.submit_report_export, name='submit_report_export'),
+    path('report-exports/<int:export_id>', views.report_export_status, name='report_export_status'),
+    path('report-exports/<int:export_id>/download', views.download_report_export, name='download_report_export'),
+    path('data-exports/<str:dataset>', views.export_data, name='export_data'),
     path('view-flights/', views.view_flights, name='view_flights'),
     path('delete-flight/<str:flight_id>', views.delete_flight, name='delete_flight'),
     path('search-flight/', views.search_flight, name='search_flight'),
+    path('search-itineraries/', views.search_itineraries, name='search_itineraries'),
+    path('airport-autocomplete/', views.airport_autocomplete, name='airport_autocomplete'),
+    path('fare-calendar/', views.flight_fare_calendar, name='flight_fare_calendar'),
     path('flight-details/<str:flight_id>', views.flight_details, name='flight_details'),
     path('edit-flight/<str:flight_id>/', views.edit_flight, name='edit_flight'),
     path('flight-manifest/<str:flight_id>', views.flight_manifest, name='flight_manifest'),
@@ -1,17 +1,36 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template.loader import get_template
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
-from django.db.models.functions import Length
+from django.urls import reverse
+from django.utils import timezone
 from .forms import *
 from .models import *
-from datetime import datetime
+from .reports import build_flight_reports, export_row
+from . import data_exports, report_exports
+from .airport_index import DEFAULT_LIMIT as AIRPORT_SUGGESTIONS, airport_index
+from .fares import fare_calendar
+from .itineraries import find_itineraries
+from .page_versions import conditional_page
+from .pagination import InvalidCursor, keyset_page
+from .search_cache import cached_search_flights
+from .search_index import matching_flights
+from .seat_grid import seat_grid
+import calendar
+from datetime import date, datetime, timedelta
 from bookings.models import Ticket
+from bookings import ledger
 from xhtml2pdf import pisa
 
 
+MAX_FARE_WINDOW = 31
+MAX_PAGE_SIZE = 200
+
+
 
 
 
@@ -52,34 +71,69 @@ def add_new_flight(request):
     return render(request, 'flights/add_new_flight.html', context={'form': flight_form})
 
 @login_required
+@conditional_page()
 def view_flights(request):
-    """Displays a list of all flights, with optional search filtering.
+    """Displays one page of all flights, with optional search filtering.
+
+    Flights are paged with keyset cursors ('after' or 'before') in departure
+    order, FLIGHTS_PAGE_SIZE at a time unless 'page_size' asks for another
+    size. With 'format=json' the page is returned as JSON for infinite scroll.
+    A page the browser already has is answered with 304 until a flight changes
+    (see flights.page_versions).
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: The rendered 'view_flights' page.
+        HttpResponse: The rendered 'view_flights' page, or a JsonResponse.
     """
 
     search_query = request.GET.get('search', '')
-    
+    wants_json = request.GET.get('format') == 'json'
 
-    flights = Flight.objects.all().order_by('departure_datetime')
+    flights = Flight.objects.select_related('departure_airport', 'arrival_airport', 'aircraft')
 
 
     if search_query:
-        flights = flights.filter(
-            Q(flight_number__icontains=search_query) |
-            Q(departure_airport__airport_code__icontains=search_query) |
-            Q(departure_airport__city__icontains=search_query) |
-            Q(arrival_airport__airport_code__icontains=search_query) |
-            Q(arrival_airport__city__icontains=search_query) |
-            Q(aircraft__model__icontains=search_query)
-        )
+        flights = matching_flights(flights, search_query)
+
+    try:
+        page_size = min(max(int(request.GET.get('page_size', settings.FLIGHTS_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = settings.FLIGHTS_PAGE_SIZE
+
+    try:
+        page = keyset_page(flights, page_size, after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        if wants_json:
+            return JsonResponse({'error': "Invalid cursor."}, status=400)
+        page = keyset_page(flights, page_size)
+
+    if wants_json:
+        return JsonResponse({
+            'flights': [
+                {
+                    'flight_number': flight.flight_number,
+                    'departure_airport': flight.departure_airport.airport_code,
+                    'departure_city': flight.departure_airport.city,
+                    'arrival_airport': flight.arrival_airport.airport_code,
+                    'arrival_city': flight.arrival_airport.city,
+                    'departure_datetime': flight.departure_datetime.isoformat(),
+                    'arrival_datetime': flight.arrival_datetime.isoformat(),
+                    'aircraft': flight.aircraft.model,
+                    'economy_price': str(flight.economy_price),
+                    'status': flight.status,
+                }
+                for flight in page.flights
+            ],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        })
 
     context = {
-        'flights': flights,
+        'flights': page.flights,
+        'page': page,
+        'page_size': page_size,
         'search_query': search_query  
     }
     return render(request, 'flights/view_flights.html', context)
@@ -114,6 +168,9 @@ def delete_flight(request, flight_id):
 def search_flight(request):
     """Searches for flights based on criteria like origin, destination, date, class, and price.
 
+    Only flights whose cabin class still has seats for all 'adults' and
+    'children' are listed, each with the seats it has left.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
@@ -128,6 +185,12 @@ def search_flight(request):
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
 
+    try:
+        adults = max(int(request.GET.get('adults', 1)), 1)
+        children = max(int(request.GET.get('children', 0)), 0)
+    except ValueError:
+        adults, children = 1, 0
+
     flights = []
     departure_city = 'Unknown'
     destination_city = 'Unknown'
@@ -137,32 +200,12 @@ def search_flight(request):
             search_date_from = datetime.strptime(date_from_str, '%Y-%m-%d').date()
             search_date_to = datetime.strptime(date_to_str, '%Y-%m-%d').date()
             
-            flights = Flight.objects.filter(
-                departure_airport__airport_code=departure_code,
-                arrival_airport__airport_code=destination_code,
-                departure_datetime__date__range=[search_date_from, search_date_to]
+            flights = cached_search_flights(
+                departure_code, destination_code, search_date_from, search_date_to,
+                cabin_class=cabin_class, min_price=min_price, max_price=max_price, passengers=adults + children
             )
 
-            if cabin_class == 'first':
-                flights = flights.filter(aircraft__first_class__gt=0)
-            elif cabin_class == 'business':
-                flights = flights.filter(aircraft__business_class__gt=0)
-            else:
-                flights = flights.filter(aircraft__economy_class__gt=0)
-
-            if min_price:
-                if cabin_class == 'business': flights = flights.filter(business_price__gte=min_price)
-                elif cabin_class == 'first': flights = flights.filter(first_class_price__gte=min_price)
-                else: flights = flights.filter(economy_price__gte=min_price)
-            
-            if max_price:
-                if cabin_class == 'business': flights = flights.filter(business_price__lte=max_price)
-                elif cabin_class == 'first': flights = flights.filter(first_class_price__lte=max_price)
-                else: flights = flights.filter(economy_price__lte=max_price)
-            
-            flights = flights.order_by('departure_datetime')
-            
-            if flights.exists():
+            if flights:
                 departure_city = flights[0].departure_airport.city
                 destination_city = flights[0].arrival_airport.city
             else:
@@ -186,15 +229,140 @@ def search_flight(request):
         'destination_city': destination_city,
         'date_from': date_from_str, 
         'date_to': date_to_str, 
+        'adults': adults,
+        'children': children,
         'result_count': len(flights)
     }
     return render(request, 'flights/search_flight.html', context)
 
 
 @login_required
+def search_itineraries(request):
+    """Searches for direct and connecting itineraries with up to two stops.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: The rendered 'itinerary_results' page.
+    """
+    departure_code = request.GET.get('origin', '').strip().upper()
+    destination_code = request.GET.get('destination', '').strip().upper()
+    date_from_str = request.GET.get('date_from')
+    date_to_str = request.GET.get('date_to')
+    cabin_class = request.GET.get('cabin_class', 'economy').lower()
+    seat_class = cabin_class.capitalize() if cabin_class.capitalize() in Flight.PRICE_FIELDS else 'Economy'
+
+    try:
+        passengers = max(int(request.GET.get('passengers', 1)), 1)
+        max_stops = min(max(int(request.GET.get('max_stops', 2)), 0), 2)
+    except ValueError:
+        passengers, max_stops = 1, 2
+
+    itineraries = []
+    if departure_code and destination_code and date_from_str and date_to_str:
+        try:
+            itineraries = find_itineraries(
+                departure_code, destination_code,
+                datetime.strptime(date_from_str, '%Y-%m-%d').date(),
+                datetime.strptime(date_to_str, '%Y-%m-%d').date(),
+                seat_class=seat_class, passengers=passengers, max_stops=max_stops
+            )
+        except ValueError:
+            pass
+
+    context = {
+        'itineraries': itineraries,
+        'departure_code': departure_code,
+        'destination_code': destination_code,
+        'date_from': date_from_str,
+        'date_to': date_to_str,
+        'cabin_class': cabin_class,
+        'passengers': passengers,
+        'max_stops': max_stops,
+    }
+    return render(request, 'flights/itinerary_results.html', context)
+
+
+@login_required
+def flight_fare_calendar(request):
+    """Returns the lowest fare of a route for each day as JSON.
+
+    The days are either a calendar month ('month=YYYY-MM') or a window of
+    'window' days (at most MAX_FARE_WINDOW) on each side of 'date=YYYY-MM-DD'.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: The days with their lowest fare, or an error with status 400.
+    """
+    departure_code = request.GET.get('origin', '').strip().upper()
+    destination_code = request.GET.get('destination', '').strip().upper()
+    cabin_class = request.GET.get('cabin_class', 'economy').lower()
+    seat_class = cabin_class.capitalize()
+
+    if not departure_code or not destination_code:
+        return JsonResponse({'error': "origin and destination are required."}, status=400)
+    if seat_class not in Flight.PRICE_FIELDS:
+        return JsonResponse({'error': "Invalid cabin class."}, status=400)
+
+    try:
+        if request.GET.get('month'):
+            first_day = datetime.strptime(request.GET['month'], '%Y-%m').date()
+            date_from = first_day
+            date_to = first_day.replace(day=calendar.monthrange(first_day.year, first_day.month)[1])
+        else:
+            center = datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+            window = min(max(int(request.GET.get('window', 3)), 0), MAX_FARE_WINDOW)
+            date_from, date_to = center - timedelta(days=window), center + timedelta(days=window)
+        if date_from == date.min or date_to == date.max:
+            raise OverflowError("date value out of range")
+    except (ValueError, OverflowError):
+        return JsonResponse({'error': "Give either month=YYYY-MM or date=YYYY-MM-DD with a window."}, status=400)
+
+    days = fare_calendar(departure_code, destination_code, seat_class, date_from, date_to)
+    return JsonResponse({
+        'origin': departure_code,
+        'destination': destination_code,
+        'cabin_class': cabin_class,
+        'days': [
+            {
+                'date': day['date'].isoformat(),
+                'lowest_fare': str(day['lowest_fare']) if day['lowest_fare'] is not None else None,
+                'flights': day['flights'],
+            }
+            for day in days
+        ],
+    })
+
+
+@login_required
+def airport_autocomplete(request):
+    """Returns the airports whose code, city, name or country starts with a query as JSON.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: The best matching airports for 'q', at most 'limit' of them.
+    """
+    try:
+        limit = int(request.GET.get('limit', AIRPORT_SUGGESTIONS))
+    except ValueError:
+        limit = AIRPORT_SUGGESTIONS
+    airports = airport_index.lookup(request.GET.get('q', ''), limit)
+    return JsonResponse({'airports': airports})
+
+
+@login_required
+@conditional_page()
 def flight_details(request, flight_id):
     """Displays details for a specific flight.
 
+    A page the browser already has is answered with 304 until a flight changes
+    (see flights.page_versions).
+
     Args:
         request (HttpRequest): The HTTP request object.
         flight_id: The unique identifier for the flight.
@@ -238,7 +406,9 @@ def edit_flight(request, flight_id):
     if request.method == 'POST':
         form = FlightForm(request.POST, instance=flight)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                flight = form.save()
+                ledger.flight_updated(flight)
             messages.success(request, f"Flight {flight.flight_number} updated successfully!")
             return redirect('view_flights') 
         else:
@@ -253,7 +423,8 @@ def edit_flight(request, flight_id):
 def flight_manifest(request, flight_id):
     """Displays the passenger manifest for a specific flight.
 
-    Allows staff to search and sort the passenger list.
+    Allows staff to search and sort the passenger list. Sorting by seat
+    follows the seat grid of the aircraft, front to back and left to right.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -285,15 +456,15 @@ def flight_manifest(request, flight_id):
 
 
     sort_param = request.GET.get('sort', 'seat')
+    grid = seat_grid(flight.aircraft)
 
     if sort_param == 'name':
-        tickets = tickets.order_by('passenger_name')
+        tickets = list(tickets.order_by('passenger_name'))
     else:
+        tickets = sorted(tickets, key=lambda ticket: grid.sort_key(ticket.seat_number))
 
-        tickets = tickets.annotate(seat_len=Length('seat_number')).order_by('seat_len', 'seat_number')
-
-    total_seats = flight.aircraft.economy_class + flight.aircraft.business_class + flight.aircraft.first_class
-    occupied_seats = tickets.count()
+    total_seats = grid.capacity()
+    occupied_seats = len(tickets)
 
     context = {
         'flight': flight,
@@ -331,13 +502,16 @@ def remove_passenger(request, ticket_id):
     if request.method == 'POST':
         booking = ticket.booking
 
-        if booking.tickets.count() <= 1:
-            booking.status = 'Cancelled'
-            booking.save()
-            ticket.delete()
-        else:
+        with transaction.atomic():
+            remaining_count = booking.tickets.count()
+            ledger.tickets_removed(booking, [ticket.seat_number])
             ticket.delete()
 
+            if remaining_count <= 1:
+                ledger.status_changed(booking, 'Cancelled')
+                booking.status = 'Cancelled'
+                booking.save()
+
         messages.success(request, f"Passenger {ticket.passenger_name} removed successfully.")
     
     return redirect('flight_manifest', flight_id=flight_id)
@@ -381,42 +555,10 @@ def admin_view_reports(request):
 
     show_financials = request.user.is_superuser 
 
-    flights = Flight.objects.all().select_related('aircraft', 'departure_airport', 'arrival_airport')
-    all_valid_tickets = Ticket.objects.exclude(booking__status='Cancelled').select_related('booking', 'booking__flight')
-
-    total_tickets_sold = all_valid_tickets.count()
-    total_flights_count = flights.count()
-    
-    flight_reports = []
+    flight_reports = build_flight_reports(include_revenue=show_financials)
 
-    for flight in flights:
-        flight_tickets = all_valid_tickets.filter(booking__flight=flight)
-        
-        total_sold = flight_tickets.count()
-        total_capacity = flight.aircraft.economy_class + flight.aircraft.business_class + flight.aircraft.first_class
-        
-        occupancy_rate = 0
-        if total_capacity > 0:
-            occupancy_rate = round((total_sold / total_capacity) * 100, 1)
-
-        flight_revenue = 0
-        if show_financials:
-            eco_sold = flight_tickets.filter(booking__seat_class='Economy').count()
-            bus_sold = flight_tickets.filter(booking__seat_class='Business').count()
-            first_sold = flight_tickets.filter(booking__seat_class='First').count()
-            
-            flight_revenue = (eco_sold * flight.economy_price) + \
-                             (bus_sold * flight.business_price) + \
-                             (first_sold * flight.first_class_price)
-
-        flight_reports.append({
-            'flight_obj': flight,
-            'revenue': flight_revenue,
-            'sold': total_sold,
-            'capacity': total_capacity,
-            'occupancy': occupancy_rate,
-            'status': flight.status
-        })
+    total_tickets_sold = sum(report['sold'] for report in flight_reports)
+    total_flights_count = len(flight_reports)
 
     if show_financials:
         flight_reports.sort(key=lambda x: x['revenue'], reverse=True)
@@ -453,60 +595,162 @@ def generate_report_pdf(request):
         messages.error(request, "You are not authorized to export financial reports.")
         return redirect('admin_view_reports')
 
-    flights = Flight.objects.all().select_related('aircraft', 'departure_airport', 'arrival_airport').order_by('departure_datetime')
-    all_valid_tickets = Ticket.objects.exclude(booking__status='Cancelled').select_related('booking', 'booking__flight')
-    
-    flight_data = []
-    total_tickets = all_valid_tickets.count()
     show_financials = request.user.is_superuser
+    flights = Flight.objects.order_by('departure_datetime')
 
-    for flight in flights:
-        tickets = all_valid_tickets.filter(booking__flight=flight)
-        
-        eco = tickets.filter(booking__seat_class='Economy').count()
-        bus = tickets.filter(booking__seat_class='Business').count()
-        first = tickets.filter(booking__seat_class='First').count()
-        
-        revenue = (eco * flight.economy_price) + (bus * flight.business_price) + (first * flight.first_class_price)
-        
-        total_sold = eco + bus + first
-        capacity = flight.aircraft.economy_class + flight.aircraft.business_class + flight.aircraft.first_class
-        occupancy = round((total_sold / capacity) * 100, 1) if capacity > 0 else 0
-
-        if report_type == 'financial':
-            flight_data.append({
-                'flight': flight,
-                'revenue': revenue,
-                'eco_sold': eco,
-                'bus_sold': bus,
-                'first_sold': first
-            })
-            flight_data.append({
-                'flight': flight,
-                'capacity': capacity,
-                'sold': total_sold,
-                'occupancy': occupancy
-            })
-        else: 
-            data_row = {
-                'flight': flight,
-                'sold': total_sold,
-                'occupancy': occupancy,
-                'status': flight.status
-            }
-            if show_financials:
-                data_row['revenue'] = revenue
-            
-            flight_data.append(data_row)
+    flight_data = [export_row(report, report_type, show_financials) for report in build_flight_reports(flights)]
 
     context = {
         'report_type': report_type,
         'generated_at': datetime.now(),
         'flight_data': flight_data,
-        'total_flights': flights.count(),
-        'total_tickets': total_tickets,
+        'total_flights': len(flight_data),
+        'total_tickets': sum(row['sold'] for row in flight_data),
         'user': request.user,
         'show_financials': show_financials
     }
 
-    return render_to_pdf('flights/report_pdf.html', context)
\ No newline at end of file
+    return render_to_pdf('flights/report_pdf.html', context)
+
+
+def _export_json(export):
+    """Describes a report export for the export API."""
+    data = {
+        'id': export.pk,
+        'report_type': export.report_type,
+        'status': export.status,
+        'progress': export.progress,
+        'processed': export.processed,
+        'total': export.total,
+        'status_url': reverse('report_export_status', args=[export.pk]),
+    }
+    if export.status == 'Done':
+        data['download_url'] = reverse('download_report_export', args=[export.pk])
+        data['expires_at'] = export.expires_at.isoformat()
+    if export.status == 'Failed':
+        data['error'] = "The report could not be generated. Please try again."
+    return data
+
+
+def _visible_export(request, export_id):
+    """Returns an export the admin may see.
+
+    Raises:
+        Http404: If there is no such export, or it includes revenue and the
+            user is not a superuser.
+    """
+    export = get_object_or_404(ReportExport, pk=export_id)
+    if export.show_financials and not request.user.is_superuser:
+        raise Http404("No such report export.")
+    return export
+
+
+@login_required
+def submit_report_export(request):
+    """Starts a PDF export of the flight reports in the background.
+
+    An export with the same parameters that is running or still kept is
+    returned instead of starting another one.
+
+    Args:
+        request (HttpRequest): The HTTP request object, with a 'report_type'.
+
+    Returns:
+        JsonResponse: The export, with status 202 while it is being built
+            and 200 once it is done, or an 'error' with status 400, 403 or 405.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': "Access denied."}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': "Use POST to export a report."}, status=405)
+
+    report_type = request.POST.get('report_type', 'general')
+    if report_type not in dict(ReportExport.REPORT_TYPE_CHOICES):
+        return JsonResponse({'error': "Invalid report type."}, status=400)
+    if report_type == 'financial' and not request.user.is_superuser:
+        return JsonResponse({'error': "You are not authorized to export financial reports."}, status=403)
+
+    export, _ = report_exports.submit(report_type, request.user)
+    response = JsonResponse(_export_json(export), status=200 if export.status == 'Done' else 202)
+    response['Location'] = reverse('report_export_status', args=[export.pk])
+    return response
+
+
+@login_required
+def report_export_status(request, export_id):
+    """Reports the progress of a report export.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        export_id (int): The export.
+
+    Returns:
+        JsonResponse: The export, or an 'error' with status 403.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': "Access denied."}, status=403)
+    return JsonResponse(_export_json(_visible_export(request, export_id)))
+
+
+@login_required
+def download_report_export(request, export_id):
+    """Downloads the PDF of a finished report export.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        export_id (int): The export.
+
+    Returns:
+        FileResponse: The PDF as an attachment.
+
+    Raises:
+        Http404: If the export is not done, has expired or its file is gone.
+    """
+    if not request.user.is_staff:
+        messages.error(request, "Access denied.")
+        return redirect('passenger_dashboard')
+
+    export = _visible_export(request, export_id)
+    if export.status != 'Done' or export.expires_at <= timezone.now():
+        raise Http404("The report is not available.")
+    try:
+        pdf = open(export.file_path, 'rb')
+    except FileNotFoundError:
+        raise Http404("The report is not available.")
+    return FileResponse(pdf, as_attachment=True, filename=f"flight_report_{export.report_type}.pdf",
+                        content_type='application/pdf')
+
+
+@login_required
+def export_data(request, dataset):
+    """Streams the report rows, the schedule or the bookings as CSV or NDJSON.
+
+    Revenue and booking amounts are included for superusers only.
+
+    Args:
+        request (HttpRequest): The HTTP request object, with an optional
+            'format' of 'csv' (the default) or 'ndjson'.
+        dataset (str): 'reports', 'schedule' or 'bookings'.
+
+    Returns:
+        StreamingHttpResponse: The export as an attachment, or an error with status 400.
+
+    Raises:
+        Http404: If there is no such dataset.
+    """
+    if not request.user.is_staff:
+        messages.error(request, "Access denied.")
+        return redirect('passenger_dashboard')
+
+    rows_for = data_exports.DATASETS.get(dataset)
+    if rows_for is None:
+        raise Http404("No such export.")
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in data_exports.FORMATS:
+        return HttpResponse("Unknown export format.", status=400, content_type='text/plain')
+
+    columns, rows = rows_for(show_financials=request.user.is_superuser)
+    response = StreamingHttpResponse(data_exports.stream(columns, rows, export_format),
+                                     content_type=data_exports.FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{export_format}"'
+    return response
@@ -15,6 +15,7 @@ from django.contrib.messages import constants as messages
 
 import environ
 import os
+import tempfile
 
 
 env = environ.Env(
@@ -96,6 +97,52 @@ DATABASES = {
     )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Take SQLite's write lock when a transaction starts, so concurrent bookings
+    # queue for it instead of failing with "database is locked".
+    DATABASES['default'].setdefault('OPTIONS', {}).setdefault('transaction_mode', 'IMMEDIATE')
+    DATABASES['default']['OPTIONS'].setdefault('timeout', 20)
+
+# Caches flight search results and the version stamps of flight pages. locmem
+# is per process, so set CACHE_URL to a shared cache (e.g.
+# redis://127.0.0.1:6379/1) when serving from several processes; otherwise
+# they answer 304 with stale pages until their stamps lapse.
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://flightsystem'),
+}
+
+# Flights per page of the flight management list
+FLIGHTS_PAGE_SIZE = env.int('FLIGHTS_PAGE_SIZE', default=50)
+
+# How long a pending booking holds its seats before it expires
+BOOKING_HOLD_MINUTES = env.int('BOOKING_HOLD_MINUTES', default=5)
+
+# Delivers live seat claims and releases to seat selection pages. Each open
+# page holds a connection, so only enable this when serving with ASGI. The
+# default broker only reaches pages served by the same process.
+SEAT_EVENTS_ENABLED = env.bool('SEAT_EVENTS_ENABLED', default=False)
+SEAT_EVENTS_BACKEND = env('SEAT_EVENTS_BACKEND', default='bookings.seat_events.InProcessBroker')
+
+# E-ticket and report PDFs are rendered by PDF_RENDER_WORKERS worker processes
+# (0 renders them in the calling thread). Report chunks use at most
+# PDF_RENDER_WORKERS - 1 of them at a time, so e-tickets do not wait behind a
+# large report. E-tickets are kept in ETICKET_DIR until the booking changes.
+PDF_RENDER_WORKERS = env.int('PDF_RENDER_WORKERS', default=2)
+ETICKET_DIR = env('ETICKET_DIR', default=str(BASE_DIR / 'var' / 'etickets'))
+
+# Report PDF exports are built by REPORT_EXPORT_WORKERS background threads (0
+# builds them in the request thread), rendered by the PDF render workers and
+# kept in REPORT_EXPORT_DIR for REPORT_EXPORT_TTL_MINUTES.
+REPORT_EXPORT_WORKERS = env.int('REPORT_EXPORT_WORKERS', default=2)
+REPORT_EXPORT_DIR = env('REPORT_EXPORT_DIR', default=str(BASE_DIR / 'var' / 'reports'))
+REPORT_EXPORT_TTL_MINUTES = env.int('REPORT_EXPORT_TTL_MINUTES', default=60)
+
+# Web processes start the background scheduler; the first one to lock
+# SCHEDULER_LOCK_FILE runs the jobs. Turn this off when a separate
+# `manage.py run_scheduler` process runs them instead.
+SCHEDULER_AUTOSTART = env.bool('SCHEDULER_AUTOSTART', default=True)
+SCHEDULER_LOCK_FILE = env('SCHEDULER_LOCK_FILE', default=os.path.join(tempfile.gettempdir(), 'flightsystem-scheduler.lock'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -149,4 +149,26 @@ class PaymentTests(TestCase):
         
         self.assertEqual(response.status_code, 302)
 
-        self.assertEqual(Payment.objects.filter(booking=self.booking).count(), 1)
\ No newline at end of file
+        self.assertEqual(Payment.objects.filter(booking=self.booking).count(), 1)
+
+    def test_resubmitted_payment_is_replayed(self):
+        """Tests that a payment form posted twice with the same key is paid once and replayed."""
+        url = reverse('process_payment', args=[self.booking.booking_id])
+        key = self.client.get(url).context['idempotency_key']
+
+        first = self.client.post(url, {'idempotency_key': key})
+        second = self.client.post(url, {'idempotency_key': key})
+
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(Payment.objects.filter(booking=self.booking).count(), 1)
+
+    def test_concurrent_payment_does_not_fail(self):
+        """Tests that a payment racing an earlier one redirects instead of raising an error."""
+        Payment.objects.create(booking=self.booking, payment_method='Cash')
+        url = reverse('process_payment', args=[self.booking.booking_id])
+
+        response = self.client.post(url)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Payment.objects.filter(booking=self.booking).count(), 1)
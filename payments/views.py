@@ -2,18 +2,25 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from .models import *
 from bookings.models import Booking
+from bookings import etickets, idempotency, ledger
 
 
 
 
 
 @login_required
+@idempotency.idempotent('process_payment')
 def process_payment(request, booking_id):  
     """Handles the payment processing for a booking.
 
-    Creates a Payment record and updates the booking status to 'Confirmed'.
+    Creates a Payment record, updates the booking status to 'Confirmed' and
+    starts rendering the e-ticket in the background.
+    A form submitted twice with the same idempotency key is paid once (see
+    bookings.idempotency); a concurrent second payment without one finds the
+    booking paid instead of failing.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -32,15 +39,28 @@ def process_payment(request, booking_id):
 
     if request.method == 'POST':
         
-        Payment.objects.create(
-            booking=booking,
-            payment_method='Credit Card',
-        )
-        
-        booking.status = 'Confirmed'
-        booking.save()
+        try:
+            with transaction.atomic():
+                Payment.objects.create(
+                    booking=booking,
+                    payment_method='Credit Card',
+                )
+                
+                ledger.status_changed(booking, 'Confirmed')
+                booking.status = 'Confirmed'
+                booking.save()
+                etickets.booking_confirmed(booking)
+        except IntegrityError:
+            messages.info(request, "This booking is already confirmed.")
+            return redirect('booking_details', booking_id=booking.booking_id)
+        except (ledger.SeatsUnavailable, ledger.SeatTaken, ledger.InvalidSeats):
+            messages.error(request, "Sorry, the seats of this booking are no longer available.")
+            return redirect('booking_details', booking_id=booking.booking_id)
         
         messages.success(request, "Payment successful! Your flight is booked.")
         return redirect('booking_details', booking_id=booking.booking_id)
 
-    return render(request, 'payments/process_payment.html', {'booking': booking})
\ No newline at end of file
+    return render(request, 'payments/process_payment.html', {
+        'booking': booking,
+        'idempotency_key': idempotency.new_key(),
+    })
\ No newline at end of file
@@ -253,13 +253,14 @@ class PassengerDashboardTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'users/passenger_dashboard.html')
     
-    def test_dashboard_context_contains_airports_and_bookings(self):
-        """Test that dashboard context has airports and bookings data."""
+    def test_dashboard_context_contains_bookings_but_not_airports(self):
+        """Test that dashboard context has bookings and leaves airports to the autocomplete endpoint."""
         self.client.login(username='testpassenger', password='testpass123')
         response = self.client.get(self.dashboard_url)
         
-        self.assertIn('airports', response.context)
+        self.assertNotIn('airports', response.context)
         self.assertIn('upcoming_bookings', response.context)
+        self.assertContains(response, reverse('airport_autocomplete'))
 
 
 class AdminDashboardTests(TestCase):
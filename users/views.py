@@ -11,7 +11,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from .forms import *
 from .models import PassengerProfile, Admin
-from flights.models import Airport, Flight
+from flights.models import Flight
 from django.utils import timezone
 from datetime import timedelta
 from bookings.models import Booking
@@ -115,14 +115,15 @@ def user_logout(request: HttpRequest) -> HttpResponse:
 def passenger_dashboard(request):
     """Renders the passenger dashboard with flight search and upcoming bookings.
 
+    The airports of the search form are suggested by the airport_autocomplete
+    endpoint as the passenger types, rather than listed in the page.
+
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
         HttpResponse: The rendered passenger dashboard.
     """
-    
-    airports = Airport.objects.all().order_by('city')
 
     now = timezone.now()
     
@@ -134,7 +135,6 @@ def passenger_dashboard(request):
     ).order_by('flight__departure_datetime')[:3] 
 
     context = {
-        'airports': airports,
         'upcoming_bookings': upcoming_bookings
     }
 